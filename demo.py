@@ -4,8 +4,18 @@ from sentence_transformers import SentenceTransformer
 from qdrant_client import QdrantClient
 from openai import OpenAI
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from common.conversation import Conversation
+from common.llm_cache import load_cache
+from common.llm_client import cached_chat_completion
+from common.metrics import RequestTrace, start_metrics_server
+from common.projection import load_serving_projection
+from common.qdrant_collections import ServingTargets
+from retrieval_and_generation.retrieval import retrieve
+
 # Load environment variables
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -24,67 +34,152 @@ def initialize_models():
         api_key=os.getenv("QDRANT_API_KEY", "")
     )
     
-    # Initialize OpenAI client
-    openai_client = OpenAI(
-        api_key=os.getenv("OPENAI_API_KEY")
-    )
+    # Initialize OpenAI client; replay mode answers from the LLM cache only and needs no API key
+    openai_client = None
+    if os.getenv("LLM_CACHE_MODE", "off") != "replay":
+        openai_client = OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY")
+        )
     
     return retrieval_model, qdrant_client, openai_client
 
+@st.cache_resource
+def initialize_llm_cache():
+    # Shared LLM response cache (LLM_CACHE_MODE=off|readwrite|replay; off by default)
+    return load_cache()
+
+@st.cache_resource
+def initialize_metrics_server():
+    # Expose /metrics when RAG_METRICS_PORT is set (once per Streamlit process)
+    return start_metrics_server()
+
+@st.cache_resource
+def initialize_serving_targets(_qdrant_client):
+    # Serving collection or per-source shards, with their chunk stores (same settings as answer_generator.py)
+    return ServingTargets.from_env(_qdrant_client)
+
+@st.cache_resource
+def initialize_projection():
+    # PCA projection for --reduce-dim collections (VECTOR_PROJECTION), None otherwise
+    return load_serving_projection()
+
 # RAG functions
-def get_relevant_chunks(query: str, retrieval_model, qdrant_client, top_k: int = 3):
-    """Retrieve relevant chunks from Qdrant."""
-    query_embedding = retrieval_model.encode(query)
-    
-    search_results = qdrant_client.search(
-        collection_name="articles",
-        query_vector=query_embedding.tolist(),
-        limit=top_k,
-        with_payload=True
+def get_relevant_chunks(query: str, retrieval_model, qdrant_client, top_k: int = 3, trace: RequestTrace = None,
+                        query_embedding=None):
+    """
+    Retrieve relevant chunks through retrieval.retrieve(), from the same collection, shards and
+    chunk stores as answer_generator.py, with their vectors as "embedding" for the conversation cache.
+    Reduced-vector collections are searched through the projection; the cache keeps the full vectors.
+    """
+    trace = trace if trace is not None else RequestTrace(query)
+    collection_name, shards, chunk_store = initialize_serving_targets(qdrant_client).resolve(query, top_k)
+    if shards is not None and not shards:
+        return []
+
+    timings = {}
+    retrieved_chunks = retrieve(
+        query,
+        retrieval_model,
+        None,  # no cross-encoder in the demo: the top_k search hits are used as they are
+        qdrant_client,
+        collection_name=collection_name,
+        top_k=top_k,
+        rerank_top_k=top_k,
+        timings=timings,
+        chunk_store=chunk_store,
+        shards=shards,
+        projection=initialize_projection(),
+        query_embedding=query_embedding,
+        with_embeddings=True
     )
-    
-    retrieved_chunks = []
-    for hit in search_results:
-        payload = hit.payload if hit.payload else {}
-        chunk_text = payload.get("text", "")
-        if chunk_text:
-            retrieved_chunks.append({
-                "text": chunk_text,
-                "title": payload.get("title", ""),
-                "url": payload.get("url", ""),
-                "score": hit.score
-            })
+    trace.observe_retrieval(timings)
     return retrieved_chunks
 
-def generate_answer(query: str, retrieved_chunks: list, openai_client):
-    """Generate answer using OpenAI."""
+def rewrite_query(conversation: Conversation, query: str, openai_client, trace: RequestTrace = None) -> str:
+    """Rewrite a follow-up into a standalone question; falls back to prefixing the previous question."""
+    trace = trace if trace is not None else RequestTrace(query)
+    llm_cache = initialize_llm_cache()
+    try:
+        with trace.stage("rewrite"):
+            response = cached_chat_completion(
+                openai_client,
+                model=OPENAI_MODEL_NAME,
+                messages=conversation.rewrite_messages(query),
+                temperature=0.0,
+                max_tokens=100,
+                cache=llm_cache
+            )
+        rewritten = response.choices[0].message.content.strip()
+        return rewritten or conversation.fallback_rewrite(query)
+    except Exception as e:
+        print(f"Error rewriting follow-up question: {e}")
+        return conversation.fallback_rewrite(query)
+
+def generate_answer(query: str, retrieved_chunks: list, openai_client, trace: RequestTrace = None,
+                    history: list = None):
+    """Generate answer using OpenAI; `history` holds earlier chat messages for follow-ups."""
     context = "\n\n---\n\n".join([chunk["text"] for chunk in retrieved_chunks])
     
     system_prompt = "Bạn là một trợ lý AI chuyên về du lịch. Hãy trả lời dựa trên ngữ cảnh."
     user_message_content = f"""Ngữ cảnh:{context} Câu hỏi: {query}"""
     
+    trace = trace if trace is not None else RequestTrace(query)
+    llm_cache = initialize_llm_cache()
     try:
-        response = openai_client.chat.completions.create(
-            model=OPENAI_MODEL_NAME,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message_content},
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
+        with trace.stage("llm"):
+            response = cached_chat_completion(
+                openai_client,
+                model=OPENAI_MODEL_NAME,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    *(history or []),
+                    {"role": "user", "content": user_message_content},
+                ],
+                temperature=0.7,
+                max_tokens=500,
+                cache=llm_cache
+            )
+        trace.observe_llm_response(response, llm_cache)
         return response.choices[0].message.content.strip()
     except Exception as e:
         st.error(f"Error calling OpenAI API: {e}")
         return "Xin lỗi, đã có lỗi xảy ra khi cố gắng tạo câu trả lời."
 
-def get_response(query: str, retrieval_model, qdrant_client, openai_client):
-    """Get response from RAG system."""
-    retrieved_chunks = get_relevant_chunks(query, retrieval_model, qdrant_client)
-    if not retrieved_chunks:
-        return "Xin lỗi, tôi không tìm thấy thông tin liên quan đến câu hỏi của bạn."
-    
-    return generate_answer(query, retrieved_chunks, openai_client)
+def get_response(query: str, retrieval_model, qdrant_client, openai_client, conversation: Conversation = None):
+    """
+    Get response from RAG system. With a conversation, follow-ups covered by the
+    previous turn's chunks are answered from them without a search, and other
+    follow-ups are rewritten into standalone questions before retrieval.
+    """
+    trace = RequestTrace(query)
+    conversation = conversation if conversation is not None else Conversation()
+    try:
+        with trace.stage("encode"):
+            query_embedding = retrieval_model.encode(query)
+        route = conversation.route(query, query_embedding)
+        trace.record["route"] = route
+
+        history = []
+        if route == "reuse":
+            retrieved_chunks = conversation.cached_chunks(query_embedding)
+            history = conversation.history_messages()
+        else:
+            if route == "rewrite":
+                query = rewrite_query(conversation, query, openai_client, trace=trace)
+                trace.record["rewritten_query"] = query
+                with trace.stage("encode_rewrite"):
+                    query_embedding = retrieval_model.encode(query)
+            retrieved_chunks = get_relevant_chunks(query, retrieval_model, qdrant_client, trace=trace,
+                                                   query_embedding=query_embedding)
+            conversation.remember_retrieval(query, query_embedding, retrieved_chunks)
+        if not retrieved_chunks:
+            return "Xin lỗi, tôi không tìm thấy thông tin liên quan đến câu hỏi của bạn."
+        
+        answer = generate_answer(query, retrieved_chunks, openai_client, trace=trace, history=history)
+        conversation.remember_answer(query, answer)
+        return answer
+    finally:
+        trace.finish()
 
 # Streamlit UI
 def main():
@@ -104,6 +199,7 @@ def main():
     # Initialize models
     try:
         retrieval_model, qdrant_client, openai_client = initialize_models()
+        initialize_metrics_server()
     except Exception as e:
         st.error(f"Error initializing models: {e}")
         st.stop()
@@ -111,6 +207,9 @@ def main():
     # Initialize session state for chat history
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    # Previous turn's retrieval, reused or rewritten against for follow-up questions
+    if "conversation" not in st.session_state:
+        st.session_state.conversation = Conversation()
 
     # Display chat history
     for message in st.session_state.messages:
@@ -132,7 +231,8 @@ def main():
             # Simulate thinking
             with st.spinner("Thinking..."):
                 # Get response from RAG system
-                response = get_response(prompt, retrieval_model, qdrant_client, openai_client)
+                response = get_response(prompt, retrieval_model, qdrant_client, openai_client,
+                                        st.session_state.conversation)
                 
                 # Simulate typing effect
                 for chunk in response.split():
@@ -160,6 +260,9 @@ def main():
         2. Relevant information is retrieved from the database
         3. The context and question are sent to OpenAI
         4. A response is generated based on the retrieved information
+
+        Follow-up questions reuse the previous answer's sources when they cover
+        the question, and are otherwise rewritten into a standalone question first.
         """)
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+"""
+Compact local store for chunk text and article metadata.
+
+Lets the Qdrant collection keep only point IDs and filterable fields while
+chunk text is served locally. A store directory holds:
+
+    articles.json   article metadata (title, url, time, ...), once per article
+    chunks.npy      one row per chunk, indexed by point ID (memory-mapped)
+    blocks.bin      chunk texts, concatenated into zlib-compressed blocks
+    blocks.npy      byte offsets of each block in blocks.bin
+
+Point IDs are the row numbers 0..N-1, so lookup is O(1): one row read, one
+(cached) block decompression and a slice. Chunks of an article are written
+contiguously, so an article's chunks are a single ID range.
+"""
+import json
+import mmap
+import os
+import threading
+import zlib
+from collections import OrderedDict
+import numpy as np
+
+CHUNK_DTYPE = np.dtype([
+    ("article", np.int32),      # index into articles.json
+    ("chunk_index", np.int32),  # position of the chunk within its article
+    ("block", np.int32),        # compressed block holding the text
+    ("offset", np.uint32),      # byte offset inside the decompressed block
+    ("length", np.uint32),      # byte length of the UTF-8 text
+])
+
+
+class ChunkStoreWriter:
+    """Append articles and chunks, then close() to write the store directory"""
+
+    def __init__(self, path: str, block_size: int = 64 * 1024, compression_level: int = 6):
+        self.path = path
+        self.block_size = block_size
+        self.compression_level = compression_level
+        os.makedirs(path, exist_ok=True)
+        self.articles = []
+        self.rows = []
+        self.block_offsets = [0]
+        self._block = bytearray()
+        self._blocks_file = open(os.path.join(path, "blocks.bin"), "wb")
+
+    def add_article(self, metadata: dict) -> int:
+        """Register an article's metadata; returns its article index"""
+        self.articles.append(metadata)
+        return len(self.articles) - 1
+
+    def add_chunk(self, article: int, chunk_index: int, text: str) -> int:
+        """Store one chunk; returns its point ID"""
+        data = text.encode("utf-8")
+        self.rows.append((article, chunk_index, len(self.block_offsets) - 1, len(self._block), len(data)))
+        self._block.extend(data)
+        if len(self._block) >= self.block_size:
+            self._flush_block()
+        return len(self.rows) - 1
+
+    def _flush_block(self):
+        if not self._block:
+            return
+        compressed = zlib.compress(bytes(self._block), self.compression_level)
+        self._blocks_file.write(compressed)
+        self.block_offsets.append(self.block_offsets[-1] + len(compressed))
+        self._block = bytearray()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def close(self):
+        self._flush_block()
+        self._blocks_file.close()
+        np.save(os.path.join(self.path, "chunks.npy"), np.array(self.rows, dtype=CHUNK_DTYPE))
+        np.save(os.path.join(self.path, "blocks.npy"), np.array(self.block_offsets, dtype=np.int64))
+        with open(os.path.join(self.path, "articles.json"), "w", encoding="utf-8") as f:
+            json.dump(self.articles, f, ensure_ascii=False)
+
+
+class ChunkStore:
+    """Read-only, memory-mapped view of a store directory"""
+
+    def __init__(self, path: str, cache_blocks: int = 256):
+        self.path = path
+        self.chunks = np.load(os.path.join(path, "chunks.npy"), mmap_mode="r")
+        self.block_offsets = np.load(os.path.join(path, "blocks.npy"))
+        with open(os.path.join(path, "articles.json"), "r", encoding="utf-8") as f:
+            self.articles = json.load(f)
+        self._blocks_file = open(os.path.join(path, "blocks.bin"), "rb")
+        self._blocks = mmap.mmap(self._blocks_file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if os.path.getsize(os.path.join(path, "blocks.bin")) else b""
+        self._cache = OrderedDict()
+        self._cache_blocks = cache_blocks
+        self._lock = threading.Lock()
+        # article index -> first point ID; the last entry is the total chunk count
+        self.article_starts = np.searchsorted(self.chunks["article"], np.arange(len(self.articles) + 1))
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def _block(self, block: int) -> bytes:
+        with self._lock:
+            data = self._cache.get(block)
+            if data is not None:
+                self._cache.move_to_end(block)
+                return data
+        start, end = self.block_offsets[block], self.block_offsets[block + 1]
+        data = zlib.decompress(self._blocks[start:end])
+        with self._lock:
+            self._cache[block] = data
+            if len(self._cache) > self._cache_blocks:
+                self._cache.popitem(last=False)
+        return data
+
+    def text(self, point_id: int) -> str:
+        row = self.chunks[point_id]
+        offset = int(row["offset"])
+        return self._block(int(row["block"]))[offset:offset + int(row["length"])].decode("utf-8")
+
+    def get(self, point_id: int) -> dict:
+        """Chunk text plus its article's metadata"""
+        row = self.chunks[point_id]
+        chunk = dict(self.articles[int(row["article"])])
+        chunk["chunk_index"] = int(row["chunk_index"])
+        chunk["text"] = self.text(point_id)
+        return chunk
+
+    def article_range(self, point_id: int) -> tuple:
+        """(first, end) point IDs of the article containing point_id"""
+        article = int(self.chunks[point_id]["article"])
+        return int(self.article_starts[article]), int(self.article_starts[article + 1])
+
+    def close(self):
+        if isinstance(self._blocks, mmap.mmap):
+            self._blocks.close()
+        self._blocks_file.close()
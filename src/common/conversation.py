@@ -0,0 +1,126 @@
+"""
+Multi-turn state for chat front ends (demo.py).
+
+Follow-ups such as "còn giá vé thì sao?" carry almost nothing retrievable on
+their own. A Conversation keeps the standalone question of the last
+retrieval, its embedding and the retrieved chunks with their vectors, and
+route() picks one of three paths for each new message using cheap checks
+only (cue phrases, locations, cosine similarity to cached vectors):
+
+    reuse     a follow-up the cached chunks already cover: answer from them,
+              no vector search
+    rewrite   a follow-up the cache does not cover: rewrite it into a
+              standalone question (one short LLM call), then retrieve
+    new       anything else: retrieve for the message as it is
+"""
+import os
+import re
+import numpy as np
+from common.locations import exact_form, extract_locations
+from common.metrics import FOLLOWUP_ROUTES
+
+# Best cosine between a follow-up and a cached chunk for the cache to count as covering it
+REUSE_THRESHOLD = float(os.getenv("RAG_FOLLOWUP_REUSE", "0.55"))
+# Messages this short are treated as follow-ups even without a cue phrase
+SHORT_FOLLOWUP_WORDS = 4
+# Openers only count in messages up to this long ("Con đường ..." is not "còn ...")
+OPENER_MAX_WORDS = 8
+
+# Phrases that lean on the previous turn, matched on the lowercased message with diacritics:
+# folded, "thì sao" would also match "Thi sao cho đậu đại học?"
+FOLLOWUP_CUES = [
+    "thế còn", "vậy còn", "thì sao", "như vậy", "thế thì", "vậy thì", "ở đó", "ở đấy", "chỗ đó",
+    "nơi đó", "cái đó", "điều đó", "nữa không", "chi tiết hơn",
+]
+# Words that only mark a follow-up at the start of a message ("còn giá vé thì sao?");
+# a bare "thế" is left out since it also opens "Thế giới ..."
+FOLLOWUP_OPENERS = ["còn", "vậy", "và", "thế còn", "thế thì"]
+CUE_RE = re.compile(r"\b(" + "|".join(re.escape(exact_form(cue)) for cue in FOLLOWUP_CUES) + r")\b")
+OPENER_RE = re.compile(r"^\W*(" + "|".join(re.escape(exact_form(cue)) for cue in FOLLOWUP_OPENERS) + r")\b")
+
+REWRITE_PROMPT = (
+    "Viết lại câu hỏi tiếp theo của người dùng thành một câu hỏi độc lập, đầy đủ, "
+    "hiểu được mà không cần đọc hội thoại. Chỉ trả về câu hỏi đã viết lại."
+)
+
+
+def _unit(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class Conversation:
+    """Cached retrieval of the last standalone question, and the last exchange"""
+
+    def __init__(self, reuse_threshold: float = REUSE_THRESHOLD):
+        self.reuse_threshold = reuse_threshold
+        self.query = None
+        self.query_embedding = None
+        self.chunks = []
+        self.chunk_embeddings = None
+        self.locations = set()
+        self.last_question = None
+        self.last_answer = None
+
+    def remember_retrieval(self, query: str, query_embedding, chunks: list):
+        """Cache a retrieval; chunks carry their vectors as "embedding", which are moved into an array"""
+        vectors = [chunk.pop("embedding", None) for chunk in chunks]
+        self.query = query
+        self.query_embedding = _unit(query_embedding)
+        self.chunks = chunks
+        self.chunk_embeddings = _unit(vectors) if chunks and all(v is not None for v in vectors) else None
+        self.locations = set(extract_locations(query))
+
+    def remember_answer(self, question: str, answer: str):
+        self.last_question = question
+        self.last_answer = answer
+
+    def coverage(self, query_embedding) -> float:
+        """Best cosine between the message and a cached chunk"""
+        if self.chunk_embeddings is None:
+            return 0.0
+        return float((self.chunk_embeddings @ _unit(query_embedding)).max())
+
+    def is_followup(self, query: str) -> bool:
+        text, words = exact_form(query), len(query.split())
+        return words <= SHORT_FOLLOWUP_WORDS or bool(CUE_RE.search(text)) or \
+            words <= OPENER_MAX_WORDS and bool(OPENER_RE.search(text))
+
+    def route(self, query: str, query_embedding) -> str:
+        """"reuse", "rewrite" or "new" for the next message (see module docstring)"""
+        if not self.chunks or not self.is_followup(query):
+            route = "new"
+        elif not set(extract_locations(query)) <= self.locations:
+            # Same question about another place: the cached chunks are about the wrong one
+            route = "rewrite"
+        elif self.coverage(query_embedding) >= self.reuse_threshold:
+            route = "reuse"
+        else:
+            route = "rewrite"
+        FOLLOWUP_ROUTES.inc(route=route)
+        return route
+
+    def cached_chunks(self, query_embedding) -> list:
+        """Cached chunks, most similar to the follow-up first"""
+        if self.chunk_embeddings is None:
+            return list(self.chunks)
+        order = np.argsort(-(self.chunk_embeddings @ _unit(query_embedding)))
+        return [self.chunks[i] for i in order]
+
+    def history_messages(self, max_chars: int = 1000) -> list:
+        """The last exchange as chat messages, for answering a follow-up in context"""
+        if self.last_question is None:
+            return []
+        return [{"role": "user", "content": self.last_question},
+                {"role": "assistant", "content": (self.last_answer or "")[:max_chars]}]
+
+    def rewrite_messages(self, query: str) -> list:
+        """Chat messages asking the LLM for a standalone version of `query`"""
+        return [{"role": "system", "content": REWRITE_PROMPT},
+                *self.history_messages(max_chars=500),
+                {"role": "user", "content": f"Câu hỏi tiếp theo: {query}"}]
+
+    def fallback_rewrite(self, query: str) -> str:
+        """Standalone query without the LLM: the previous standalone question plus the follow-up"""
+        return f"{self.query} {query}" if self.query else query
@@ -0,0 +1,75 @@
+"""
+Per-request latency budgets with graceful degradation.
+
+A Deadline is created for each request with a total budget. Each stage asks
+for its sub-budget: its share of the time still left, split over itself and
+the stages after it, so time an early stage does not use flows to later
+ones. Stages then shrink their work to fit (rerank fewer candidates, send
+less context, cap the LLM call) instead of overrunning, and record every
+such decision with degrade(), which counts it in rag_degradations_total,
+adds it to the request trace and logs it.
+"""
+import threading
+import time
+from common.metrics import DEGRADATIONS
+
+# Relative shares of the budget, in pipeline order
+DEFAULT_SHARES = {"encode": 0.05, "search": 0.15, "rerank": 0.2, "llm": 0.6}
+
+
+class Deadline:
+    def __init__(self, budget_seconds: float, shares: dict = None, trace=None):
+        self.budget = budget_seconds
+        self.shares = shares or DEFAULT_SHARES
+        self.trace = trace
+        self.start = time.monotonic()
+        self.degradations = []
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def remaining(self) -> float:
+        return max(0.0, self.budget - self.elapsed())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def stage_budget(self, stage: str) -> float:
+        """Seconds `stage` may use now, including whatever earlier stages left unused"""
+        stages = list(self.shares)
+        later = stages[stages.index(stage):] if stage in self.shares else [stage]
+        total = sum(self.shares.get(name, 0) for name in later)
+        share = self.shares.get(stage, 0) / total if total else 1.0
+        return self.remaining() * share
+
+    def degrade(self, stage: str, action: str, detail: str = ""):
+        self.degradations.append({"stage": stage, "action": action, "detail": detail,
+                                  "elapsed_ms": round(self.elapsed() * 1000, 1)})
+        if self.trace is not None:
+            self.trace.observe_degradation(stage, action, detail)
+        else:
+            DEGRADATIONS.inc(stage=stage, action=action)
+        print(f"Degraded {stage}: {action} {detail} ({self.elapsed() * 1000:.0f}ms of {self.budget * 1000:.0f}ms)")
+
+
+class UnitCost:
+    """Moving average of seconds per item (e.g. per reranked pair), to size work to a budget"""
+
+    def __init__(self, initial: float, alpha: float = 0.2):
+        self.seconds_per_item = initial
+        self.alpha = alpha
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, items: int):
+        if items <= 0:
+            return
+        with self._lock:
+            self.seconds_per_item += self.alpha * (seconds / items - self.seconds_per_item)
+
+    def affordable(self, seconds: float) -> int:
+        """How many items fit in `seconds`"""
+        return int(seconds / self.seconds_per_item) if self.seconds_per_item > 0 else 1 << 30
+
+
+# Cross-encoder cost per (query, chunk) pair, learned from live reranks
+RERANK_COST = UnitCost(initial=0.005)
@@ -0,0 +1,109 @@
+"""
+Tuned CPU inference settings for the bi-encoder and the cross-encoder.
+
+evaluation/autotune.py sweeps torch intra-op threads, concurrent model
+replicas and batch size for each model and writes the best configuration to
+INFERENCE_PROFILE (default ./data/inference_profile.json):
+
+    {"device": "cpu", "cpu_count": 16,
+     "embedding": {"model": ..., "threads": 4, "replicas": 4, "batch_size": 32, ...},
+     "reranking": {"model": ..., "threads": 8, "replicas": 2, "batch_size": 16, ...}}
+
+chunk_n_load.py and answer_generator.py load it at startup, place their
+models on inference_device() (RAG_DEVICE, else the profile's device) and
+wrap them with apply_inference_profile(). Intra-op threads are a process-wide torch
+setting, so each script takes them from the model it spends most of its time
+in. Settings are only applied to models on the device they were tuned on,
+and a missing profile (or INFERENCE_PROFILE=none) keeps library defaults.
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+DEFAULT_PROFILE_PATH = "./data/inference_profile.json"
+
+
+def load_inference_profile(path: str = None) -> dict:
+    """The profile at path (else INFERENCE_PROFILE, else the default path), or {} if there is none"""
+    path = path or os.getenv("INFERENCE_PROFILE", DEFAULT_PROFILE_PATH)
+    if path.lower() == "none" or not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def inference_device(profile: dict = None) -> str:
+    """RAG_DEVICE, else the device the profile was tuned on, else "cuda" """
+    profile = profile if profile is not None else load_inference_profile()
+    return os.getenv("RAG_DEVICE") or profile.get("device") or "cuda"
+
+
+def model_device(model) -> str:
+    """"cpu", "cuda", ... for a SentenceTransformer, CrossEncoder or a wrapper around one"""
+    device = getattr(model, "device", None)
+    if device is None and hasattr(getattr(model, "model", None), "parameters"):
+        device = next(model.model.parameters()).device
+    return str(device or "cpu").split(":")[0]
+
+
+class ReplicatedModel:
+    """
+    Drop-in for model.encode() / model.predict() with a tuned default batch
+    size. Calls with more than one batch of inputs are split into up to
+    `replicas` contiguous slices that run concurrently (torch releases the GIL
+    inside operators), and the outputs are concatenated in input order. The
+    replicas share the model's weights. Other attributes are forwarded to the model.
+    """
+
+    def __init__(self, model, batch_size: int = 32, replicas: int = 1):
+        self.model = model
+        self.batch_size = batch_size
+        self.replicas = max(1, replicas)
+        self._executor = ThreadPoolExecutor(max_workers=self.replicas) if self.replicas > 1 else None
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def encode(self, sentences, **kwargs):
+        return self._run(self.model.encode, sentences, kwargs)
+
+    def predict(self, pairs, **kwargs):
+        return self._run(self.model.predict, pairs, kwargs)
+
+    def _run(self, function, items, kwargs):
+        kwargs.setdefault("batch_size", self.batch_size)
+        # Single inputs (one query string) and calls that fit in one batch run as they are
+        if self._executor is None or isinstance(items, str) or len(items) <= kwargs["batch_size"]:
+            return function(items, **kwargs)
+        slices = min(self.replicas, -(-len(items) // kwargs["batch_size"]))
+        size = -(-len(items) // slices)
+        futures = [self._executor.submit(function, items[i:i + size], **kwargs) for i in range(0, len(items), size)]
+        return np.concatenate([np.asarray(future.result()) for future in futures])
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+
+def apply_inference_profile(model, key: str, profile: dict = None, set_threads: bool = False):
+    """
+    `model` with the profile's settings for `key` ("embedding" or "reranking"):
+    wrapped in a ReplicatedModel and, with set_threads, torch intra-op threads
+    set for the process. Returns the model unchanged when there are no
+    settings for it or they were tuned on another device.
+    """
+    profile = profile if profile is not None else load_inference_profile()
+    settings = profile.get(key)
+    if not settings:
+        return model
+    device = model_device(model)
+    if device != profile.get("device", "cpu"):
+        print(f"Inference profile was tuned on {profile.get('device')}, {key} model runs on {device}: not applied")
+        return model
+    if set_threads:
+        import torch
+        torch.set_num_threads(settings["threads"])
+    print(f"Inference profile for {key}: {settings['threads']} threads, {settings['replicas']} replicas, "
+          f"batch size {settings['batch_size']}")
+    return ReplicatedModel(model, settings["batch_size"], settings["replicas"])
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from types import SimpleNamespace
+
+# off: always call the API; readwrite: serve hits, store misses; replay: serve hits, fail on misses
+CACHE_MODES = ("off", "readwrite", "replay")
+DEFAULT_CACHE_PATH = "./data/llm_cache.sqlite"
+
+
+class CacheMiss(KeyError):
+    """Raised in replay mode when a request is not in the cache"""
+
+
+def cache_key(model: str, messages: list, temperature: float, max_tokens: int) -> str:
+    """Content address of a chat completion request"""
+    request = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+
+def to_response(entry: dict):
+    """Wrap a cache entry so callers can read it like an OpenAI response"""
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=entry["content"]))],
+        usage=SimpleNamespace(
+            prompt_tokens=entry.get("prompt_tokens", 0),
+            completion_tokens=entry.get("completion_tokens", 0),
+        ),
+        model=entry.get("model"),
+        cached=True
+    )
+
+
+class ResponseCache:
+    """
+    Chat completion responses stored in SQLite as zlib-compressed JSON,
+    keyed by cache_key(). Safe to share between threads.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, mode: str = "readwrite"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode '{mode}', expected one of {CACHE_MODES}")
+        self.path = path
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value BLOB)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, response):
+        entry = {
+            "content": response.choices[0].message.content,
+            "model": getattr(response, "model", None),
+            "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
+            "completion_tokens": response.usage.completion_tokens if response.usage else 0,
+        }
+        blob = zlib.compress(json.dumps(entry, ensure_ascii=False).encode("utf-8"), 9)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, value) VALUES (?, ?)", (key, blob))
+            self._conn.commit()
+
+    def delete(self, key: str):
+        """Forget a response (e.g. one that could not be parsed), so the next call asks the API again"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class AnswerCache:
+    """
+    Small in-process LRU of final answers keyed by the normalized question,
+    served when a request has no time left for the LLM. Safe to share between threads.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(question: str) -> str:
+        return " ".join(question.lower().split()).rstrip("?.! ")
+
+    def get(self, question: str):
+        key = self.key(question)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, question: str, answer: str):
+        with self._lock:
+            self._entries[self.key(question)] = answer
+            self._entries.move_to_end(self.key(question))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def load_cache(mode: str = None, path: str = None):
+    """
+    Build the cache from LLM_CACHE_MODE / LLM_CACHE_PATH (or explicit arguments).
+    Returns None when caching is off, the default: serving answers are sampled
+    and should not be frozen, so only the dataset scripts cache unless asked to.
+    """
+    mode = mode or os.getenv("LLM_CACHE_MODE", "off")
+    if mode == "off":
+        return None
+    return ResponseCache(path or os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH), mode)
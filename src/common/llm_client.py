@@ -0,0 +1,105 @@
+import asyncio
+import random
+from openai import AsyncOpenAI, RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+from common.llm_cache import CacheMiss, cache_key, to_response
+
+# Errors worth retrying; everything else (bad request, auth) fails immediately
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+def make_async_client(**kwargs):
+    """
+    Create an AsyncOpenAI client with the SDK's own retries disabled.
+    OPENAI_API_KEY and OPENAI_BASE_URL are read from the environment, so pointing
+    OPENAI_BASE_URL at common/openai_stub.py runs everything offline.
+    """
+    return AsyncOpenAI(max_retries=0, **kwargs)
+
+
+def retry_delay(error, attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Seconds to wait before the next attempt, honouring Retry-After on rate limits"""
+    response = getattr(error, "response", None)
+    if response is not None:
+        headers = response.headers
+        if headers.get("retry-after-ms"):
+            try:
+                return float(headers["retry-after-ms"]) / 1000
+            except ValueError:
+                pass
+        if headers.get("retry-after"):
+            try:
+                return float(headers["retry-after"])
+            except ValueError:
+                pass
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def lookup_cache(cache, model: str, messages: list, temperature: float, max_tokens: int):
+    """Return (key, cached response or None); raises CacheMiss in replay mode"""
+    if cache is None:
+        return None, None
+    key = cache_key(model, messages, temperature, max_tokens)
+    entry = cache.get(key)
+    if entry is not None:
+        return key, to_response(entry)
+    if cache.mode == "replay":
+        raise CacheMiss(key)
+    return key, None
+
+
+def cached_chat_completion(client, messages: list, model: str, temperature: float = 0.7,
+                           max_tokens: int = 500, cache=None, timeout: float = None):
+    """Synchronous chat completion served from `cache` when possible; `timeout` (seconds) caps the API call"""
+    key, cached = lookup_cache(cache, model, messages, temperature, max_tokens)
+    if cached is not None:
+        return cached
+    kwargs = {"timeout": timeout} if timeout is not None else {}
+    response = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        **kwargs
+    )
+    if cache is not None:
+        cache.put(key, response)
+    return response
+
+
+async def chat_completion(client, messages: list, model: str, temperature: float = 0.7,
+                          max_tokens: int = 500, max_retries: int = 6, stats: dict = None, cache=None):
+    """
+    Call chat.completions.create, retrying rate limits and transient errors.
+    `stats`, when given, is a dict of counters updated in place.
+    `cache`, when given, is a common.llm_cache.ResponseCache consulted first.
+    """
+    key, cached = lookup_cache(cache, model, messages, temperature, max_tokens)
+    if cached is not None:
+        if stats is not None:
+            stats["cache_hits"] = stats.get("cache_hits", 0) + 1
+        return cached
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            if stats is not None:
+                stats["calls"] = stats.get("calls", 0) + 1
+                if response.usage:
+                    stats["prompt_tokens"] = stats.get("prompt_tokens", 0) + response.usage.prompt_tokens
+                    stats["completion_tokens"] = stats.get("completion_tokens", 0) + response.usage.completion_tokens
+            if cache is not None:
+                cache.put(key, response)
+            return response
+        except RETRYABLE_ERRORS as e:
+            if stats is not None:
+                counter = "rate_limited" if isinstance(e, RateLimitError) else "retried"
+                stats[counter] = stats.get(counter, 0) + 1
+            if attempt == max_retries:
+                raise
+            await asyncio.sleep(retry_delay(e, attempt))
@@ -0,0 +1,176 @@
+"""
+Province/destination extraction for payload filters.
+
+Maps Vietnamese province names (and well-known destinations, old names and
+abbreviations) found in a title, URL or query to a canonical province slug
+such as "ha-noi" or "lam-dong". Matching is done on lowercase text with
+diacritics removed, on word boundaries, so "Đà Lạt", "da-lat" in a URL and
+"da lat" typed without accents all map to the same slug. Names that fold into
+common words ("Nam Du" / "năm du lịch", "Cô Tô" / "có tổ chức") are
+AMBIGUOUS_NAMES and only match as written, with diacritics; names that are
+common words even with diacritics ("hòa bình" is peace) are CAPITALIZED_NAMES
+and only match capitalized as a name. NON_LOCATIONS ("Thái Bình Dương", the
+Pacific) are masked before matching.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+# slug -> names and destinations that identify the province (with diacritics; folded at import)
+PROVINCES = {
+    "ha-noi": ["Hà Nội", "Hanoi", "Hồ Gươm", "Phố cổ Hà Nội"],
+    "ho-chi-minh": ["Hồ Chí Minh", "TP.HCM", "TPHCM", "TP HCM", "HCM", "Sài Gòn", "Saigon"],
+    "hai-phong": ["Hải Phòng", "Cát Bà", "Đồ Sơn"],
+    "da-nang": ["Đà Nẵng", "Bà Nà", "Sơn Trà"],
+    "can-tho": ["Cần Thơ", "Cái Răng"],
+    "an-giang": ["An Giang", "Châu Đốc", "Núi Sam"],
+    "ba-ria-vung-tau": ["Bà Rịa", "Vũng Tàu", "Côn Đảo", "Long Hải", "Hồ Tràm"],
+    "bac-giang": ["Bắc Giang"],
+    "bac-kan": ["Bắc Kạn", "Ba Bể"],
+    "bac-lieu": ["Bạc Liêu"],
+    "bac-ninh": ["Bắc Ninh"],
+    "ben-tre": ["Bến Tre"],
+    "binh-dinh": ["Bình Định", "Quy Nhơn", "Kỳ Co", "Eo Gió"],
+    "binh-duong": ["Bình Dương"],
+    "binh-phuoc": ["Bình Phước"],
+    "binh-thuan": ["Bình Thuận", "Phan Thiết", "Mũi Né"],
+    "ca-mau": ["Cà Mau"],
+    "cao-bang": ["Cao Bằng", "Bản Giốc"],
+    "dak-lak": ["Đắk Lắk", "Đăk Lăk", "Buôn Ma Thuột", "Buôn Đôn"],
+    "dak-nong": ["Đắk Nông", "Đăk Nông"],
+    "dien-bien": ["Điện Biên"],
+    "dong-nai": ["Đồng Nai", "Biên Hòa"],
+    "dong-thap": ["Đồng Tháp", "Sa Đéc"],
+    "gia-lai": ["Gia Lai", "Pleiku"],
+    "ha-giang": ["Hà Giang", "Đồng Văn", "Mã Pí Lèng"],
+    "ha-nam": ["Hà Nam", "Tam Chúc"],
+    "ha-tinh": ["Hà Tĩnh"],
+    "hai-duong": ["Hải Dương"],
+    "hau-giang": ["Hậu Giang"],
+    "hoa-binh": ["Hòa Bình", "Hoà Bình", "Mai Châu"],
+    "hung-yen": ["Hưng Yên"],
+    "khanh-hoa": ["Khánh Hòa", "Khánh Hoà", "Nha Trang", "Cam Ranh"],
+    "kien-giang": ["Kiên Giang", "Phú Quốc", "Hà Tiên", "Nam Du", "Rạch Giá"],
+    "kon-tum": ["Kon Tum", "Măng Đen"],
+    "lai-chau": ["Lai Châu"],
+    "lam-dong": ["Lâm Đồng", "Đà Lạt", "Dalat", "Bảo Lộc"],
+    "lang-son": ["Lạng Sơn"],
+    "lao-cai": ["Lào Cai", "Sa Pa", "Sapa", "Fansipan", "Y Tý"],
+    "long-an": ["Long An"],
+    "nam-dinh": ["Nam Định"],
+    "nghe-an": ["Nghệ An", "Cửa Lò"],
+    "ninh-binh": ["Ninh Bình", "Tràng An", "Tam Cốc", "Bái Đính"],
+    "ninh-thuan": ["Ninh Thuận", "Phan Rang", "Vĩnh Hy"],
+    "phu-tho": ["Phú Thọ"],
+    "phu-yen": ["Phú Yên", "Tuy Hòa", "Tuy Hoà"],
+    "quang-binh": ["Quảng Bình", "Phong Nha", "Sơn Đoòng", "Đồng Hới"],
+    "quang-nam": ["Quảng Nam", "Hội An", "Mỹ Sơn", "Cù Lao Chàm"],
+    "quang-ngai": ["Quảng Ngãi", "Lý Sơn"],
+    "quang-ninh": ["Quảng Ninh", "Hạ Long", "Vân Đồn", "Cô Tô", "Yên Tử"],
+    "quang-tri": ["Quảng Trị"],
+    "soc-trang": ["Sóc Trăng"],
+    "son-la": ["Sơn La", "Mộc Châu"],
+    "tay-ninh": ["Tây Ninh", "Núi Bà Đen"],
+    "thai-binh": ["Thái Bình"],
+    "thai-nguyen": ["Thái Nguyên"],
+    "thanh-hoa": ["Thanh Hóa", "Thanh Hoá", "Sầm Sơn", "Pù Luông"],
+    "thua-thien-hue": ["Thừa Thiên Huế", "Huế", "Lăng Cô"],
+    "tien-giang": ["Tiền Giang", "Mỹ Tho"],
+    "tra-vinh": ["Trà Vinh"],
+    "tuyen-quang": ["Tuyên Quang"],
+    "vinh-long": ["Vĩnh Long"],
+    "vinh-phuc": ["Vĩnh Phúc", "Tam Đảo"],
+    "yen-bai": ["Yên Bái", "Mù Cang Chải"],
+}
+
+# Names whose folded form is a common phrase; matched with diacritics only (case-insensitive)
+AMBIGUOUS_NAMES = {"Nam Du", "Cô Tô", "Huế", "Ba Bể", "Đồ Sơn", "Kỳ Co", "Gia Lai"}
+# Names that are common words with the same diacritics; matched only as written ("Hòa Bình") or in capitals
+CAPITALIZED_NAMES = {"Thái Bình", "Hòa Bình", "Hoà Bình"}
+# Phrases containing a province name that are not about the province
+NON_LOCATIONS = ["Thái Bình Dương"]
+
+
+def fold(text: str) -> str:
+    """Lowercase, strip diacritics and turn punctuation (URL dashes, dots) into spaces"""
+    text = unicodedata.normalize("NFD", text.lower().replace("đ", "d"))
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+    return re.sub(r"[\W_]+", " ", text).strip()
+
+
+def exact_form(text: str) -> str:
+    """Lowercase NFC text, keeping diacritics"""
+    return unicodedata.normalize("NFC", text.lower())
+
+
+def _build_pattern(names: dict):
+    # Longest names first so "thua thien hue" wins over "hue"
+    ordered = sorted(names, key=len, reverse=True)
+    return re.compile(r"\b(" + "|".join(re.escape(name) for name in ordered) + r")\b")
+
+
+NAME_TO_SLUG = {fold(alias): slug for slug, aliases in PROVINCES.items()
+                for alias in aliases if alias not in AMBIGUOUS_NAMES | CAPITALIZED_NAMES}
+EXACT_NAME_TO_SLUG = {exact_form(alias): slug for slug, aliases in PROVINCES.items()
+                      for alias in aliases if alias in AMBIGUOUS_NAMES}
+CAPITALIZED_NAME_TO_SLUG = {unicodedata.normalize("NFC", form): slug for slug, aliases in PROVINCES.items()
+                            for alias in aliases if alias in CAPITALIZED_NAMES for form in (alias, alias.upper())}
+LOCATION_RE = _build_pattern(NAME_TO_SLUG)
+EXACT_LOCATION_RE = _build_pattern(EXACT_NAME_TO_SLUG)
+CAPITALIZED_LOCATION_RE = _build_pattern(CAPITALIZED_NAME_TO_SLUG)
+NON_LOCATION_RE = re.compile(r"\b(" + "|".join(re.escape(exact_form(name)) for name in NON_LOCATIONS) + r")\b",
+                             re.IGNORECASE)
+FOLDED_NON_LOCATION_RE = _build_pattern({fold(name): None for name in NON_LOCATIONS})
+
+
+@lru_cache(maxsize=100_000)
+def extract_locations(text: str) -> tuple:
+    """
+    Province slugs mentioned in the text, in order of first mention
+
+    >>> extract_locations("Du lịch Đà Lạt và Nam Du")
+    ('lam-dong', 'kien-giang')
+    >>> extract_locations("Năm Du lịch quốc gia 2025 được tổ chức ở đâu?")
+    ()
+    >>> extract_locations("Mỗi năm du lịch phát triển")
+    ()
+    >>> extract_locations("Lễ hội này có tổ chức vào mùa hè không?")
+    ()
+    >>> extract_locations("Phố đi bộ Nguyễn Huệ ở Sài Gòn")
+    ('ho-chi-minh',)
+    >>> extract_locations("Giá lại tăng rồi à?")
+    ()
+    >>> extract_locations("Thái Bình Dương rộng bao nhiêu")
+    ()
+    >>> extract_locations("Hòa bình thế giới")
+    ()
+    >>> extract_locations("Cà phê Gia Lai và chùa Keo ở Thái Bình")
+    ('gia-lai', 'thai-binh')
+    >>> extract_locations("Mai Châu, HÒA BÌNH mùa lúa chín")
+    ('hoa-binh',)
+    """
+    if not text:
+        return ()
+    text = NON_LOCATION_RE.sub(" ", unicodedata.normalize("NFC", text))
+    folded = FOLDED_NON_LOCATION_RE.sub(" ", fold(text))
+    # Folded and exact positions differ only where punctuation runs collapse, close enough for ordering
+    matches = [(match.start(), NAME_TO_SLUG[match.group(1)]) for match in LOCATION_RE.finditer(folded)]
+    matches += [(match.start(), EXACT_NAME_TO_SLUG[match.group(1)])
+                for match in EXACT_LOCATION_RE.finditer(exact_form(text))]
+    matches += [(match.start(), CAPITALIZED_NAME_TO_SLUG[match.group(1)])
+                for match in CAPITALIZED_LOCATION_RE.finditer(text)]
+    slugs = []
+    for _, slug in sorted(matches):
+        if slug not in slugs:
+            slugs.append(slug)
+    return tuple(slugs)
+
+
+def article_locations(title: str, url: str) -> list:
+    """Locations of an article from its title and URL path"""
+    path = url.split("://", 1)[-1].split("/", 1)[-1] if url else ""
+    slugs = list(extract_locations(title or ""))
+    for slug in extract_locations(path):
+        if slug not in slugs:
+            slugs.append(slug)
+    return slugs
@@ -0,0 +1,253 @@
+"""
+Low-overhead in-process metrics for the RAG path.
+
+Histograms and counters are kept in a process-wide registry and rendered in the
+Prometheus text exposition format, either via start_metrics_server() or
+render_metrics(). RequestTrace collects per-request stage timings, feeds the
+histograms and, when RAG_TRACE_LOG is set, appends one JSON line per request.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; covers sub-millisecond cache hits up to slow LLM calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+# Seconds from crawl or publication to searchable: seconds for streaming, up to a week for batch loads
+FRESHNESS_BUCKETS = (1, 5, 15, 30, 60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400, 3 * 86400,
+                     7 * 86400)
+
+
+def _label_key(labelnames: tuple, labels: dict) -> tuple:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames: tuple, key: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(labelnames, key)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # label key -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram("rag_stage_seconds", "Duration of each RAG pipeline stage", ("stage",))
+CANDIDATES = REGISTRY.histogram("rag_candidates", "Number of candidate chunks per stage", ("stage",), COUNT_BUCKETS)
+LLM_TOKENS = REGISTRY.counter("rag_llm_tokens_total", "Tokens used by chat completions", ("kind",))
+LLM_CACHE = REGISTRY.counter("rag_llm_cache_total", "LLM response cache outcomes", ("outcome",))
+ERRORS = REGISTRY.counter("rag_errors_total", "Errors per pipeline stage", ("stage",))
+DEGRADATIONS = REGISTRY.counter("rag_degradations_total", "Work dropped to stay within the latency budget",
+                                ("stage", "action"))
+INDEX_FRESHNESS = REGISTRY.histogram("rag_index_freshness_seconds", "Time until a new article is searchable",
+                                     ("since", "source"), FRESHNESS_BUCKETS)
+PIPELINE_ARTICLES = REGISTRY.counter("rag_pipeline_articles_total", "Articles per streaming pipeline stage outcome",
+                                     ("stage", "outcome"))
+FOLLOWUP_ROUTES = REGISTRY.counter("rag_followup_routes_total", "How chat turns were answered (reuse/rewrite/new)",
+                                   ("route",))
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+# ---------------------------------------------------------------------------
+# Per-request traces
+# ---------------------------------------------------------------------------
+
+_trace_lock = threading.Lock()
+_trace_file = None
+
+
+def configure_trace_log(path: str = None):
+    """Append per-request traces to `path` (default: $RAG_TRACE_LOG); None disables"""
+    global _trace_file
+    path = path or os.getenv("RAG_TRACE_LOG")
+    with _trace_lock:
+        if _trace_file is not None:
+            _trace_file.close()
+        _trace_file = open(path, "a", encoding="utf-8") if path else None
+
+
+class RequestTrace:
+    """Stage timings and counts for one request"""
+
+    def __init__(self, query: str = None):
+        self.start = time.perf_counter()
+        self.record = {"ts": time.time(), "query": query, "stages": {}, "counts": {}}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            ERRORS.inc(stage=name)
+            self.record.setdefault("errors", []).append(name)
+            raise
+        finally:
+            self.observe_stage(name, time.perf_counter() - start)
+
+    def observe_stage(self, name: str, seconds: float):
+        STAGE_SECONDS.observe(seconds, stage=name)
+        self.record["stages"][name] = round(seconds * 1000, 3)
+
+    def observe_count(self, name: str, value: int):
+        CANDIDATES.observe(value, stage=name)
+        self.record["counts"][name] = value
+
+    def observe_retrieval(self, timings: dict):
+        """Record the timings dict filled in by retrieval.retrieve()"""
+        for name, value in timings.items():
+            if name == "candidates":
+                self.observe_count("search", value)
+            else:
+                self.observe_stage(name, value)
+
+    def observe_degradation(self, stage: str, action: str, detail: str = ""):
+        """Record a deadline-driven degradation (see common/deadline.py)"""
+        DEGRADATIONS.inc(stage=stage, action=action)
+        self.record.setdefault("degraded", []).append({"stage": stage, "action": action, "detail": detail})
+
+    def observe_llm_response(self, response, cache=None):
+        """Record token usage and the cache outcome of a chat completion"""
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            LLM_TOKENS.inc(usage.prompt_tokens, kind="prompt")
+            LLM_TOKENS.inc(usage.completion_tokens, kind="completion")
+            self.record["counts"]["prompt_tokens"] = usage.prompt_tokens
+            self.record["counts"]["completion_tokens"] = usage.completion_tokens
+        if cache is None:
+            outcome = "disabled"
+        else:
+            outcome = "hit" if getattr(response, "cached", False) else "miss"
+        LLM_CACHE.inc(outcome=outcome)
+        self.record["llm_cache"] = outcome
+
+    def finish(self):
+        self.observe_stage("total", time.perf_counter() - self.start)
+        if _trace_file is not None:
+            line = json.dumps(self.record, ensure_ascii=False)
+            with _trace_lock:
+                _trace_file.write(line + "\n")
+                _trace_file.flush()
+        return self.record
+
+# ---------------------------------------------------------------------------
+# Prometheus endpoint
+# ---------------------------------------------------------------------------
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_metrics_server(port: int = None, host: str = "0.0.0.0"):
+    """Serve /metrics on `port` (default: $RAG_METRICS_PORT) from a daemon thread; returns the server or None"""
+    port = port if port is not None else int(os.getenv("RAG_METRICS_PORT", "0") or 0)
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+configure_trace_log()
@@ -0,0 +1,139 @@
+"""
+Minimal OpenAI-compatible chat completions server for offline runs.
+
+    python src/common/openai_stub.py --port 8001
+    export OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub
+
+Responses are deterministic for a given prompt and follow the output formats
+the QA generation and critique prompts ask for.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_completion(messages: list) -> str:
+    """Build a deterministic answer in the format the prompt expects"""
+    prompt = messages[-1]["content"] if messages else ""
+    digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+
+    if "Factoid question" in prompt:
+        context = prompt.split("Context:")[-1].strip().split("Output:::")[0].strip()
+        snippet = " ".join(context.split()[:8])
+        return f"Factoid question: {snippet}?\nAnswer: {snippet}"
+    if "Điểm tổng" in prompt:
+        score = int(digest[:2], 16) % 5 + 1
+        return f"Đánh giá: Câu hỏi được đánh giá tự động ({digest[:8]}).\nĐiểm tổng: {score}"
+    return f"Câu trả lời mẫu {digest[:8]}."
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency_ms = 0.0
+    jitter_ms = 0.0
+    rate_limit_ratio = 0.0
+    error_ratio = 0.0
+    lock = threading.Lock()
+    requests_served = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        delay = max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms))
+        time.sleep(delay / 1000)
+
+        roll = random.random()
+        if roll < self.rate_limit_ratio:
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                            headers={"retry-after-ms": "200"})
+            return
+        if roll < self.rate_limit_ratio + self.error_ratio:
+            self._send_json(500, {"error": {"message": "Stub server error", "type": "server_error"}})
+            return
+
+        messages = request.get("messages", [])
+        content = fake_completion(messages)
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in messages)
+        with self.lock:
+            StubHandler.requests_served += 1
+            request_id = StubHandler.requests_served
+
+        self._send_json(200, {
+            "id": f"chatcmpl-stub-{request_id}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model") or "stub",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(content.split()),
+                "total_tokens": prompt_tokens + len(content.split()),
+            },
+        })
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0,
+                      jitter_ms: float = 0.0, rate_limit_ratio: float = 0.0, error_ratio: float = 0.0):
+    """Start the stub in a background thread and return (server, base_url)"""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {
+        "latency_ms": latency_ms,
+        "jitter_ms": jitter_ms,
+        "rate_limit_ratio": rate_limit_ratio,
+        "error_ratio": error_ratio,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible chat completions stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0,
+                        help="Fraction of requests answered with HTTP 429")
+    parser.add_argument("--error-ratio", type=float, default=0.0,
+                        help="Fraction of requests answered with HTTP 500")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.host, args.port, args.latency_ms, args.jitter_ms,
+                                         args.rate_limit_ratio, args.error_ratio)
+    print(f"OpenAI stub listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,201 @@
+"""
+Opt-in profiling of model inference and the Python around it.
+
+Enabled with RAG_PROFILE=1 or a script's --profile flag, a profiling
+session runs for a window of RAG_PROFILE_SECONDS and writes to
+RAG_PROFILE_DIR (default ./data/profiles):
+
+    <name>_<time>_<pid>.folded      sampled Python stacks, one "a;b;c count" line per
+                                    stack (flamegraph.pl, speedscope, inferno)
+    <name>_<time>_<pid>.trace.json  torch operator profile in Chrome trace format
+                                    (chrome://tracing, Perfetto)
+
+Stacks are sampled from a background thread every RAG_PROFILE_INTERVAL_MS,
+so instrumented code is not slowed down by tracing. Hot paths are marked with
+profiled("name"), which labels them in the torch trace. Without a session it
+returns a shared null context, so the disabled cost is one global lookup;
+torch.profiler is only imported when a session starts.
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+DEFAULT_PROFILE_DIR = "./data/profiles"
+
+_NULL_CONTEXT = nullcontext()
+_session = None
+_session_lock = threading.Lock()
+
+
+class StackSampler:
+    """Background thread counting the folded Python stacks of every other thread"""
+
+    def __init__(self, interval: float = 0.01, until: float = None, on_expire=None):
+        self.interval = interval
+        self.until = until
+        self.on_expire = on_expire
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            if self.until is not None and time.monotonic() >= self.until:
+                if self.on_expire is not None:
+                    self.on_expire()
+                return
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own:
+                    self.counts[fold_stack(frame, names.get(thread_id, str(thread_id)))] += 1
+            self.samples += 1
+
+    def write_folded(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def fold_stack(frame, root: str) -> str:
+    """"root;outer (file:line);...;inner (file:line)" for a frame"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.append(root)
+    return ";".join(reversed(names))
+
+
+class ProfileSession:
+    def __init__(self, name: str, seconds: float, output_dir: str, interval: float = 0.01, torch_ops: bool = True):
+        self.name = name
+        self.output_dir = output_dir
+        self.start_time = time.monotonic()
+        self.deadline = self.start_time + seconds
+        self.prefix = os.path.join(output_dir, f"{name}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}")
+        self.sampler = StackSampler(interval, until=self.deadline, on_expire=self._on_sampler_expire)
+        self.torch_profiler = None
+        self._record_function = None
+        self.stopped = False
+        self._lock = threading.Lock()
+        if torch_ops:
+            import torch
+            from torch.profiler import ProfilerActivity, profile, record_function
+            activities = [ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(ProfilerActivity.CUDA)
+            self.torch_profiler = profile(activities=activities, record_shapes=True)
+            self._record_function = record_function
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.torch_profiler is not None:
+            self.torch_profiler.start()
+        self.sampler.start()
+        print(f"Profiling {self.name} for {self.deadline - self.start_time:g}s into {self.prefix}.*")
+
+    def set_window(self, seconds: float):
+        """Profile for `seconds` from the session start instead"""
+        self.deadline = self.start_time + seconds
+        self.sampler.until = self.deadline
+
+    def _on_sampler_expire(self):
+        # The torch profiler is stopped from the profiled thread (section end or exit); sampled-only
+        # sessions can write their file as soon as the window is over
+        if self.torch_profiler is None:
+            self.stop()
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.deadline
+
+    @contextmanager
+    def section(self, name: str):
+        try:
+            if self._record_function is not None and not self.stopped:
+                with self._record_function(name):
+                    yield
+            else:
+                yield
+        finally:
+            if self.expired():
+                self.stop()
+
+    def stop(self) -> list:
+        """Stop both profilers and write their files (once); returns the paths written"""
+        with self._lock:
+            if self.stopped:
+                return []
+            self.stopped = True
+        self.sampler.stop()
+        paths = [self.prefix + ".folded"]
+        self.sampler.write_folded(paths[0])
+        if self.torch_profiler is not None:
+            self.torch_profiler.stop()
+            paths.append(self.prefix + ".trace.json")
+            self.torch_profiler.export_chrome_trace(paths[1])
+        print(f"Profile of {self.name} ({self.sampler.samples} samples) written to {', '.join(paths)}")
+        return paths
+
+
+def add_profile_arguments(parser):
+    """--profile / --profile-seconds for a script's argparse parser"""
+    parser.add_argument("--profile", action="store_true",
+                        help="Write sampled Python and torch profiles (see common/profiling.py; also RAG_PROFILE=1)")
+    parser.add_argument("--profile-seconds", type=float, help="Profiling window (default: RAG_PROFILE_SECONDS or 60)")
+
+
+def start_profiling(name: str, enabled: bool = None, seconds: float = None, output_dir: str = None,
+                    torch_ops: bool = None):
+    """
+    Start the process-wide session if profiling is enabled (argument, else
+    RAG_PROFILE=1); returns it, or None when disabled. The session stops by
+    itself after `seconds` (RAG_PROFILE_SECONDS, default 60) at the next
+    profiled() section end, or at exit. If a session is already running (e.g.
+    started at import), explicit `seconds` replace its window.
+    """
+    global _session
+    enabled = enabled if enabled is not None else os.getenv("RAG_PROFILE", "0") == "1"
+    if not enabled:
+        return None
+    with _session_lock:
+        if _session is not None and not _session.stopped:
+            if seconds is not None:
+                _session.set_window(seconds)
+            return _session
+        _session = ProfileSession(
+            name,
+            seconds if seconds is not None else float(os.getenv("RAG_PROFILE_SECONDS", "60")),
+            output_dir or os.getenv("RAG_PROFILE_DIR", DEFAULT_PROFILE_DIR),
+            float(os.getenv("RAG_PROFILE_INTERVAL_MS", "10")) / 1000,
+            torch_ops if torch_ops is not None else os.getenv("RAG_PROFILE_TORCH", "1") == "1",
+        )
+    _session.start()
+    atexit.register(_session.stop)
+    return _session
+
+
+def stop_profiling() -> list:
+    return _session.stop() if _session is not None else []
+
+
+def profiled(name: str):
+    """Context manager marking a hot path; a no-op unless a session is running"""
+    session = _session
+    if session is None or session.stopped:
+        return _NULL_CONTEXT
+    return session.section(name)
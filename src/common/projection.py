@@ -0,0 +1,68 @@
+"""
+PCA projection for reduced-dimension first-stage vectors.
+
+Collections loaded with a projection (chunk_n_load.py --reduce-dim) carry two
+named vectors per point: "reduced", a low-dimensional (optionally int8
+quantized) vector with the HNSW graph used for the first-stage search, and
+"full", the original 768-dim embedding kept on disk without an index and
+only read back to rescore the oversampled candidates.
+"""
+import os
+import numpy as np
+
+REDUCED_VECTOR = "reduced"
+FULL_VECTOR = "full"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class PCAProjection:
+    """Unit-normalize, center and project onto the top principal axes, then re-normalize for cosine search"""
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, explained_variance: float = None,
+                 oversample: int = 4):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+        self.explained_variance = explained_variance
+        # Candidates fetched per final result before full-precision rescoring
+        self.oversample = oversample
+
+    @property
+    def dim(self) -> int:
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, vectors, dim: int, **kwargs):
+        """Fit on a sample of embeddings (a few tens of thousands is plenty)"""
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        mean = vectors.mean(axis=0)
+        # The right singular vectors of the centered sample are the principal axes
+        _, singular_values, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+        variance = singular_values ** 2
+        return cls(mean, vt[:dim], float(variance[:dim].sum() / variance.sum()), **kwargs)
+
+    def transform(self, vectors) -> np.ndarray:
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        return _normalize((vectors - self.mean) @ self.components.T)
+
+    def save(self, path: str):
+        np.savez(path, mean=self.mean, components=self.components,
+                 explained_variance=np.float32(self.explained_variance or 0.0))
+
+    @classmethod
+    def load(cls, path: str, oversample: int = 4):
+        data = np.load(path)
+        return cls(data["mean"], data["components"], float(data["explained_variance"]), oversample)
+
+
+def load_serving_projection():
+    """
+    The projection collections loaded with --reduce-dim are searched through
+    (VECTOR_PROJECTION), fetching RAG_OVERSAMPLE x top_k reduced-vector
+    candidates for full-precision rescoring; None when it is not set.
+    """
+    path = os.getenv("VECTOR_PROJECTION")
+    return PCAProjection.load(path, int(os.getenv("RAG_OVERSAMPLE", "4"))) if path else None
@@ -0,0 +1,244 @@
+"""
+Qdrant collection naming, creation and alias management.
+
+Serving code reads from QDRANT_COLLECTION (default "articles2"), which can be
+a plain collection or an alias. manage_collection.py builds versioned
+collections next to it (articles2_v20250610_120000) and swaps the alias in a
+single update_collection_aliases call, so readers never see a missing or
+half-built collection.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from qdrant_client.http import models
+from common.chunk_store import ChunkStore
+from common.projection import FULL_VECTOR, REDUCED_VECTOR
+from common.query_router import route_query
+
+COLLECTION_NAME = os.getenv("QDRANT_COLLECTION", "articles2")
+VECTOR_SIZE = 768  # Size of the embeddings from vietnamese-bi-encoder
+# Qdrant's default; restored after a bulk load has finished
+INDEXING_THRESHOLD = 20000
+
+# Filterable payload fields written by chunk_n_load.py
+PAYLOAD_INDEXES = {
+    "source": models.PayloadSchemaType.KEYWORD,
+    "timestamp": models.PayloadSchemaType.INTEGER,
+    "locations": models.PayloadSchemaType.KEYWORD,
+    "article_id": models.PayloadSchemaType.KEYWORD,
+}
+
+
+def shard_collection(base: str, source: str) -> str:
+    """Per-source shard of a collection or alias: articles2 -> articles2_laodong"""
+    return f"{base}_{source}"
+
+
+def store_path_for(template: str, collection: str) -> str:
+    """Chunk store directory for a collection: "{collection}" is filled in, otherwise it becomes a subdirectory"""
+    if "{collection}" in template:
+        return template.format(collection=collection)
+    return os.path.join(template, collection)
+
+
+def versioned_name(alias: str) -> str:
+    return f"{alias}_v{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+
+def collection_exists(client, name: str) -> bool:
+    """True for a real collection (not an alias) called `name`"""
+    return any(c.name == name for c in client.get_collections().collections)
+
+
+def alias_target(client, alias: str):
+    """Collection the alias points to, or None"""
+    for description in client.get_aliases().aliases:
+        if description.alias_name == alias:
+            return description.collection_name
+    return None
+
+
+def create_collection(client, name: str, vector_size: int = VECTOR_SIZE, hnsw_m: int = 16, ef_construct: int = 100,
+                      quantization: str = None, on_disk: bool = False, bulk_load: bool = False,
+                      reduced_dim: int = None):
+    """
+    Create a collection; raises if it already exists. quantization="int8" adds
+    scalar quantization (quantized vectors stay in RAM, originals follow
+    on_disk). With bulk_load, HNSW construction is deferred until
+    finish_bulk_load() so uploads don't compete with index building.
+    With reduced_dim, points get the named vectors of common/projection.py:
+    the searched "reduced" vector and an unindexed, on-disk "full" vector.
+    """
+    quantization_config = models.ScalarQuantization(
+        scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+    ) if quantization == "int8" else None
+    vectors_config = models.VectorParams(size=vector_size, distance=models.Distance.COSINE, on_disk=on_disk)
+    if reduced_dim:
+        vectors_config = {
+            REDUCED_VECTOR: models.VectorParams(size=reduced_dim, distance=models.Distance.COSINE, on_disk=on_disk,
+                                                quantization_config=quantization_config),
+            # Only read back to rescore candidates: no HNSW graph, never held in RAM
+            FULL_VECTOR: models.VectorParams(size=vector_size, distance=models.Distance.COSINE, on_disk=True,
+                                             hnsw_config=models.HnswConfigDiff(m=0)),
+        }
+        quantization_config = None
+    client.create_collection(
+        collection_name=name,
+        vectors_config=vectors_config,
+        hnsw_config=models.HnswConfigDiff(m=hnsw_m, ef_construct=ef_construct, on_disk=on_disk),
+        quantization_config=quantization_config,
+        on_disk_payload=on_disk,
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=0) if bulk_load else None
+    )
+    ensure_payload_indexes(client, name)
+
+
+def uses_reduced_vectors(client, name: str) -> bool:
+    """True if the collection was created with reduced_dim (named reduced/full vectors)"""
+    vectors = client.get_collection(name).config.params.vectors
+    return isinstance(vectors, dict) and REDUCED_VECTOR in vectors
+
+
+def ensure_payload_indexes(client, name: str):
+    """
+    Index the filterable fields so filtered searches use the payload index
+    (and the filter-aware HNSW graph) instead of checking every candidate.
+    Re-creating an existing index is a no-op.
+    """
+    for field, schema in PAYLOAD_INDEXES.items():
+        client.create_payload_index(collection_name=name, field_name=field, field_schema=schema)
+
+
+def ensure_collection(client, name: str, **config) -> bool:
+    """Create `name` unless a collection or alias with that name exists; returns True if created"""
+    if collection_exists(client, name) or alias_target(client, name):
+        return False
+    create_collection(client, name, **config)
+    return True
+
+
+def finish_bulk_load(client, name: str, indexing_threshold: int = INDEXING_THRESHOLD):
+    client.update_collection(
+        collection_name=name,
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=indexing_threshold)
+    )
+
+
+def wait_until_green(client, name: str, timeout: float = 3600.0, poll_seconds: float = 5.0) -> bool:
+    """Wait for the optimizers to finish indexing; False on timeout"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if client.get_collection(name).status == models.CollectionStatus.GREEN:
+            return True
+        time.sleep(poll_seconds)
+    return False
+
+
+def swap_alias(client, alias: str, collection_name: str):
+    """Point `alias` at `collection_name` atomically; returns the previous target"""
+    previous = alias_target(client, alias)
+    operations = []
+    if previous:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    operations.append(models.CreateAliasOperation(
+        create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias)))
+    client.update_collection_aliases(change_aliases_operations=operations)
+    return previous
+
+
+class ServingCollection:
+    """
+    The collection and chunk store a serving process should query.
+
+    Slim collections (chunk_n_load.py --chunk-store) index into one specific
+    ChunkStore, so after an alias swap the old store is wrong for the new
+    collection. When the store path contains "{collection}", the alias is
+    re-resolved every refresh_seconds and searches go to the concrete
+    collection whose store is open, keeping the two consistent across swaps.
+    """
+
+    def __init__(self, client, name: str = COLLECTION_NAME, chunk_store_path: str = None,
+                 refresh_seconds: float = 30.0):
+        self.client = client
+        self.name = name
+        self.chunk_store_path = chunk_store_path
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._resolved_at = 0.0
+        self._collection = name
+        self._chunk_store = None
+        if chunk_store_path and "{collection}" not in chunk_store_path:
+            self._chunk_store = ChunkStore(chunk_store_path)
+
+    def _per_collection_stores(self) -> bool:
+        return bool(self.chunk_store_path) and "{collection}" in self.chunk_store_path
+
+    def current(self) -> tuple:
+        """(collection name to search, ChunkStore or None)"""
+        if not self._per_collection_stores():
+            return self.name, self._chunk_store
+        with self._lock:
+            if time.monotonic() - self._resolved_at >= self.refresh_seconds:
+                self._resolved_at = time.monotonic()
+                try:
+                    collection = alias_target(self.client, self.name) or self.name
+                except Exception as e:
+                    print(f"Error resolving collection alias {self.name}: {e}")
+                    collection = self._collection
+                if collection != self._collection or self._chunk_store is None:
+                    # In-flight requests keep their reference to the previous store
+                    self._chunk_store = ChunkStore(store_path_for(self.chunk_store_path, collection))
+                    self._collection = collection
+            return self._collection, self._chunk_store
+
+
+class ServingTargets:
+    """
+    Where a serving process searches a query: the serving collection, or with
+    per-source shards (chunk_n_load.py --shard-by-source) the shards the query
+    router picks, each with its quota and chunk store. from_env() reads
+    QDRANT_SHARDS (e.g. laodong,traveloka), RAG_SHARD_QUOTAS (laodong:10,traveloka:20)
+    and CHUNK_STORE_PATH, so the API and the demo search the same way.
+    """
+
+    def __init__(self, client, name: str = COLLECTION_NAME, chunk_store_path: str = None, shards: list = None,
+                 shard_quotas: dict = None):
+        self.serving = ServingCollection(client, name, chunk_store_path)
+        self.shards = list(shards or [])
+        self.shard_quotas = shard_quotas or {}
+        self.serving_shards = {
+            source: ServingCollection(
+                client, shard_collection(name, source),
+                # Every shard needs its own store; a plain path becomes <path>/<collection>
+                chunk_store_path if not chunk_store_path or "{collection}" in chunk_store_path
+                else os.path.join(chunk_store_path, "{collection}")
+            )
+            for source in self.shards
+        }
+
+    @classmethod
+    def from_env(cls, client, name: str = COLLECTION_NAME):
+        shards = [source for source in os.getenv("QDRANT_SHARDS", "").split(",") if source]
+        shard_quotas = {
+            source: int(quota)
+            for source, quota in (item.split(":") for item in os.getenv("RAG_SHARD_QUOTAS", "").split(",") if item)
+        }
+        return cls(client, name, os.getenv("CHUNK_STORE_PATH"), shards, shard_quotas)
+
+    def resolve(self, user_query: str, top_k: int, sources: list = None) -> tuple:
+        """
+        (collection name, shards, chunk store) to search: the single serving collection,
+        or the shards picked by the query router with their quotas and stores. With
+        sharding on, shards may be empty (no configured shard serves the requested
+        sources); callers return no chunks rather than search an unsharded collection.
+        """
+        if not self.shards:
+            collection_name, chunk_store = self.serving.current()
+            return collection_name, None, chunk_store
+        shards, chunk_stores = {}, {}
+        for source in route_query(user_query, self.shards, sources):
+            collection_name, chunk_store = self.serving_shards[source].current()
+            shards[collection_name] = min(self.shard_quotas.get(source, top_k), top_k)
+            chunk_stores[collection_name] = chunk_store
+        return None, shards, chunk_stores
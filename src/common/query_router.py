@@ -0,0 +1,50 @@
+"""
+Keyword router deciding which source shards a question needs.
+
+laodong.vn is news (events, prices, policies, "what happened"), Traveloka
+articles are destination guides (where to go, what to eat, where to stay).
+A question with cues for only one of them is sent to that shard alone;
+anything ambiguous goes to every shard, so routing can only save work and
+never hides a source the question might need.
+"""
+import re
+from common.locations import fold
+
+# Cue phrases per source, written with diacritics and folded at import. Folding merges
+# words like "cấm"/"Cam Ranh" and "bão"/"bao nhiêu", so single short words are avoided
+SOURCE_CUES = {
+    "laodong": [
+        "tin tức", "mới nhất", "hôm nay", "hôm qua", "tuần này", "tháng này", "năm nay", "vừa qua",
+        "sự kiện", "lễ hội", "khai mạc", "tăng giá", "giảm giá", "quy định", "chính sách", "thông báo",
+        "lượng khách", "doanh thu", "tạm dừng", "sự cố", "tai nạn", "cơn bão", "mưa lũ", "xảy ra",
+    ],
+    "traveloka": [
+        "kinh nghiệm", "lịch trình", "đi đâu", "chơi gì", "ăn gì", "ở đâu", "địa điểm", "điểm đến",
+        "khách sạn", "homestay", "resort", "review", "đặc sản", "món ngon", "check in", "cẩm nang",
+        "gợi ý", "nên đi", "tự túc", "bao nhiêu ngày", "di chuyển", "phương tiện",
+    ],
+}
+# "2024", "2025": dated questions are about news
+YEAR_RE = re.compile(r"\b20\d\d\b")
+
+
+def _cue_pattern(cues: list):
+    return re.compile(r"\b(" + "|".join(re.escape(fold(cue)) for cue in cues) + r")\b")
+
+
+CUE_RES = {source: _cue_pattern(cues) for source, cues in SOURCE_CUES.items()}
+
+
+def route_query(user_query: str, shards: list, sources: list = None) -> list:
+    """
+    Subset of `shards` (source names) to search for this question.
+    Explicit `sources` (e.g. from a filter) win; otherwise shards whose cues
+    appear are chosen, falling back to all shards when zero or several match.
+    """
+    if sources:
+        return [shard for shard in shards if shard in sources]
+    folded = fold(user_query)
+    matched = [shard for shard in shards if shard in CUE_RES and CUE_RES[shard].search(folded)]
+    if "laodong" in shards and "laodong" not in matched and YEAR_RE.search(folded):
+        matched.append("laodong")
+    return matched if len(matched) == 1 else list(shards)
@@ -0,0 +1,201 @@
+"""
+Reranker token IDs computed at ingestion time.
+
+CrossEncoder.predict() tokenizes every (query, passage) pair on each call,
+so the same 1000-character chunks are re-tokenized by the bge-reranker
+tokenizer for every question they are a candidate for. chunk_n_load.py
+--rerank-tokens writes each chunk's passage token IDs (truncated to the
+passage budget) once; at query time PretokenizedReranker only tokenizes the
+query and assembles model inputs from the stored IDs.
+
+Entries are keyed by a 64-bit hash of the chunk text, so one store serves
+full and slim payloads, every shard and reranked text from any collection
+version loaded from the same corpus. A store directory holds:
+
+    index.npy    (key, offset, length) per chunk, sorted by key
+    tokens.bin   int32 token IDs of all chunks, concatenated (memory-mapped)
+    meta.json    tokenizer name and passage budget
+"""
+import hashlib
+import json
+import os
+import numpy as np
+import torch
+
+# Query tokens kept per pair; the rest of the model's max length is the passage budget
+MAX_QUERY_TOKENS = 64
+
+INDEX_DTYPE = np.dtype([
+    ("key", np.uint64),     # text_key() of the chunk text
+    ("offset", np.int64),   # first token in tokens.bin
+    ("length", np.int32),   # number of tokens
+])
+
+
+def text_key(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def max_model_length(tokenizer, max_length: int = None) -> int:
+    """Pair length limit: max_length if given, else the tokenizer's, capped at 512"""
+    return min(max_length or tokenizer.model_max_length, 512)
+
+
+def passage_budget(tokenizer, max_length: int = None, max_query_tokens: int = MAX_QUERY_TOKENS) -> int:
+    """Passage tokens that fit next to a max_query_tokens query and the pair's special tokens"""
+    return max_model_length(tokenizer, max_length) - max_query_tokens - tokenizer.num_special_tokens_to_add(pair=True)
+
+
+class TokenStoreWriter:
+    """
+    Tokenize chunk texts with the reranker tokenizer, then close() to write
+    the store directory. An existing store is extended, so incremental loads
+    (chunk_n_load.py --sources ...) keep the chunks stored before; it must
+    have been built with the same tokenizer and passage budget.
+    """
+
+    def __init__(self, path: str, tokenizer, max_length: int = None, max_query_tokens: int = MAX_QUERY_TOKENS):
+        self.path = path
+        self.tokenizer = tokenizer
+        self.max_passage_tokens = passage_budget(tokenizer, max_length, max_query_tokens)
+        os.makedirs(path, exist_ok=True)
+        self.rows = []
+        self._seen = set()
+        self._offset = 0
+        tokens_path = os.path.join(path, "tokens.bin")
+        if os.path.exists(os.path.join(path, "meta.json")):
+            with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("tokenizer") != tokenizer.name_or_path or \
+                    meta.get("max_passage_tokens") != self.max_passage_tokens:
+                raise ValueError(f"Token store {path} was built with {meta.get('tokenizer')} "
+                                 f"({meta.get('max_passage_tokens')} passage tokens); "
+                                 f"use a new path for {tokenizer.name_or_path} ({self.max_passage_tokens})")
+            self.rows = [tuple(row) for row in np.load(os.path.join(path, "index.npy")).tolist()]
+            self._seen = {row[0] for row in self.rows}
+            self._offset = meta["tokens"]
+            # Drop tokens an interrupted run wrote after the last close()
+            self._tokens_file = open(tokens_path, "r+b")
+            self._tokens_file.truncate(self._offset * np.dtype(np.int32).itemsize)
+            self._tokens_file.seek(0, os.SEEK_END)
+        else:
+            self._tokens_file = open(tokens_path, "wb")
+
+    def add_texts(self, texts: list):
+        """Tokenize and store texts not stored yet (one batched tokenizer call)"""
+        texts = [text for text in dict.fromkeys(texts) if text_key(text) not in self._seen]
+        if not texts:
+            return
+        encoded = self.tokenizer(texts, add_special_tokens=False, truncation=True,
+                                 max_length=self.max_passage_tokens)["input_ids"]
+        for text, ids in zip(texts, encoded):
+            key = text_key(text)
+            self._seen.add(key)
+            self._tokens_file.write(np.asarray(ids, dtype=np.int32).tobytes())
+            self.rows.append((key, self._offset, len(ids)))
+            self._offset += len(ids)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def close(self):
+        self._tokens_file.close()
+        index = np.array(self.rows, dtype=INDEX_DTYPE)
+        np.save(os.path.join(self.path, "index.npy"), np.sort(index, order="key"))
+        with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"tokenizer": self.tokenizer.name_or_path, "max_passage_tokens": self.max_passage_tokens,
+                       "count": len(self.rows), "tokens": self._offset}, f)
+
+
+class TokenStore:
+    """Read-only, memory-mapped view of a token store directory"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.index = np.load(os.path.join(path, "index.npy"))
+        self.tokens = np.memmap(os.path.join(path, "tokens.bin"), dtype=np.int32, mode="r") \
+            if self.meta["tokens"] else np.zeros(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, text: str):
+        """Stored passage token IDs of `text`, or None"""
+        key = np.uint64(text_key(text))
+        position = int(np.searchsorted(self.index["key"], key))
+        if position == len(self.index) or self.index["key"][position] != key:
+            return None
+        row = self.index[position]
+        return self.tokens[int(row["offset"]):int(row["offset"]) + int(row["length"])].tolist()
+
+
+class PretokenizedReranker:
+    """
+    Drop-in for CrossEncoder.predict() that reads passage token IDs from a
+    TokenStore. Pairs are assembled with the tokenizer's own special tokens
+    (prepare_for_model), sorted by length and padded per batch, so each
+    batch only pads to its own longest pair. Passages missing from the
+    store are tokenized on the fly.
+    """
+
+    def __init__(self, cross_encoder, token_store: TokenStore, max_query_tokens: int = MAX_QUERY_TOKENS):
+        self.cross_encoder = cross_encoder
+        self.model = cross_encoder.model
+        self.tokenizer = cross_encoder.tokenizer
+        self.token_store = token_store
+        self.max_query_tokens = max_query_tokens
+        self.max_length = max_model_length(self.tokenizer, getattr(cross_encoder, "max_length", None))
+        self.max_passage_tokens = self.max_length - max_query_tokens - \
+            self.tokenizer.num_special_tokens_to_add(pair=True)
+        # Same score scale as CrossEncoder.predict() (sigmoid for single-label rerankers)
+        self.activation = getattr(cross_encoder, "activation_fn", None) or \
+            getattr(cross_encoder, "default_activation_function", None)
+        self.hits = 0
+        self.misses = 0
+        if token_store.meta.get("tokenizer") != self.tokenizer.name_or_path:
+            raise ValueError(f"Token store {token_store.path} was built with {token_store.meta.get('tokenizer')}, "
+                             f"not {self.tokenizer.name_or_path}")
+
+    def _tokenize(self, text: str, max_tokens: int) -> list:
+        return self.tokenizer(text, add_special_tokens=False, truncation=True, max_length=max_tokens)["input_ids"]
+
+    def passage_ids(self, text: str) -> list:
+        ids = self.token_store.get(text)
+        if ids is None:
+            self.misses += 1
+            return self._tokenize(text, self.max_passage_tokens)
+        self.hits += 1
+        return ids
+
+    def features(self, pairs: list) -> list:
+        """Model inputs (input_ids, attention_mask, ...) per pair, unpadded"""
+        queries = {}
+        features = []
+        for query, text in pairs:
+            if query not in queries:
+                queries[query] = self._tokenize(query, self.max_query_tokens)
+            features.append(self.tokenizer.prepare_for_model(
+                queries[query], self.passage_ids(text), truncation="only_second", max_length=self.max_length))
+        return features
+
+    def predict(self, pairs: list, batch_size: int = 32, **kwargs) -> np.ndarray:
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        if not pairs:
+            return scores
+        features = self.features(pairs)
+        device = next(self.model.parameters()).device
+        order = sorted(range(len(features)), key=lambda i: len(features[i]["input_ids"]))
+        self.model.eval()
+        with torch.inference_mode():
+            for start in range(0, len(order), batch_size):
+                batch_indexes = order[start:start + batch_size]
+                batch = self.tokenizer.pad([features[i] for i in batch_indexes], padding=True, return_tensors="pt")
+                logits = self.model(**{name: tensor.to(device) for name, tensor in batch.items()}).logits
+                if logits.shape[-1] == 1:
+                    logits = logits[:, 0]
+                if self.activation is not None:
+                    logits = self.activation(logits)
+                scores[batch_indexes] = logits.float().cpu().numpy()
+        return scores
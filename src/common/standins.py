@@ -0,0 +1,105 @@
+"""
+Local stand-ins for the external dependencies of the RAG path, for load tests
+and offline runs on a single box.
+
+StubVectorStore answers qdrant_client-style search()/search_batch() calls by
+brute-force cosine search over an in-memory matrix; StubEncoder and
+StubReranker mimic SentenceTransformer.encode and CrossEncoder.predict with
+cheap hashed features. Each takes a latency and jitter (milliseconds) so the
+pipeline can be exercised with realistic stage timings and no network or GPU.
+"""
+import hashlib
+import random
+import re
+import time
+from types import SimpleNamespace
+import numpy as np
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _sleep(latency_ms: float, jitter_ms: float):
+    delay = latency_ms + random.uniform(-jitter_ms, jitter_ms)
+    if delay > 0:
+        time.sleep(delay / 1000)
+
+
+def _words(text: str) -> list:
+    return WORD_RE.findall(text.lower())
+
+
+class StubEncoder:
+    """Hashed bag-of-words embeddings with the bi-encoder's interface"""
+
+    def __init__(self, dim: int = 768, latency_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.dim = dim
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in _words(text):
+            bucket = int(hashlib.md5(word.encode("utf-8")).hexdigest()[:8], 16)
+            vector[bucket % self.dim] += 1.0 if bucket & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, sentences, device=None, batch_size: int = 32, **kwargs):
+        _sleep(self.latency_ms, self.jitter_ms)
+        if isinstance(sentences, str):
+            return self._embed(sentences)
+        return np.stack([self._embed(s) for s in sentences]) if sentences else np.zeros((0, self.dim), np.float32)
+
+
+class StubReranker:
+    """Word-overlap scores with the cross-encoder's interface; latency is per pair"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+
+    def predict(self, pairs, batch_size: int = 32, **kwargs):
+        _sleep(self.latency_ms * len(pairs), self.jitter_ms)
+        scores = []
+        for query, passage in pairs:
+            query_words = set(_words(query))
+            overlap = len(query_words & set(_words(passage)))
+            scores.append(overlap / (len(query_words) or 1))
+        return np.array(scores, dtype=np.float32)
+
+
+class StubVectorStore:
+    """In-memory stand-in for QdrantClient search over a single collection"""
+
+    def __init__(self, payloads: list, vectors: np.ndarray, latency_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.payloads = payloads
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = vectors / np.where(norms == 0, 1, norms)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+
+    @classmethod
+    def from_chunks(cls, chunks: list, encoder, **kwargs):
+        """Build from chunk payload dicts (each with a "text" key)"""
+        vectors = encoder.encode([c["text"] for c in chunks])
+        return cls(chunks, np.asarray(vectors, dtype=np.float32), **kwargs)
+
+    def _search(self, query_vector, limit: int, with_payload=True):
+        scores = self.vectors @ np.asarray(query_vector, dtype=np.float32)
+        top = np.argsort(-scores)[:limit]
+        return [
+            SimpleNamespace(id=int(i), score=float(scores[i]), payload=self.payloads[i] if with_payload else None)
+            for i in top
+        ]
+
+    def search(self, collection_name: str, query_vector, limit: int = 10, with_payload=True, **kwargs):
+        _sleep(self.latency_ms, self.jitter_ms)
+        return self._search(query_vector, limit, with_payload)
+
+    def search_batch(self, collection_name: str, requests: list, **kwargs):
+        # One round trip for the whole batch
+        _sleep(self.latency_ms, self.jitter_ms)
+        return [self._search(r.vector, r.limit, r.with_payload) for r in requests]
@@ -0,0 +1,125 @@
+"""
+Sentence-aware chunker that measures length in the embedding model's tokens.
+
+The character splitter in chunk_n_load.py produces 1000-character chunks,
+but the Vietnamese bi-encoder truncates its input at max_seq_length tokens,
+so the tail of long chunks is stored and reranked without ever being
+embedded. TokenChunker packs whole sentences up to the model's token budget,
+carries a token-counted overlap between chunks, and only cuts inside a
+sentence when a single sentence is over budget.
+
+Token counts are summed from per-word counts kept in a bounded cache: the
+PhoBERT tokenizer behind the bi-encoder applies BPE to each whitespace word
+independently, so the sum is exact for it (and a close estimate for other
+tokenizers) while each distinct word is tokenized only once.
+"""
+import re
+from collections import OrderedDict
+
+# Candidate boundaries: sentence punctuation (plus closing quotes/brackets) followed by whitespace, or newlines
+BOUNDARY_RE = re.compile(r'[.!?…]+["”’)\]]*\s+|\n+')
+LAST_WORD_RE = re.compile(r"(\w+)\.$", re.UNICODE)
+
+# Abbreviations that end with a period without ending the sentence ("TP. Hồ Chí Minh", "PGS. TS.")
+ABBREVIATIONS = {
+    "tp", "tt", "tx", "q", "p", "h", "ths", "ts", "pgs", "gs", "bs", "ks", "th", "st", "mr", "ms", "dr", "vd", "tr",
+}
+
+
+def split_sentences(text: str) -> list:
+    """Split Vietnamese text into sentences, keeping abbreviations and lowercase continuations intact"""
+    sentences, start = [], 0
+    for match in BOUNDARY_RE.finditer(text):
+        end = match.end()
+        if "\n" not in match.group():
+            following = text[end:end + 1]
+            if following and following.islower():
+                continue
+            last_word = LAST_WORD_RE.search(text[start:match.start() + 1])
+            if last_word and last_word.group(1).lower() in ABBREVIATIONS:
+                continue
+        sentence = text[start:end].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = end
+    tail = text[start:].strip()
+    if tail:
+        sentences.append(tail)
+    return sentences
+
+
+class TokenChunker:
+    """Drop-in replacement for the text splitter's split_text() with token-based lengths"""
+
+    def __init__(self, tokenizer, max_tokens: int, overlap_tokens: int = None, cache_size: int = 200_000):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        # Same 20% overlap ratio as the 1000/200 character splitter
+        self.overlap_tokens = max_tokens // 5 if overlap_tokens is None else overlap_tokens
+        self.cache_size = cache_size
+        self._word_tokens = OrderedDict()
+
+    @classmethod
+    def from_model(cls, model, overlap_tokens: int = None, **kwargs):
+        """Budget from a SentenceTransformer: max_seq_length minus the CLS/SEP tokens"""
+        return cls(model.tokenizer, model.max_seq_length - 2, overlap_tokens, **kwargs)
+
+    def _count_words(self, words: list) -> list:
+        missing = [w for w in dict.fromkeys(words) if w not in self._word_tokens]
+        if missing:
+            encoded = self.tokenizer(missing, add_special_tokens=False)["input_ids"]
+            for word, ids in zip(missing, encoded):
+                self._word_tokens[word] = len(ids)
+            while len(self._word_tokens) > self.cache_size:
+                self._word_tokens.popitem(last=False)
+        return [self._word_tokens[w] if w in self._word_tokens
+                else len(self.tokenizer(w, add_special_tokens=False)["input_ids"]) for w in words]
+
+    def count_tokens(self, text: str) -> int:
+        return sum(self._count_words(text.split()))
+
+    def _pieces(self, text: str):
+        """(text, token count) per sentence; over-budget sentences are cut into word windows"""
+        for sentence in split_sentences(text):
+            words = sentence.split()
+            counts = self._count_words(words)
+            total = sum(counts)
+            if total <= self.max_tokens:
+                yield sentence, total
+                continue
+            window, window_tokens = [], 0
+            for word, count in zip(words, counts):
+                if window and window_tokens + count > self.max_tokens:
+                    yield " ".join(window), window_tokens
+                    window, window_tokens = [], 0
+                window.append(word)
+                window_tokens += count
+            if window:
+                yield " ".join(window), window_tokens
+
+    def split_text(self, text: str) -> list:
+        chunks = []
+        current, current_tokens = [], 0
+        for piece, tokens in self._pieces(text):
+            if current and current_tokens + tokens > self.max_tokens:
+                chunks.append(" ".join(p for p, _ in current))
+                # Carry trailing sentences into the next chunk, up to the overlap budget
+                carried, carried_tokens = [], 0
+                for previous in reversed(current):
+                    if carried_tokens + previous[1] > self.overlap_tokens \
+                            or carried_tokens + previous[1] + tokens > self.max_tokens:
+                        break
+                    carried.insert(0, previous)
+                    carried_tokens += previous[1]
+                current, current_tokens = carried, carried_tokens
+            current.append((piece, tokens))
+            current_tokens += tokens
+        if current:
+            chunks.append(" ".join(p for p, _ in current))
+        return chunks
+
+    def iter_chunks(self, texts):
+        """Stream (text index, chunk index, chunk) over an iterable of texts"""
+        for text_index, text in enumerate(texts):
+            for chunk_index, chunk in enumerate(self.split_text(text)):
+                yield text_index, chunk_index, chunk
@@ -5,6 +5,12 @@ from crawl4ai.async_configs import BrowserConfig, CrawlerRunConfig
 from datetime import datetime
 from bs4 import BeautifulSoup
 import time
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.profiling import add_profile_arguments, start_profiling
 import json
 
 async def get_article_urls(crawler, page_url):
@@ -112,7 +118,12 @@ async def main():
         print("Articles have been saved to articles.json")
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
+    parser = argparse.ArgumentParser(description="Crawl laodong.vn travel articles")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    # Sampled Python stacks only: crawling runs no torch models
+    start_profiling("crawl_art_detail", enabled=args.profile or None, seconds=args.profile_seconds, torch_ops=False)
+    asyncio.run(main())
 
 
 
@@ -1,11 +1,26 @@
-import json
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from sentence_transformers import SentenceTransformer
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
+import argparse
+import time
 import uuid
+import numpy as np
 import os
+import sys
 from dotenv import load_dotenv
+from normalize import iter_records
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.chunk_store import ChunkStoreWriter
+from common.inference_profile import apply_inference_profile, inference_device, load_inference_profile
+from common.locations import article_locations
+from common.profiling import add_profile_arguments, profiled, start_profiling
+from common.projection import FULL_VECTOR, REDUCED_VECTOR, PCAProjection
+from common.qdrant_collections import (COLLECTION_NAME, ensure_collection, ensure_payload_indexes,
+                                       shard_collection, store_path_for)
+from common.rerank_tokens import TokenStoreWriter
+from common.token_chunker import TokenChunker
 
 # Load environment variables
 load_dotenv()
@@ -18,8 +33,18 @@ text_splitter = RecursiveCharacterTextSplitter(
     separators=["\n\n", "\n", ". ", "! ", "? "]
 )
 
+# Inference device: RAG_DEVICE, else the device the INFERENCE_PROFILE was tuned on, else cuda
+inference_profile = load_inference_profile()
+DEVICE = inference_device(inference_profile)
+
 # Initialize Vietnamese bi-encoder model
-model = SentenceTransformer('bkai-foundation-models/vietnamese-bi-encoder').to('cuda')
+model = SentenceTransformer('bkai-foundation-models/vietnamese-bi-encoder', device=DEVICE)
+
+# Threads, replicas and batch size tuned by evaluation/autotune.py (INFERENCE_PROFILE), if any
+model = apply_inference_profile(model, "embedding", inference_profile, set_threads=True)
+
+# Reranker whose token IDs --rerank-tokens precomputes; must match the serving reranker
+RERANKER_MODEL = 'BAAI/bge-reranker-base'
 
 # Initialize Qdrant client with cloud configuration
 client = QdrantClient(
@@ -27,92 +52,231 @@ client = QdrantClient(
     api_key=os.getenv("QDRANT_API_KEY")
 )
 
-# Create collection if it doesn't exist
-try:
-    client.create_collection(
-        collection_name="articles2",
-        vectors_config=models.VectorParams(
-            size=768,  # Size of the embeddings from vietnamese-bi-encoder
-            distance=models.Distance.COSINE
-        )
-    )
-except Exception as e:
-    print(f"Collection might already exist: {e}")
-
-def process_articles():
-    with open("./data/traveloka_articles.json", "r", encoding="utf-8") as f:
-        articles = json.load(f)
-    
-    for article in articles:
-        metadata = article.get('metadata', {})
-        
-        # Combine content paragraphs
-        content = " ".join(article.get('content', []))
-        
-        # Split text into chunks
-        chunks = text_splitter.split_text(content)
-        
-        # Create embeddings and store in Qdrant
-        for i, chunk in enumerate(chunks):
-            embedding = model.encode(chunk, device='cuda')
-            
+def get_splitter(kind: str = "chars"):
+    """The 1000/200 character splitter, or (kind "tokens") a TokenChunker sized to the bi-encoder"""
+    if kind == "tokens":
+        return TokenChunker.from_model(model)
+    return text_splitter
+
+def fit_projection(input_file, dim, splitter=None, sample_articles=2000, sources=None):
+    """Fit a PCAProjection on the embeddings of the first sample_articles articles"""
+    splitter = splitter or text_splitter
+    vectors, seen = [], 0
+    for article in iter_records(input_file):
+        if sources and article.get('metadata', {}).get('source', '') not in sources:
+            continue
+        chunks = splitter.split_text(" ".join(article.get('content', [])))
+        if chunks:
+            vectors.append(model.encode(chunks, device=DEVICE))
+        seen += 1
+        if seen >= sample_articles:
+            break
+    projection = PCAProjection.fit(np.concatenate(vectors), dim)
+    print(f"Fitted {dim}-dim projection on {sum(len(v) for v in vectors)} chunks "
+          f"({projection.explained_variance:.1%} of variance kept)")
+    return projection
+
+def load_projection(path, dim, input_file, splitter=None, sources=None, refit=False):
+    """Reuse the projection saved at path (serving must use the same one), fitting and saving it if needed"""
+    if os.path.exists(path) and not refit:
+        projection = PCAProjection.load(path)
+        if projection.dim != dim:
+            raise ValueError(f"{path} holds a {projection.dim}-dim projection; pass --refit-projection to replace it")
+        return projection
+    projection = fit_projection(input_file, dim, splitter, sources=sources)
+    projection.save(path)
+    return projection
+
+def open_token_store(path):
+    """TokenStoreWriter for the reranker's tokenizer (see common/rerank_tokens.py)"""
+    from transformers import AutoTokenizer
+    return TokenStoreWriter(path, AutoTokenizer.from_pretrained(RERANKER_MODEL))
+
+def article_points(metadata, chunks, embeddings, reduced=None, store=None):
+    """
+    Qdrant points for one article's chunks. With a ChunkStoreWriter the text goes
+    to the store and payloads stay slim; `reduced` holds projected vectors.
+    """
+    # Stable IDs: reloading an article overwrites its points instead of duplicating them
+    url = metadata.get('url', '')
+    article_id = str(uuid.uuid5(uuid.NAMESPACE_URL, url)) if url else str(uuid.uuid4())
+
+    # Indexed filter fields (see PAYLOAD_INDEXES), stored on every chunk of the article
+    filter_fields = {
+        "source": metadata.get('source', ''),
+        "timestamp": metadata.get('timestamp'),
+        "locations": article_locations(metadata.get('title', ''), url)
+    }
+    if store is not None:
+        article_index = store.add_article({
+            "article_id": article_id,
+            "title": metadata.get('title', ''),
+            "time": metadata.get('time', ''),
+            "timestamp": metadata.get('timestamp'),
+            "url": metadata.get('url', ''),
+            "source": metadata.get('source', ''),
+            "locations": filter_fields["locations"]
+        })
+
+    points = []
+    for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+        if store is not None:
+            # Slim payload: text, title and url live in the local store
+            point_id = store.add_chunk(article_index, i, chunk)
             chunk_metadata = {
-                "article_id": str(uuid.uuid4()),
+                "article_id": article_id,
                 "chunk_index": i,
-                "text": chunk,
-                "title": metadata.get('title', ''),
                 "time": metadata.get('time', ''),
-                "url": metadata.get('url', '')
+                **filter_fields
             }
-            
-            client.upsert(
-                collection_name="articles2",
-                points=[
-                    models.PointStruct(
-                        id=str(uuid.uuid4()),
-                        vector=embedding,
-                        payload=chunk_metadata
-                    )
-                ]
-            )
-
-    # Process articles_transformed.json
-    with open("./data/articles_transformed.json", "r", encoding="utf-8") as f:
-        articles = json.load(f)
-    
-    for article in articles:
-        metadata = article.get('metadata', {})
-        
-        # Combine content paragraphs
-        content = " ".join(article.get('content', []))
-        
-        # Split text into chunks
-        chunks = text_splitter.split_text(content)
-        
-        # Create embeddings and store in Qdrant
-        for i, chunk in enumerate(chunks):
-            embedding = model.encode(chunk, device='cuda')
-            
+        else:
+            point_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{article_id}:{i}"))
             chunk_metadata = {
-                "article_id": str(uuid.uuid4()),
+                "article_id": article_id,
                 "chunk_index": i,
                 "text": chunk,
                 "title": metadata.get('title', ''),
                 "time": metadata.get('time', ''),
-                "url": metadata.get('url', '')
+                "url": metadata.get('url', ''),
+                **filter_fields
             }
-            
-            client.upsert(
-                collection_name="articles2",
-                points=[
-                    models.PointStruct(
-                        id=str(uuid.uuid4()),
-                        vector=embedding,
-                        payload=chunk_metadata
-                    )
-                ]
+        vector = embedding.tolist()
+        if reduced is not None:
+            vector = {REDUCED_VECTOR: reduced[i].tolist(), FULL_VECTOR: vector}
+        points.append(
+            models.PointStruct(
+                id=point_id,
+                vector=vector,
+                payload=chunk_metadata
             )
+        )
+    return points
+
+def require_empty(collection_name):
+    """Slim points are numbered 0..N-1 with their chunk store rows, so they only go into an empty collection"""
+    if client.count(collection_name=collection_name, exact=True).count:
+        raise ValueError(f"{collection_name} already holds points; a chunk store needs a new, empty collection "
+                         f"(manage_collection.py build --chunk-store-root creates one)")
+
+def process_articles(input_file="./data/articles_normalized.jsonl", chunk_store_path=None, splitter=None,
+                     collection_name=COLLECTION_NAME, pause_seconds=0.0, shard_by_source=False, sources=None,
+                     projection=None, token_store=None):
+    """
+    Chunk, embed and upsert every normalized article into collection_name.
+    With chunk_store_path, chunk text and article metadata go to a local
+    ChunkStore and Qdrant points carry only their store ID and filterable fields;
+    the target collections must be empty (see require_empty()).
+    pause_seconds between upserts throttles background rebuilds next to live traffic.
+    With shard_by_source each article goes to its source's shard (articles2_laodong,
+    created on first use) with its own chunk store; `sources` limits the load to those sources.
+    With a projection (see common/projection.py) points carry reduced and full named vectors.
+    With a token_store (TokenStoreWriter), each chunk's reranker token IDs are stored
+    for PretokenizedReranker; the caller closes it.
+    """
+    splitter = splitter or text_splitter
+    stores = {}
+    ready_shards = set()
+
+    # Stores are written even if the load fails midway, so every upserted point keeps its row
+    try:
+        # Articles are produced by normalize.py, one {metadata, content} record per line
+        for article in iter_records(input_file):
+            metadata = article.get('metadata', {})
+            source = metadata.get('source', '')
+            if sources and source not in sources:
+                continue
+
+            target = collection_name
+            if shard_by_source:
+                target = shard_collection(collection_name, source or "unknown")
+                if target not in ready_shards:
+                    if ensure_collection(client, target, reduced_dim=projection.dim if projection else None):
+                        print(f"Created shard collection {target}")
+                    ensure_payload_indexes(client, target)
+                    ready_shards.add(target)
+            store = None
+            if chunk_store_path:
+                if target not in stores:
+                    require_empty(target)
+                    path = chunk_store_path
+                    if shard_by_source or "{collection}" in path:
+                        path = store_path_for(chunk_store_path, target)
+                    stores[target] = ChunkStoreWriter(path)
+                store = stores[target]
+        
+            # Combine content paragraphs
+            content = " ".join(article.get('content', []))
+        
+            # Split text into chunks
+            with profiled("chunk"):
+                chunks = splitter.split_text(content)
+            if not chunks:
+                continue
+        
+            # Create embeddings for the whole article at once
+            with profiled("encode"):
+                embeddings = model.encode(chunks, device=DEVICE)
+            if token_store is not None:
+                with profiled("rerank_tokens"):
+                    token_store.add_texts(chunks)
+            reduced = projection.transform(embeddings) if projection is not None else None
+
+            points = article_points(metadata, chunks, embeddings, reduced, store)
+
+            with profiled("upsert"):
+                client.upsert(
+                    collection_name=target,
+                    points=points
+                )
+            if pause_seconds:
+                time.sleep(pause_seconds)
+    finally:
+        for target, store in stores.items():
+            store.close()
+            print(f"Chunk store for {target} with {len(store)} chunks written to {store.path}")
 
 if __name__ == "__main__":
-    process_articles()
+    parser = argparse.ArgumentParser(description="Chunk, embed and load normalized articles into Qdrant")
+    parser.add_argument("--input", default="./data/articles_normalized.jsonl")
+    parser.add_argument("--collection", default=COLLECTION_NAME,
+                        help="Collection or alias to load into (default: QDRANT_COLLECTION or articles2)")
+    parser.add_argument("--chunk-store", default=os.getenv("CHUNK_STORE_PATH"),
+                        help="Write chunk text to this local store and keep Qdrant payloads slim")
+    parser.add_argument("--chunker", choices=["chars", "tokens"], default=os.getenv("CHUNKER", "chars"),
+                        help="Split by characters, or by bi-encoder tokens on sentence boundaries")
+    parser.add_argument("--shard-by-source", action="store_true",
+                        help="Load each source into its own <collection>_<source> shard")
+    parser.add_argument("--sources", help="Comma-separated sources to load (default: all)")
+    parser.add_argument("--reduce-dim", type=int,
+                        help="Search PCA-reduced vectors of this size and rescore with the full ones (new collections)")
+    parser.add_argument("--projection", default=os.getenv("VECTOR_PROJECTION", "./data/projection.npz"),
+                        help="Where the fitted projection is saved; serving loads it via VECTOR_PROJECTION")
+    parser.add_argument("--refit-projection", action="store_true",
+                        help="Replace the saved projection; every collection using it must be rebuilt")
+    parser.add_argument("--rerank-tokens",
+                        help="Write reranker token IDs of every chunk to this store (serving: RERANK_TOKEN_STORE)")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    # Profile the first RAG_PROFILE_SECONDS of the load with --profile or RAG_PROFILE=1
+    start_profiling("chunk_n_load", enabled=args.profile or None, seconds=args.profile_seconds)
+
+    splitter = get_splitter(args.chunker)
+    sources = args.sources.split(",") if args.sources else None
+    projection = load_projection(args.projection, args.reduce_dim, args.input, splitter, sources,
+                                 args.refit_projection) if args.reduce_dim else None
+
+    # Create collection if it doesn't exist; any other failure should stop the load
+    if not args.shard_by_source:
+        if ensure_collection(client, args.collection, reduced_dim=args.reduce_dim):
+            print(f"Created collection {args.collection}")
+        ensure_payload_indexes(client, args.collection)
+
+    token_store = open_token_store(args.rerank_tokens) if args.rerank_tokens else None
+    process_articles(args.input, args.chunk_store, splitter, args.collection,
+                     shard_by_source=args.shard_by_source, sources=sources, projection=projection,
+                     token_store=token_store)
+    if token_store is not None:
+        token_store.close()
+        print(f"Reranker tokens for {len(token_store)} chunks written to {token_store.path}")
     print("Articles processed and stored in Qdrant Cloud successfully!")
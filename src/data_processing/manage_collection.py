@@ -0,0 +1,238 @@
+"""
+Blue/green re-indexing behind a collection alias.
+
+    # Build a new version next to the live one, validate it and swap the alias
+    python src/data_processing/manage_collection.py build --chunk-store-root ./data/chunk_stores \\
+        --quantization int8 --on-disk --pause-ms 50 --swap
+
+    python src/data_processing/manage_collection.py status
+    python src/data_processing/manage_collection.py validate articles2_v20250610_120000
+    python src/data_processing/manage_collection.py swap articles2_v20250610_120000
+    python src/data_processing/manage_collection.py cleanup --keep 2
+
+    # Rebuild one source shard on its own (serving with QDRANT_SHARDS=laodong,traveloka)
+    python src/data_processing/manage_collection.py --alias articles2_laodong build --sources laodong --swap
+
+The serving path reads QDRANT_COLLECTION (default "articles2"); point it at
+the alias. With slim payloads set CHUNK_STORE_PATH=./data/chunk_stores/{collection}
+so each version's chunk store is picked up together with the collection.
+
+Builds upload with HNSW indexing deferred, then index once and wait for the
+collection to turn green before validation, so the live collection never
+shares its search path with a half-built one.
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+from qdrant_client.http import models
+from chunk_n_load import DEVICE, client, model, process_articles, get_splitter, load_projection, open_token_store
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.projection import REDUCED_VECTOR, PCAProjection
+from common.qdrant_collections import (COLLECTION_NAME, alias_target, collection_exists, create_collection,
+                                       finish_bulk_load, swap_alias, uses_reduced_vectors, versioned_name,
+                                       wait_until_green)
+
+# Used when no --smoke-queries file is given
+DEFAULT_SMOKE_QUERIES = [
+    "Hà Nội có những địa điểm vui chơi giải trí nào?",
+    "Kinh nghiệm du lịch Đà Lạt tự túc",
+    "Những món ăn đặc sản ở Huế",
+    "Thời điểm nào nên đi Phú Quốc?",
+    "Giá vé tham quan vịnh Hạ Long",
+]
+
+
+def load_smoke_queries(path: str) -> list:
+    if not path:
+        return DEFAULT_SMOKE_QUERIES
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def versions(alias: str) -> list:
+    """Versioned collections built for this alias, oldest first"""
+    return sorted(c.name for c in client.get_collections().collections if c.name.startswith(f"{alias}_v"))
+
+
+def top_articles(collection: str, query_embedding, top_k: int, projection=None) -> tuple:
+    """(article IDs of the top hits, search seconds); reduced collections are searched with the projection"""
+    query_vector = query_embedding.tolist()
+    if uses_reduced_vectors(client, collection):
+        if projection is None:
+            raise ValueError(f"{collection} uses reduced vectors; pass --projection")
+        query_vector = models.NamedVector(name=REDUCED_VECTOR, vector=projection.transform(query_embedding).tolist())
+    start = time.perf_counter()
+    hits = client.search(
+        collection_name=collection,
+        query_vector=query_vector,
+        limit=top_k,
+        with_payload=["article_id"]
+    )
+    elapsed = time.perf_counter() - start
+    return [hit.payload.get("article_id") for hit in hits if hit.payload], elapsed
+
+
+def validate(collection: str, alias: str, queries: list, top_k: int = 10, min_overlap: float = 0.3,
+             max_latency_ms: float = 200.0, min_count_ratio: float = 0.9, projection=None) -> bool:
+    """
+    Smoke-test a candidate against the live collection: every query returns
+    hits, p95 search latency stays under max_latency_ms, the point count is
+    at least min_count_ratio of live, and on average min_overlap of live's
+    top_k articles are still found. Checks against live are skipped when
+    there is nothing live yet.
+    """
+    live = alias_target(client, alias) or (alias if collection_exists(client, alias) else None)
+    problems = []
+
+    count = client.count(collection_name=collection, exact=True).count
+    if live:
+        live_count = client.count(collection_name=live, exact=True).count
+        if live_count and count < min_count_ratio * live_count:
+            problems.append(f"{count} points vs {live_count} live (< {min_count_ratio:.0%})")
+
+    latencies, overlaps = [], []
+    for query in queries:
+        query_embedding = model.encode(query, device=DEVICE)
+        articles, elapsed = top_articles(collection, query_embedding, top_k, projection)
+        latencies.append(elapsed)
+        if not articles:
+            problems.append(f"no hits for {query!r}")
+        if live:
+            live_articles, _ = top_articles(live, query_embedding, top_k, projection)
+            if live_articles:
+                overlaps.append(len(set(articles) & set(live_articles)) / len(set(live_articles)))
+
+    latencies.sort()
+    p95_ms = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] * 1000 if latencies else 0.0
+    if p95_ms > max_latency_ms:
+        problems.append(f"p95 search latency {p95_ms:.1f}ms > {max_latency_ms}ms")
+    mean_overlap = sum(overlaps) / len(overlaps) if overlaps else None
+    if mean_overlap is not None and mean_overlap < min_overlap:
+        problems.append(f"top-{top_k} article overlap with live {mean_overlap:.2f} < {min_overlap}")
+
+    overlap_text = f"{mean_overlap:.2f}" if mean_overlap is not None else "n/a"
+    print(f"{collection}: {count} points, p95 search {p95_ms:.1f}ms, overlap with {live or 'nothing'} {overlap_text}")
+    for problem in problems:
+        print(f"  FAILED: {problem}")
+    return not problems
+
+
+def build(args) -> str:
+    name = args.name or versioned_name(args.alias)
+    splitter = get_splitter(args.chunker)
+    sources = args.sources.split(",") if args.sources else None
+    projection = load_projection(args.projection, args.reduce_dim, args.input, splitter, sources,
+                                 args.refit_projection) if args.reduce_dim else None
+    create_collection(client, name, hnsw_m=args.hnsw_m, ef_construct=args.ef_construct,
+                      quantization=args.quantization, on_disk=args.on_disk, bulk_load=True,
+                      reduced_dim=args.reduce_dim)
+    print(f"Created {name}; loading {args.input}...")
+    chunk_store_path = os.path.join(args.chunk_store_root, name) if args.chunk_store_root else None
+    token_store = open_token_store(os.path.join(args.rerank_tokens_root, name)) if args.rerank_tokens_root else None
+    process_articles(args.input, chunk_store_path, splitter, name, args.pause_ms / 1000,
+                     sources=sources, projection=projection, token_store=token_store)
+    if token_store is not None:
+        token_store.close()
+        print(f"Reranker tokens written to {token_store.path}")
+
+    finish_bulk_load(client, name)
+    print(f"Upload done; waiting for {name} to finish indexing...")
+    if not wait_until_green(client, name, timeout=args.index_timeout):
+        raise RuntimeError(f"{name} did not finish indexing within {args.index_timeout}s")
+    return name
+
+
+def projection_for(args):
+    return PCAProjection.load(args.projection) if os.path.exists(args.projection) else None
+
+
+def swap(args, name: str):
+    if not args.force and not validate(name, args.alias, load_smoke_queries(args.smoke_queries), args.top_k,
+                                       args.min_overlap, args.max_latency_ms, args.min_count_ratio,
+                                       projection_for(args)):
+        print(f"Not swapping {args.alias} to {name}; fix the problems above or pass --force")
+        sys.exit(1)
+    if collection_exists(client, args.alias):
+        # An alias cannot shadow a real collection of the same name
+        print(f"{args.alias} is a collection, not an alias. Serve from a new alias name (QDRANT_COLLECTION) "
+              f"or delete the legacy collection first.")
+        sys.exit(1)
+    previous = swap_alias(client, args.alias, name)
+    print(f"{args.alias} -> {name} (was {previous or 'unset'})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Versioned Qdrant collections behind a serving alias")
+    parser.add_argument("--alias", default=COLLECTION_NAME, help="Serving alias (default: QDRANT_COLLECTION or articles2)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    validation = argparse.ArgumentParser(add_help=False)
+    validation.add_argument("--smoke-queries", help="Text file with one query per line (default: built-in set)")
+    validation.add_argument("--top-k", type=int, default=10)
+    validation.add_argument("--min-overlap", type=float, default=0.3,
+                            help="Minimum mean top-k article overlap with the live collection")
+    validation.add_argument("--max-latency-ms", type=float, default=200.0)
+    validation.add_argument("--min-count-ratio", type=float, default=0.9,
+                            help="Minimum point count relative to the live collection")
+    validation.add_argument("--force", action="store_true", help="Swap even if validation fails")
+    validation.add_argument("--projection", default=os.getenv("VECTOR_PROJECTION", "./data/projection.npz"),
+                            help="PCA projection for collections with reduced vectors")
+
+    build_parser = subparsers.add_parser("build", parents=[validation], help="Build a new versioned collection")
+    build_parser.add_argument("--name", help="Collection name (default: <alias>_v<timestamp>)")
+    build_parser.add_argument("--input", default="./data/articles_normalized.jsonl")
+    build_parser.add_argument("--sources", help="Comma-separated sources to load, e.g. for a source shard")
+    build_parser.add_argument("--chunker", choices=["chars", "tokens"], default="chars")
+    build_parser.add_argument("--chunk-store-root", help="Write slim payloads with a chunk store at <root>/<name>")
+    build_parser.add_argument("--rerank-tokens-root",
+                              help="Write reranker token IDs to <root>/<name> (serving: RERANK_TOKEN_STORE)")
+    build_parser.add_argument("--hnsw-m", type=int, default=16)
+    build_parser.add_argument("--ef-construct", type=int, default=100)
+    build_parser.add_argument("--quantization", choices=["none", "int8"], default="none")
+    build_parser.add_argument("--on-disk", action="store_true", help="Keep original vectors, HNSW graph and payloads on disk")
+    build_parser.add_argument("--reduce-dim", type=int, help="Search PCA-reduced vectors, rescore with full ones")
+    build_parser.add_argument("--refit-projection", action="store_true",
+                              help="Replace the saved projection; every collection using it must be rebuilt")
+    build_parser.add_argument("--pause-ms", type=float, default=0.0, help="Pause between article upserts")
+    build_parser.add_argument("--index-timeout", type=float, default=3600.0)
+    build_parser.add_argument("--swap", action="store_true", help="Validate and swap the alias when done")
+
+    validate_parser = subparsers.add_parser("validate", parents=[validation], help="Smoke-test a collection")
+    validate_parser.add_argument("name")
+    swap_parser = subparsers.add_parser("swap", parents=[validation], help="Validate, then point the alias at a collection")
+    swap_parser.add_argument("name")
+    subparsers.add_parser("status", help="Show the alias target and available versions")
+    cleanup_parser = subparsers.add_parser("cleanup", help="Delete old versions not behind the alias")
+    cleanup_parser.add_argument("--keep", type=int, default=2, help="Most recent versions to keep")
+    cleanup_parser.add_argument("--chunk-store-root", help="Also delete the deleted versions' chunk stores")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        name = build(args)
+        print(f"Built {name}")
+        if args.swap:
+            swap(args, name)
+    elif args.command == "validate":
+        ok = validate(args.name, args.alias, load_smoke_queries(args.smoke_queries), args.top_k,
+                      args.min_overlap, args.max_latency_ms, args.min_count_ratio, projection_for(args))
+        sys.exit(0 if ok else 1)
+    elif args.command == "swap":
+        swap(args, args.name)
+    elif args.command == "status":
+        target = alias_target(client, args.alias)
+        print(f"{args.alias} -> {target or ('(collection)' if collection_exists(client, args.alias) else 'unset')}")
+        for name in versions(args.alias):
+            info = client.get_collection(name)
+            marker = "*" if name == target else " "
+            print(f" {marker} {name}: {info.points_count} points, status {info.status}")
+    elif args.command == "cleanup":
+        target = alias_target(client, args.alias)
+        old = [name for name in versions(args.alias) if name != target]
+        for name in old[:max(0, len(old) - args.keep)]:
+            client.delete_collection(name)
+            if args.chunk_store_root and os.path.isdir(os.path.join(args.chunk_store_root, name)):
+                shutil.rmtree(os.path.join(args.chunk_store_root, name))
+            print(f"Deleted {name}")
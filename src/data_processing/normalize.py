@@ -0,0 +1,309 @@
+import argparse
+import json
+import re
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from multiprocessing import Pool
+from urllib.parse import urlparse
+
+# Vietnam local time, used when a source does not print a timezone
+DEFAULT_TZ_OFFSET = 7
+
+# Default inputs: (path, source adapter)
+DEFAULT_INPUTS = [
+    ("./data/articles.json", "laodong"),
+    ("./data/traveloka_articles.json", "traveloka"),
+]
+DEFAULT_OUTPUT = "./data/articles_normalized.jsonl"
+
+# ---------------------------------------------------------------------------
+# Date parsing
+# ---------------------------------------------------------------------------
+
+MONTHS = {
+    "jan": 1, "january": 1, "feb": 2, "february": 2, "mar": 3, "march": 3,
+    "apr": 4, "april": 4, "may": 5, "jun": 6, "june": 6, "jul": 7, "july": 7,
+    "aug": 8, "august": 8, "sep": 9, "sept": 9, "september": 9, "oct": 10,
+    "october": 10, "nov": 11, "november": 11, "dec": 12, "december": 12,
+}
+
+# laodong: "Thứ bảy, 10/05/2025 09:53 (GMT+7)", plain "10/05/2025"
+NUMERIC_DATE_RE = re.compile(
+    r"(?P<day>\d{1,2})[/.-](?P<month>\d{1,2})[/.-](?P<year>\d{4})"
+    r"(?:\s+(?P<hour>\d{1,2}):(?P<minute>\d{2}))?"
+    r"(?:\s*\(?GMT\s*(?P<tz>[+-]\d{1,2})\)?)?",
+    re.IGNORECASE,
+)
+# traveloka: "10 May 2025", "10 tháng 5 2025", "10 Thg 5 2025", "10 thg 5, 2025"
+TEXT_DATE_RE = re.compile(
+    r"(?P<day>\d{1,2})\s+(?:(?:tháng|thg)\s*(?P<vn_month>\d{1,2})|(?P<en_month>[a-z]+))\s*,?\s+(?P<year>\d{4})",
+    re.IGNORECASE,
+)
+# already normalized: "2025-05-10" or "2025-05-10T09:53:00+07:00"
+ISO_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+
+@lru_cache(maxsize=65536)
+def parse_date(time_str: str):
+    """
+    Parse a source time string into (iso_string, epoch_seconds).
+    Returns (None, None) when no known format matches.
+    """
+    if not time_str:
+        return None, None
+    text = time_str.strip()
+
+    if ISO_DATE_RE.match(text):
+        try:
+            dt = datetime.fromisoformat(text)
+        except ValueError:
+            return None, None
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone(timedelta(hours=DEFAULT_TZ_OFFSET)))
+        return _format(dt, has_time="T" in text)
+
+    match = NUMERIC_DATE_RE.search(text)
+    if match:
+        tz = int(match.group("tz")) if match.group("tz") else DEFAULT_TZ_OFFSET
+        has_time = match.group("hour") is not None
+        try:
+            dt = datetime(
+                int(match.group("year")), int(match.group("month")), int(match.group("day")),
+                int(match.group("hour") or 0), int(match.group("minute") or 0),
+                tzinfo=timezone(timedelta(hours=tz)),
+            )
+        except ValueError:
+            return None, None
+        return _format(dt, has_time)
+
+    match = TEXT_DATE_RE.search(text)
+    if match:
+        if match.group("vn_month"):
+            month = int(match.group("vn_month"))
+        else:
+            month = MONTHS.get(match.group("en_month").lower())
+            if month is None:
+                return None, None
+        try:
+            dt = datetime(
+                int(match.group("year")), month, int(match.group("day")),
+                tzinfo=timezone(timedelta(hours=DEFAULT_TZ_OFFSET)),
+            )
+        except ValueError:
+            return None, None
+        return _format(dt, has_time=False)
+
+    return None, None
+
+
+def _format(dt, has_time):
+    iso = dt.isoformat() if has_time else dt.date().isoformat()
+    return iso, int(dt.timestamp())
+
+# ---------------------------------------------------------------------------
+# Source adapters
+# ---------------------------------------------------------------------------
+
+ADAPTERS = {}
+
+
+def register_adapter(source):
+    """Register a function mapping a raw record of `source` to {title, time, url, content}"""
+    def decorator(func):
+        ADAPTERS[source] = func
+        return func
+    return decorator
+
+
+@register_adapter("laodong")
+def adapt_laodong(record):
+    # crawl_art_detail.py writes flat records
+    return {
+        "title": record.get("title", ""),
+        "time": record.get("time", ""),
+        "url": record.get("url", ""),
+        "content": record.get("content", []),
+    }
+
+
+@register_adapter("traveloka")
+def adapt_traveloka(record):
+    # crawl_guide.py nests title/time/url under "metadata"; older dumps are flat
+    metadata = record.get("metadata") or record
+    return {
+        "title": metadata.get("title", ""),
+        "time": metadata.get("time", ""),
+        "url": metadata.get("url", ""),
+        "content": record.get("content", []),
+    }
+
+
+def detect_source(record):
+    """Guess the adapter from the article URL"""
+    metadata = record.get("metadata") or record
+    host = urlparse(metadata.get("url") or "").netloc
+    if "traveloka" in host:
+        return "traveloka"
+    return "laodong"
+
+
+def normalize_record(record, source):
+    """
+    Normalize one raw record into {metadata, content}.
+    Returns (source, article or None, list of issue codes).
+    """
+    if source == "auto":
+        source = detect_source(record)
+    fields = ADAPTERS[source](record)
+    issues = []
+
+    content = fields["content"] or []
+    if isinstance(content, str):
+        content = [content]
+    content = [p.strip() for p in content if isinstance(p, str) and p.strip()]
+
+    url = (fields["url"] or "").strip()
+    title = (fields["title"] or "").strip()
+    if not url:
+        issues.append("missing_url")
+    if not content:
+        issues.append("empty_content")
+    if not title:
+        issues.append("missing_title")
+
+    iso, timestamp = parse_date(fields["time"] or "")
+    if iso is None:
+        issues.append("unparsed_date")
+
+    # Records without url or content cannot be indexed
+    if "missing_url" in issues or "empty_content" in issues:
+        return source, None, issues
+
+    return source, {
+        "metadata": {
+            "title": title,
+            "time": iso or "",
+            "timestamp": timestamp,
+            "url": url,
+            "source": source,
+        },
+        "content": content,
+    }, issues
+
+
+def normalize_batch(batch):
+    """Worker entry point: normalize a list of (source, record) pairs"""
+    return [normalize_record(record, source) for source, record in batch]
+
+# ---------------------------------------------------------------------------
+# Streaming I/O
+# ---------------------------------------------------------------------------
+
+def iter_records(path, read_size=1 << 20):
+    """
+    Yield records from a JSON array or JSONL file without loading
+    the whole file into memory.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        decoder = json.JSONDecoder()
+        buffer = f.read(read_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} is not a JSON array")
+        buffer = buffer[1:]
+        eof = False
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(read_size)
+                eof = not more
+                buffer += more
+                continue
+            yield record
+            buffer = buffer[end:]
+            if len(buffer) < read_size and not eof:
+                more = f.read(read_size)
+                eof = not more
+                buffer += more
+
+
+def iter_batches(inputs, batch_size):
+    """Chain all inputs into batches of (source, record) pairs"""
+    batch = []
+    for path, source in inputs:
+        for record in iter_records(path):
+            batch.append((source, record))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def normalize_corpus(inputs, output_file, workers=4, batch_size=500):
+    """Normalize every input in one pass and stream the result to a JSONL file"""
+    stats = defaultdict(Counter)
+    seen_urls = set()
+    start = time.time()
+
+    with open(output_file, "w", encoding="utf-8") as out, Pool(workers) as pool:
+        for results in pool.imap(normalize_batch, iter_batches(inputs, batch_size)):
+            for source, article, issues in results:
+                stats[source]["seen"] += 1
+                for issue in issues:
+                    stats[source][issue] += 1
+                if article is None:
+                    stats[source]["rejected"] += 1
+                    continue
+                url = article["metadata"]["url"]
+                if url in seen_urls:
+                    stats[source]["duplicate_url"] += 1
+                    continue
+                seen_urls.add(url)
+                stats[source]["written"] += 1
+                out.write(json.dumps(article, ensure_ascii=False) + "\n")
+
+    stats = {source: dict(counter) for source, counter in stats.items()}
+    stats["elapsed_seconds"] = round(time.time() - start, 3)
+    return stats
+
+
+def parse_input(value):
+    """Parse a PATH[:SOURCE] command line argument"""
+    path, _, source = value.partition(":")
+    source = source or "auto"
+    if source != "auto" and source not in ADAPTERS:
+        raise argparse.ArgumentTypeError(f"Unknown source '{source}', expected one of {sorted(ADAPTERS)}")
+    return path, source
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Normalize crawled articles into {metadata, content} JSONL")
+    parser.add_argument("--input", action="append", type=parse_input,
+                        help="PATH[:SOURCE], may be repeated (default: laodong and traveloka dumps)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--stats", help="Optional path to write validation stats as JSON")
+    args = parser.parse_args()
+
+    stats = normalize_corpus(args.input or DEFAULT_INPUTS, args.output, args.workers, args.batch_size)
+
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    if args.stats:
+        with open(args.stats, "w", encoding="utf-8") as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+    print(f"Normalized articles saved to {args.output}")
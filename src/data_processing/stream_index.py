@@ -0,0 +1,295 @@
+"""
+Streaming crawl-to-index pipeline.
+
+Instead of crawling a whole site to a JSON dump, normalizing it and then
+loading the full file with chunk_n_load.py, articles flow through every
+step as soon as they are crawled:
+
+    crawl (one task per source) -> normalize -> chunk + embed -> upsert
+
+Stages are connected by bounded asyncio queues, so a slow stage (a busy
+GPU, a throttled Qdrant) makes the crawlers wait instead of buffering the
+site in memory. Embedding and upserts run in worker threads, off the event
+loop the crawlers use.
+
+Checkpointing: each article's URL is appended to the checkpoint file once its
+points are upserted (wait=True, so it is searchable). Checkpointed URLs are
+never fetched again. With --follow the listing pages are re-polled every
+--interval seconds, and a pass stops at the first page with nothing new. Point
+IDs are stable (chunk_n_load.article_points), so an article re-processed after
+a crash only overwrites its points.
+
+Freshness goes to rag_index_freshness_seconds (served on RAG_METRICS_PORT):
+since="crawl" from fetching an article to its upsert, since="publish" from its
+publication time, for articles found by follow passes (not the initial backfill).
+
+Points carry full payloads; slim chunk stores are written once per build, so
+use manage_collection.py for those collections.
+
+    python src/data_processing/stream_index.py --sources laodong,traveloka --pages 5 --follow --interval 600
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from crawl4ai import AsyncWebCrawler
+from crawl4ai.async_configs import BrowserConfig
+from normalize import normalize_record
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data_collection"))
+import crawl_art_detail
+import crawl_guide
+from chunk_n_load import DEVICE, client, model, article_points, get_splitter
+from common.metrics import INDEX_FRESHNESS, PIPELINE_ARTICLES, start_metrics_server
+from common.projection import PCAProjection
+from common.qdrant_collections import COLLECTION_NAME, ensure_collection, ensure_payload_indexes, shard_collection
+
+# Listing pages per source, newest articles first (as crawled by crawl_art_detail.py / crawl_guide.py)
+LISTINGS = {
+    "laodong": "https://laodong.vn/du-lich/tin-tuc?page={page}",
+    "traveloka": "https://www.traveloka.com/vi-vn/explore/destinations?page={page}",
+}
+DEFAULT_CHECKPOINT = "./data/stream_checkpoint.jsonl"
+# End-of-stream marker passed down the queues
+DONE = None
+
+
+class Checkpoint:
+    """Append-only JSONL record of indexed article URLs"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.urls = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.urls = {json.loads(line)["url"] for line in f if line.strip()}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __contains__(self, url: str) -> bool:
+        return url in self.urls
+
+    def add(self, url: str, **fields):
+        self.urls.add(url)
+        self._file.write(json.dumps({"url": url, **fields}, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+async def list_urls(crawler, source: str, page: int) -> list:
+    module = crawl_art_detail if source == "laodong" else crawl_guide
+    return await module.get_article_urls(crawler, LISTINGS[source].format(page=page))
+
+
+async def fetch_article(crawler, source: str, url: str):
+    """Raw record in the shape the source's batch crawler writes, or None"""
+    if source == "laodong":
+        record = await crawl_art_detail.get_article_content(crawler, url)
+        record["url"] = url
+        return record if record["content"] else None
+    return await crawl_guide.extract_article_content(crawler, url)
+
+
+async def crawl_source(crawler, source: str, out_queue, checkpoint: Checkpoint, in_flight: set, pages: int,
+                       follow: bool, interval: float, delay: float):
+    """Crawl new articles of one source into out_queue; with follow, keep re-polling the listings"""
+    backfill = True
+    while True:
+        for page in range(1, pages + 1):
+            try:
+                urls = await list_urls(crawler, source, page)
+            except Exception as e:
+                print(f"Error listing {source} page {page}: {e}")
+                continue
+            new_urls = [url for url in dict.fromkeys(urls) if url not in checkpoint and url not in in_flight]
+            for url in new_urls:
+                in_flight.add(url)
+                record = await fetch_article(crawler, source, url)
+                if record is None:
+                    PIPELINE_ARTICLES.inc(stage="crawl", outcome="failed")
+                    in_flight.discard(url)
+                    continue
+                PIPELINE_ARTICLES.inc(stage="crawl", outcome="fetched")
+                # Waits while the downstream queues are full
+                await out_queue.put((source, url, record, time.time(), backfill))
+                await asyncio.sleep(delay)
+            # Listings are newest first: on a follow pass, a page with nothing new means the rest is indexed too
+            if not backfill and urls and not new_urls:
+                break
+            await asyncio.sleep(delay)
+        if not follow:
+            return
+        backfill = False
+        await asyncio.sleep(interval)
+
+
+async def normalize_stage(in_queue, out_queue, in_flight: set):
+    while True:
+        item = await in_queue.get()
+        if item is DONE:
+            await out_queue.put(DONE)
+            return
+        source, url, record, crawled_at, backfill = item
+        _, article, issues = normalize_record(record, source)
+        if article is None:
+            print(f"Rejected {url}: {', '.join(issues)}")
+            PIPELINE_ARTICLES.inc(stage="normalize", outcome="rejected")
+            in_flight.discard(url)
+            continue
+        await out_queue.put((url, article, crawled_at, backfill))
+
+
+def embed_article(article: dict, splitter, projection=None) -> list:
+    """Chunk and embed one normalized article into Qdrant points (empty when it has no text)"""
+    chunks = splitter.split_text(" ".join(article.get("content", [])))
+    if not chunks:
+        return []
+    embeddings = model.encode(chunks, device=DEVICE)
+    reduced = projection.transform(embeddings) if projection is not None else None
+    return article_points(article["metadata"], chunks, embeddings, reduced)
+
+
+async def embed_stage(in_queue, out_queue, in_flight: set, pool, splitter, projection, upsert_workers: int):
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await in_queue.get()
+        if item is DONE:
+            for _ in range(upsert_workers):
+                await out_queue.put(DONE)
+            return
+        url, article, crawled_at, backfill = item
+        try:
+            points = await loop.run_in_executor(pool, embed_article, article, splitter, projection)
+        except Exception as e:
+            print(f"Error embedding {url}: {e}")
+            points = None
+        if not points:
+            PIPELINE_ARTICLES.inc(stage="embed", outcome="failed" if points is None else "empty")
+            in_flight.discard(url)
+            continue
+        await out_queue.put((url, article, points, crawled_at, backfill))
+
+
+async def upsert_stage(in_queue, in_flight: set, checkpoint: Checkpoint, pool, collection_name: str,
+                       shard_by_source: bool, ready_collections: set, reduced_dim: int = None):
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await in_queue.get()
+        if item is DONE:
+            return
+        url, article, points, crawled_at, backfill = item
+        metadata = article["metadata"]
+        target = shard_collection(collection_name, metadata["source"]) if shard_by_source else collection_name
+        try:
+            if target not in ready_collections:
+                await loop.run_in_executor(pool, prepare_collection, target, reduced_dim)
+                ready_collections.add(target)
+            await loop.run_in_executor(
+                pool, lambda: client.upsert(collection_name=target, points=points, wait=True))
+        except Exception as e:
+            # Not checkpointed: the next follow pass (or run) picks the article up again
+            print(f"Error upserting {url}: {e}")
+            PIPELINE_ARTICLES.inc(stage="upsert", outcome="failed")
+            in_flight.discard(url)
+            continue
+        indexed_at = time.time()
+        checkpoint.add(url, article_id=points[0].payload["article_id"], collection=target, chunks=len(points),
+                       crawled_at=round(crawled_at, 3), indexed_at=round(indexed_at, 3))
+        in_flight.discard(url)
+        PIPELINE_ARTICLES.inc(stage="upsert", outcome="indexed")
+        INDEX_FRESHNESS.observe(indexed_at - crawled_at, since="crawl", source=metadata["source"])
+        if not backfill and metadata.get("timestamp"):
+            INDEX_FRESHNESS.observe(max(0.0, indexed_at - metadata["timestamp"]), since="publish",
+                                    source=metadata["source"])
+        print(f"Indexed {metadata['title'][:80]} ({len(points)} chunks, {indexed_at - crawled_at:.1f}s after crawl)")
+
+
+def prepare_collection(name: str, reduced_dim: int = None):
+    if ensure_collection(client, name, reduced_dim=reduced_dim):
+        print(f"Created collection {name}")
+    ensure_payload_indexes(client, name)
+
+
+async def report(queues: dict, every: float):
+    """Print queue depths and stage counts periodically"""
+    while True:
+        await asyncio.sleep(every)
+        depths = ", ".join(f"{name}={queue.qsize()}" for name, queue in queues.items())
+        counts = ", ".join(f"{stage}:{outcome}={int(PIPELINE_ARTICLES.value(stage=stage, outcome=outcome))}"
+                           for stage, outcome in [("crawl", "fetched"), ("normalize", "rejected"),
+                                                  ("embed", "empty"), ("upsert", "indexed"), ("upsert", "failed")])
+        print(f"[pipeline] queues: {depths} | {counts}")
+
+
+async def run(args):
+    checkpoint = Checkpoint(args.checkpoint)
+    print(f"{len(checkpoint.urls)} articles already indexed according to {args.checkpoint}")
+    splitter = get_splitter(args.chunker)
+    projection = PCAProjection.load(args.projection) if args.projection else None
+    reduced_dim = projection.dim if projection is not None else None
+
+    queues = {name: asyncio.Queue(maxsize=args.queue_size) for name in ("crawled", "normalized", "embedded")}
+    in_flight = set()
+    # The bi-encoder runs in one thread; upserts are network bound and may overlap
+    embed_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+    upsert_pool = ThreadPoolExecutor(max_workers=args.upsert_workers, thread_name_prefix="upsert")
+    ready_collections = set()
+
+    async with AsyncWebCrawler(config=BrowserConfig()) as crawler:
+        crawlers = [
+            asyncio.create_task(crawl_source(crawler, source, queues["crawled"], checkpoint, in_flight, args.pages,
+                                             args.follow, args.interval, args.delay))
+            for source in args.sources.split(",")
+        ]
+        workers = [
+            asyncio.create_task(normalize_stage(queues["crawled"], queues["normalized"], in_flight)),
+            asyncio.create_task(embed_stage(queues["normalized"], queues["embedded"], in_flight, embed_pool,
+                                            splitter, projection, args.upsert_workers)),
+            *[asyncio.create_task(upsert_stage(queues["embedded"], in_flight, checkpoint, upsert_pool,
+                                               args.collection, args.shard_by_source, ready_collections,
+                                               reduced_dim))
+              for _ in range(args.upsert_workers)],
+        ]
+        reporter = asyncio.create_task(report(queues, args.report_seconds))
+        try:
+            await asyncio.gather(*crawlers)
+            await queues["crawled"].put(DONE)
+            await asyncio.gather(*workers)
+        finally:
+            reporter.cancel()
+            embed_pool.shutdown()
+            upsert_pool.shutdown()
+            checkpoint.close()
+    print(f"Done: {int(PIPELINE_ARTICLES.value(stage='upsert', outcome='indexed'))} articles indexed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl, normalize, embed and index articles as they arrive")
+    parser.add_argument("--sources", default="laodong,traveloka", help=f"Comma-separated, from {sorted(LISTINGS)}")
+    parser.add_argument("--pages", type=int, default=5, help="Listing pages scanned per pass")
+    parser.add_argument("--follow", action="store_true", help="Keep re-polling the listings for new articles")
+    parser.add_argument("--interval", type=float, default=600.0, help="Seconds between follow passes")
+    parser.add_argument("--delay", type=float, default=0.5, help="Pause between requests to a site")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--shard-by-source", action="store_true",
+                        help="Index each source into its own <collection>_<source> shard")
+    parser.add_argument("--chunker", choices=["chars", "tokens"], default=os.getenv("CHUNKER", "chars"))
+    parser.add_argument("--projection", help="PCA projection of a --reduce-dim collection (see chunk_n_load.py)")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--queue-size", type=int, default=32, help="Bound of each queue between stages")
+    parser.add_argument("--upsert-workers", type=int, default=2)
+    parser.add_argument("--report-seconds", type=float, default=30.0)
+    args = parser.parse_args()
+
+    unknown = set(args.sources.split(",")) - set(LISTINGS)
+    if unknown:
+        parser.error(f"Unknown sources: {', '.join(sorted(unknown))}")
+    # Exposes rag_index_freshness_seconds and rag_pipeline_articles_total when RAG_METRICS_PORT is set
+    start_metrics_server()
+    asyncio.run(run(args))
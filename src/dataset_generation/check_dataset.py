@@ -1,12 +1,21 @@
+import argparse
+import asyncio
+import hashlib
 import json
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.docstore.document import Document as LangchainDocument
-from tqdm import tqdm
-import random
-from openai import OpenAI
 import os
+import re
+import sys
+import time
+from tqdm import tqdm
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.llm_client import make_async_client, chat_completion
+from common.llm_cache import CACHE_MODES, cache_key, load_cache
+
+# Load environment variables
+load_dotenv()
+
 question_groundedness_critique_prompt = """
 Bạn sẽ được cung cấp một ngữ cảnh và một câu hỏi.  
 Nhiệm vụ của bạn là đưa ra một 'điểm tổng' đánh giá mức độ mà câu hỏi có thể được trả lời một cách rõ ràng và không mơ hồ dựa trên ngữ cảnh đã cho.  
@@ -66,74 +75,196 @@ Dưới đây là câu hỏi.
 Câu hỏi: {question}\n  
 Answer::: """
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+CRITERIA = {
+    "groundedness": question_groundedness_critique_prompt,
+    "relevance": question_relevance_critique_prompt,
+    "standalone": question_standalone_critique_prompt,
+}
+
+# Tolerates markdown bold, full-width colons and trailing text after the score ("4/5");
+# multi-digit or decimal scores ("10/10", "45", "4.5") do not parse
+SCORE_RE = re.compile(r"Điểm tổng\s*\**\s*[:：]\s*\**\s*([1-5])(?![0-9]|[.,][0-9])")
+EVAL_RE = re.compile(r"Đánh giá\s*\**\s*[:：]\s*\**(.*?)(?:\s*\**\s*Điểm tổng|$)", re.DOTALL)
+
+
+def parse_evaluation(evaluation: str):
+    """Return (score, eval_text) from a critique; score is None if it cannot be read"""
+    scores = SCORE_RE.findall(evaluation)
+    match = EVAL_RE.search(evaluation)
+    eval_text = match.group(1).strip() if match else evaluation.strip()
+    return (int(scores[-1]) if scores else None), eval_text
+
+
+def qa_id(output: dict) -> str:
+    """Stable id of a QA pair: the generator's chunk_id, else a hash of the question"""
+    if output.get("chunk_id"):
+        return output["chunk_id"]
+    return hashlib.sha1(output["question"].encode("utf-8")).hexdigest()[:16]
 
-def get_evaluation(prompt):
+
+def load_done(results_file: str) -> dict:
+    """
+    Map (qa_id, criterion) -> result record already in the JSONL results file.
+    Records without a score (unparsed critiques from older runs) are left out, so they are retried.
+    """
+    done = {}
+    if os.path.exists(results_file):
+        with open(results_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    if record["score"] is not None:
+                        done[(record["qa_id"], record["criterion"])] = record
+                except (ValueError, KeyError):
+                    # Ignore a partially written last line
+                    continue
+    return done
+
+
+EVAL_TEMPERATURE = 0.7
+EVAL_MAX_TOKENS = 500
+
+
+def evaluation_messages(prompt: str) -> list:
+    return [
+        {"role": "system", "content": "You are a helpful assistant that evaluates questions."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+async def get_evaluation(client, prompt: str, model: str, max_retries: int, stats: dict, cache=None) -> str:
     """Get evaluation from OpenAI API"""
-    try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that evaluates questions."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        print(f"Error getting evaluation: {e}")
-        return None
-
-# Load the generated QA pairs
-print("Loading generated QA pairs...")
-with open("./data/generated_qa_pairs.json", "r", encoding="utf-8") as f:
-    outputs = json.load(f)
-
-# Evaluate QA pairs
-print("\nGenerating critique for each QA pair...")
-for output in tqdm(outputs):
-    evaluations = {
-        "groundedness": get_evaluation(
-            question_groundedness_critique_prompt.format(
-                context=output["context"], 
-                question=output["question"]
-            )
-        ),
-        "relevance": get_evaluation(
-            question_relevance_critique_prompt.format(
-                question=output["question"]
-            )
-        ),
-        "standalone": get_evaluation(
-            question_standalone_critique_prompt.format(
+    response = await chat_completion(
+        client,
+        messages=evaluation_messages(prompt),
+        model=model,
+        temperature=EVAL_TEMPERATURE,
+        max_tokens=EVAL_MAX_TOKENS,
+        max_retries=max_retries,
+        stats=stats,
+        cache=cache
+    )
+    return response.choices[0].message.content or ""
+
+
+async def run_critiques(jobs: list, results_file: str, model: str, concurrency: int, max_retries: int,
+                        cache=None) -> dict:
+    """Run every (qa_id, criterion, prompt) job under one global concurrency limit"""
+    # Replay mode never reaches the API, so no client (or key) is needed
+    client = None if cache is not None and cache.mode == "replay" else make_async_client()
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    stats = {"failed": 0, "unparsed": 0}
+    progress = tqdm(total=len(jobs), desc="Critiquing QA pairs")
+
+    with open(results_file, "a", encoding="utf-8") as out:
+        async def worker():
+            while True:
+                try:
+                    pair_id, criterion, prompt = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    evaluation = await get_evaluation(client, prompt, model, max_retries, stats, cache)
+                except Exception as e:
+                    # Not written, so the critique is retried on the next run
+                    print(f"Error getting {criterion} evaluation for {pair_id}: {e}")
+                    stats["failed"] += 1
+                else:
+                    score, eval_text = parse_evaluation(evaluation)
+                    if score is None:
+                        # Neither written nor kept in the cache, so the critique is asked again on the next run
+                        stats["unparsed"] += 1
+                        if cache is not None and cache.mode == "readwrite":
+                            cache.delete(cache_key(model, evaluation_messages(prompt),
+                                                   EVAL_TEMPERATURE, EVAL_MAX_TOKENS))
+                    else:
+                        out.write(json.dumps({
+                            "qa_id": pair_id,
+                            "criterion": criterion,
+                            "score": score,
+                            "eval": eval_text,
+                        }, ensure_ascii=False) + "\n")
+                        out.flush()
+                progress.update(1)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    progress.close()
+    if client is not None:
+        await client.close()
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Critique generated QA pairs (groundedness, relevance, standalone)")
+    parser.add_argument("--input", default="./data/generated_qa_pairs.json")
+    parser.add_argument("--results", default="./data/evaluations.jsonl",
+                        help="Incremental per-criterion results, used for resuming")
+    parser.add_argument("--output", default="./data/evaluated_qa_pairs.json")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-retries", type=int, default=6)
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--cache-mode", choices=CACHE_MODES, default=os.getenv("LLM_CACHE_MODE", "readwrite"),
+                        help="LLM response cache mode (default: $LLM_CACHE_MODE or readwrite)")
+    parser.add_argument("--cache-path", help="LLM response cache file (default: $LLM_CACHE_PATH)")
+    args = parser.parse_args()
+    cache = load_cache(args.cache_mode, args.cache_path)
+
+    # Load the generated QA pairs
+    print("Loading generated QA pairs...")
+    with open(args.input, "r", encoding="utf-8") as f:
+        outputs = json.load(f)
+
+    done = load_done(args.results)
+    jobs = []
+    for output in outputs:
+        for criterion, prompt in CRITERIA.items():
+            if (qa_id(output), criterion) in done:
+                continue
+            jobs.append((qa_id(output), criterion, prompt.format(
+                context=output["context"],
                 question=output["question"]
-            )
-        ),
-    }
-    
-    try:
-        for criterion, evaluation in evaluations.items():
-            if evaluation:
-                score = int(evaluation.split("Điểm tổng: ")[-1].strip())
-                eval_text = evaluation.split("Điểm tổng: ")[0].split("Đánh giá: ")[1].strip()
+            )))
+
+    # Evaluate QA pairs
+    print(f"\nGenerating {len(jobs)} critiques ({len(outputs) * len(CRITERIA) - len(jobs)} already done)...")
+    start = time.time()
+    stats = asyncio.run(run_critiques(jobs, args.results, args.model, args.concurrency,
+                                      args.max_retries, cache))
+    elapsed = time.time() - start
+
+    # Merge per-criterion results back into the QA pairs
+    done = load_done(args.results)
+    for output in outputs:
+        for criterion in CRITERIA:
+            record = done.get((qa_id(output), criterion))
+            if record and record["score"] is not None:
                 output.update({
-                    f"{criterion}_score": score,
-                    f"{criterion}_eval": eval_text,
+                    f"{criterion}_score": record["score"],
+                    f"{criterion}_eval": record["eval"],
                 })
-    except Exception as e:
-        print(f"Error processing evaluation: {e}")
-        continue
-
-# Save the evaluated QA pairs to a JSON file
-print(f"\nSaving evaluated QA pairs...")
-with open("./data/evaluated_qa_pairs.json", "w", encoding="utf-8") as f:
-    json.dump(outputs, f, ensure_ascii=False, indent=2)
-
-# Print evaluation summary
-print("\nEvaluation Summary:")
-for criterion in ["groundedness", "relevance", "standalone"]:
-    scores = [output.get(f"{criterion}_score", 0) for output in outputs if f"{criterion}_score" in output]
-    if scores:
-        avg_score = sum(scores) / len(scores)
-        print(f"{criterion.capitalize()}: Average score = {avg_score:.2f} (n={len(scores)})")
+
+    # Save the evaluated QA pairs to a JSON file
+    print(f"\nSaving evaluated QA pairs...")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(outputs, f, ensure_ascii=False, indent=2)
+
+    # Print evaluation summary
+    print("\nEvaluation Summary:")
+    for criterion in CRITERIA:
+        scores = [output[f"{criterion}_score"] for output in outputs if f"{criterion}_score" in output]
+        if scores:
+            avg_score = sum(scores) / len(scores)
+            print(f"{criterion.capitalize()}: Average score = {avg_score:.2f} (n={len(scores)})")
+
+    # Print throughput summary
+    calls = stats.get("calls", 0)
+    tokens = stats.get("prompt_tokens", 0) + stats.get("completion_tokens", 0)
+    print("\nThroughput Summary:")
+    print(f"Critiques: {calls} completed, {stats['failed']} failed, {stats['unparsed']} unparsed in {elapsed:.1f}s")
+    print(f"Rate: {calls / elapsed if elapsed else 0:.2f} calls/s, {tokens / elapsed if elapsed else 0:.0f} tokens/s")
+    print(f"Retries: {stats.get('rate_limited', 0)} rate limited, {stats.get('retried', 0)} transient errors")
+    print(f"Cache: {stats.get('cache_hits', 0)} hits")
@@ -1,12 +1,20 @@
+import argparse
+import asyncio
+import hashlib
 import json
+import os
+import random
+import sys
+import time
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document as LangchainDocument
 from tqdm import tqdm
-import random
-from openai import OpenAI
-import os
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.llm_client import make_async_client, chat_completion
+from common.llm_cache import CACHE_MODES, load_cache
+
 text_splitter = RecursiveCharacterTextSplitter(
     chunk_size=1000,
     chunk_overlap=200,
@@ -17,42 +25,6 @@ text_splitter = RecursiveCharacterTextSplitter(
 # Load environment variables
 load_dotenv()
 
-docs_processed = []
-
-with open("./data/traveloka_articles.json", "r", encoding="utf-8") as f:
-    articles = json.load(f)
-
-# Create Langchain documents from articles
-langchain_docs = []
-for article in tqdm(articles, desc="Creating documents"):
-    content = " ".join(article.get('content', []))
-    if content:  # Only process if there's content
-        langchain_docs.append(
-            LangchainDocument(
-                page_content=content,
-                metadata={
-                    "source": article.get('title', 'Unknown'),
-                    "url": article.get('url', ''),
-                    "date": article.get('date', '')
-                }
-            )
-        )
-
-print("Splitting documents into chunks...")
-for doc in tqdm(langchain_docs, desc="Splitting documents"):
-    docs_processed.extend(text_splitter.split_documents([doc]))
-
-print(f"Total number of chunks created: {len(docs_processed)}")
-
-# Print first few chunks
-print("\nFirst 3 chunks:")
-for i, chunk in enumerate(docs_processed[:3]):
-    print(f"\nChunk {i+1}:")
-    print("-" * 50)
-    print("Content:", chunk.page_content[:200] + "..." if len(chunk.page_content) > 200 else chunk.page_content)
-    print("Metadata:", chunk.metadata)
-    print("-" * 50)
-
 
 QA_generation_prompt = """
 Nhiệm vụ của bạn là viết một câu hỏi dạng factoid (thông tin thực tế) và một câu trả lời dựa trên một đoạn văn bản cho trước.
@@ -72,62 +44,195 @@ Context: {context}\n
 Output:::
 """
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-def generate_qa_pair(context):
-    """Generate a QA pair using OpenAI API"""
-    try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",  # You can change this to other models if needed
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that generates question-answer pairs from given text."},
-                {"role": "user", "content": QA_generation_prompt.format(context=context)}
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        print(f"Error generating QA pair: {e}")
-        return None
 
-# Generate QA pairs
-N_GENERATIONS = 100  # Number of QA pairs to generate
-print(f"Generating {N_GENERATIONS} QA pairs...")
-
-outputs = []
-for sampled_context in tqdm(random.sample(docs_processed, N_GENERATIONS)):
-    # Generate QA pair
-    output_QA_couple = generate_qa_pair(sampled_context.page_content)
-    if output_QA_couple:
-        try:
-            # Extract question and answer from the response
-            question = output_QA_couple.split("Factoid question: ")[-1].split("Answer: ")[0].strip()
-            answer = output_QA_couple.split("Answer: ")[-1].strip()
-            
-            # Validate answer length
-            if len(answer) < 300:
-                outputs.append({
-                    "context": sampled_context.page_content,
-                    "question": question,
-                    "answer": answer
-                })
-        except Exception as e:
-            print(f"Error processing QA pair: {e}")
-            continue
-
-# Save the generated QA pairs to a JSON file
-print(f"\nSuccessfully generated {len(outputs)} QA pairs")
-with open("./data/generated_qa_pairs.json", "w", encoding="utf-8") as f:
-    json.dump(outputs, f, ensure_ascii=False, indent=2)
-
-# Print first few generated QA pairs
-print("\nFirst 3 generated QA pairs:")
-for i, qa_pair in enumerate(outputs[:3]):
-    print(f"\nQA Pair {i+1}:")
-    print("-" * 50)
-    print("Question:", qa_pair["question"])
-    print("Answer:", qa_pair["answer"])
-    print("-" * 50)
+def load_chunks(input_file: str) -> list:
+    """Split normalized articles into chunks, each with a stable chunk_id"""
+    with open(input_file, "r", encoding="utf-8") as f:
+        articles = [json.loads(line) for line in f if line.strip()]
+
+    # Create Langchain documents from articles
+    langchain_docs = []
+    for article in tqdm(articles, desc="Creating documents"):
+        metadata = article.get('metadata', {})
+        content = " ".join(article.get('content', []))
+        if content:  # Only process if there's content
+            langchain_docs.append(
+                LangchainDocument(
+                    page_content=content,
+                    metadata={
+                        "source": metadata.get('title', 'Unknown'),
+                        "url": metadata.get('url', ''),
+                        "date": metadata.get('time', '')
+                    }
+                )
+            )
 
+    print("Splitting documents into chunks...")
+    chunks = []
+    for doc in tqdm(langchain_docs, desc="Splitting documents"):
+        for chunk in text_splitter.split_documents([doc]):
+            key = f"{chunk.metadata['url']}#{chunk.metadata['start_index']}"
+            chunks.append({
+                "chunk_id": hashlib.sha1(key.encode("utf-8")).hexdigest()[:16],
+                "context": chunk.page_content,
+                "url": chunk.metadata["url"],
+                "title": chunk.metadata["source"],
+            })
+
+    print(f"Total number of chunks created: {len(chunks)}")
+    return chunks
+
+
+def sample_chunks(chunks: list, n: int, seed: int) -> list:
+    """Deterministic sample: the same corpus and seed always give the same chunks"""
+    chunks = sorted(chunks, key=lambda c: c["chunk_id"])
+    return random.Random(seed).sample(chunks, min(n, len(chunks)))
+
+
+def load_done_ids(output_file: str) -> set:
+    """Chunk ids already present in the JSONL output (for resuming)"""
+    done = set()
+    if os.path.exists(output_file):
+        with open(output_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["chunk_id"])
+                except (ValueError, KeyError):
+                    # Ignore a partially written last line
+                    continue
+    return done
+
+
+def parse_qa_pair(output_QA_couple: str):
+    """Extract (question, answer) from the model output, or None"""
+    if "Factoid question:" not in output_QA_couple or "Answer:" not in output_QA_couple:
+        return None
+    question = output_QA_couple.split("Factoid question:")[-1].split("Answer:")[0].strip()
+    answer = output_QA_couple.split("Answer:")[-1].strip()
+    if not question or not answer:
+        return None
+    return question, answer
+
+
+async def generate_qa_pair(client, chunk: dict, model: str, max_retries: int, stats: dict, cache=None) -> dict:
+    """Generate a QA pair for one chunk; returns the record to write"""
+    response = await chat_completion(
+        client,
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant that generates question-answer pairs from given text."},
+            {"role": "user", "content": QA_generation_prompt.format(context=chunk["context"])}
+        ],
+        model=model,
+        temperature=0.7,
+        max_tokens=500,
+        max_retries=max_retries,
+        stats=stats,
+        cache=cache
+    )
+    record = {"chunk_id": chunk["chunk_id"], "context": chunk["context"], "url": chunk["url"]}
+
+    parsed = parse_qa_pair(response.choices[0].message.content or "")
+    # Validate answer length
+    if parsed is None or len(parsed[1]) >= 300:
+        record["status"] = "rejected"
+        return record
+
+    record.update({"question": parsed[0], "answer": parsed[1], "status": "ok"})
+    return record
+
+
+async def generate_dataset(chunks: list, output_file: str, model: str, concurrency: int, max_retries: int,
+                           cache=None) -> dict:
+    """Generate QA pairs with `concurrency` workers, appending each result to `output_file`"""
+    # Replay mode never reaches the API, so no client (or key) is needed
+    client = None if cache is not None and cache.mode == "replay" else make_async_client()
+    queue = asyncio.Queue()
+    for chunk in chunks:
+        queue.put_nowait(chunk)
+
+    stats = {"ok": 0, "rejected": 0, "failed": 0}
+    progress = tqdm(total=len(chunks), desc="Generating QA pairs")
+
+    with open(output_file, "a", encoding="utf-8") as out:
+        async def worker():
+            while True:
+                try:
+                    chunk = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    record = await generate_qa_pair(client, chunk, model, max_retries, stats, cache)
+                except Exception as e:
+                    # Not written, so the chunk is retried on the next run
+                    print(f"Error generating QA pair for chunk {chunk['chunk_id']}: {e}")
+                    stats["failed"] += 1
+                else:
+                    stats[record["status"]] += 1
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                progress.update(1)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    progress.close()
+    if client is not None:
+        await client.close()
+    return stats
+
+
+def export_json(jsonl_file: str, json_file: str) -> list:
+    """Write accepted QA pairs as the JSON array check_dataset.py used to read"""
+    outputs = []
+    with open(jsonl_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "ok":
+                outputs.append({key: record[key] for key in ("chunk_id", "context", "question", "answer")})
+    with open(json_file, "w", encoding="utf-8") as f:
+        json.dump(outputs, f, ensure_ascii=False, indent=2)
+    return outputs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic factoid QA pairs from the article corpus")
+    parser.add_argument("--input", default="./data/articles_normalized.jsonl")
+    parser.add_argument("--output", default="./data/generated_qa_pairs.jsonl")
+    parser.add_argument("--json-output", default="./data/generated_qa_pairs.json")
+    parser.add_argument("--n", type=int, default=100, help="Number of chunks to sample")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-retries", type=int, default=6)
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--cache-mode", choices=CACHE_MODES, default=os.getenv("LLM_CACHE_MODE", "readwrite"),
+                        help="LLM response cache mode (default: $LLM_CACHE_MODE or readwrite)")
+    parser.add_argument("--cache-path", help="LLM response cache file (default: $LLM_CACHE_PATH)")
+    args = parser.parse_args()
+    cache = load_cache(args.cache_mode, args.cache_path)
+
+    docs_processed = load_chunks(args.input)
+    sampled = sample_chunks(docs_processed, args.n, args.seed)
+
+    done = load_done_ids(args.output)
+    pending = [chunk for chunk in sampled if chunk["chunk_id"] not in done]
+    print(f"Generating {len(pending)} QA pairs ({len(sampled) - len(pending)} already done)...")
+
+    start = time.time()
+    stats = asyncio.run(generate_dataset(pending, args.output, args.model, args.concurrency,
+                                         args.max_retries, cache))
+    elapsed = time.time() - start
+
+    outputs = export_json(args.output, args.json_output)
+    print(f"\nSuccessfully generated {len(outputs)} QA pairs")
+    print(f"Run stats: {stats}, {len(pending) / elapsed if elapsed else 0:.1f} chunks/s")
+
+    # Print first few generated QA pairs
+    print("\nFirst 3 generated QA pairs:")
+    for i, qa_pair in enumerate(outputs[:3]):
+        print(f"\nQA Pair {i+1}:")
+        print("-" * 50)
+        print("Question:", qa_pair["question"])
+        print("Answer:", qa_pair["answer"])
+        print("-" * 50)
@@ -0,0 +1,176 @@
+"""
+CPU thread, replica and batch-size autotuner for the bi-encoder and the cross-encoder.
+
+For each model, every combination of torch intra-op threads, concurrent
+replicas (threads x replicas up to the core count) and batch size is run
+through the same ReplicatedModel used in serving (common/inference_profile.py)
+on random corpus chunks (fixed seed):
+
+    throughput   inputs per second over --samples chunks (or query/chunk pairs)
+    latency      per-call percentiles of request-sized calls: one article's
+                 chunks (--article-chunks) for the bi-encoder, one question's
+                 candidates (--candidates) for the cross-encoder
+
+The bi-encoder is tuned for throughput (ingestion) and the cross-encoder for
+p50 latency (serving) unless --embedding-objective / --reranking-objective
+say otherwise. All runs go to the results JSON; the best configuration per
+model is written to the inference profile, which chunk_n_load.py and
+answer_generator.py load at startup.
+
+    python src/evaluation/autotune.py --samples 512 --batch-sizes 8,16,32,64
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import torch
+from sentence_transformers import SentenceTransformer, CrossEncoder
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.inference_profile import DEFAULT_PROFILE_PATH, ReplicatedModel, load_inference_profile
+from bench_utils import load_qa_pairs, latency_summary, write_results
+from benchmark_retrieval import RERANKER_MODEL, RETRIEVAL_MODEL, load_corpus_chunks
+
+
+def int_list(value: str) -> list:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def default_thread_counts(cores: int) -> list:
+    """1, 2, 4, ... up to the core count, plus the core count itself"""
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    return counts if counts[-1] == cores else counts + [cores]
+
+
+def run_config(model, method: str, inputs: list, requests: list, threads: int, replicas: int, batch_size: int,
+               warmup: int) -> dict:
+    """Throughput over `inputs` and latency of each request-sized call of model.<method>, for one configuration"""
+    torch.set_num_threads(threads)
+    wrapped = ReplicatedModel(model, batch_size, replicas)
+    run = getattr(wrapped, method)
+    for request in requests[:warmup]:
+        run(request)
+
+    start = time.perf_counter()
+    run(inputs)
+    seconds = time.perf_counter() - start
+
+    latencies = []
+    for request in requests:
+        start = time.perf_counter()
+        run(request)
+        latencies.append(time.perf_counter() - start)
+    wrapped.close()
+    return {
+        "threads": threads,
+        "replicas": replicas,
+        "batch_size": batch_size,
+        "throughput": round(len(inputs) / seconds, 2),
+        "latency_ms": latency_summary(latencies),
+    }
+
+
+def sweep(name: str, model, method: str, inputs: list, requests: list, thread_counts: list, replica_counts: list,
+          batch_sizes: list, cores: int, warmup: int) -> list:
+    runs = []
+    for threads in thread_counts:
+        for replicas in replica_counts:
+            if threads * replicas > cores:
+                continue
+            for batch_size in batch_sizes:
+                run = run_config(model, method, inputs, requests, threads, replicas, batch_size, warmup)
+                runs.append(run)
+                print(f"{name:>9} threads={threads:<3} replicas={replicas:<2} batch={batch_size:<4} "
+                      f"{run['throughput']:>9.1f}/s  p50={run['latency_ms']['p50']:.1f}ms "
+                      f"p95={run['latency_ms']['p95']:.1f}ms")
+    return runs
+
+
+def best_run(runs: list, objective: str) -> dict:
+    if objective == "throughput":
+        return max(runs, key=lambda run: run["throughput"])
+    return min(runs, key=lambda run: (run["latency_ms"]["p50"], -run["throughput"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune CPU threads, replicas and batch size for both models")
+    parser.add_argument("--qa-file", default="./data/evaluated_qa_pairs.json", help="Questions for reranker pairs")
+    parser.add_argument("--corpus", default="./data/articles_normalized.jsonl")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--models", default="embedding,reranking", help="Models to tune (the others keep their profile)")
+    parser.add_argument("--samples", type=int, default=512, help="Chunks (or pairs) per throughput run")
+    parser.add_argument("--requests", type=int, default=30, help="Request-sized calls per latency run")
+    parser.add_argument("--article-chunks", type=int, default=10, help="Chunks per bi-encoder request")
+    parser.add_argument("--candidates", type=int, default=20, help="Pairs per cross-encoder request")
+    parser.add_argument("--threads", help="Intra-op thread counts (default: 1, 2, 4, ... up to the core count)")
+    parser.add_argument("--replicas", default="1,2,4")
+    parser.add_argument("--batch-sizes", default="8,16,32,64")
+    parser.add_argument("--embedding-objective", choices=["throughput", "latency"], default="throughput")
+    parser.add_argument("--reranking-objective", choices=["throughput", "latency"], default="latency")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--profile-output", default=os.getenv("INFERENCE_PROFILE", DEFAULT_PROFILE_PATH),
+                        help="Inference profile to write (loaded via INFERENCE_PROFILE)")
+    parser.add_argument("--output", help="Results JSON path (default: ./data/benchmarks/autotune_<timestamp>.json)")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    thread_counts = int_list(args.threads) if args.threads else default_thread_counts(cores)
+    replica_counts, batch_sizes = int_list(args.replicas), int_list(args.batch_sizes)
+    models = args.models.split(",")
+
+    rng = random.Random(args.seed)
+    texts = [chunk["text"] for chunk in load_corpus_chunks(args.corpus, args.chunk_size, args.chunk_overlap)]
+    texts = rng.sample(texts, min(args.samples, len(texts)))
+    print(f"{len(texts)} corpus chunks, {cores} cores, threads {thread_counts}, replicas {replica_counts}, "
+          f"batch sizes {batch_sizes}")
+
+    runs, objectives = {}, {}
+    if "embedding" in models:
+        retrieval_model = SentenceTransformer(RETRIEVAL_MODEL, device=args.device)
+        requests = [rng.sample(texts, min(args.article_chunks, len(texts))) for _ in range(args.requests)]
+        runs["embedding"] = sweep("embedding", retrieval_model, "encode", texts, requests, thread_counts,
+                                  replica_counts, batch_sizes, cores, args.warmup)
+        objectives["embedding"] = (args.embedding_objective, RETRIEVAL_MODEL)
+        del retrieval_model
+
+    if "reranking" in models:
+        reranker_model = CrossEncoder(RERANKER_MODEL, device=args.device)
+        questions = [qa["question"] for qa in load_qa_pairs(args.qa_file)]
+        pairs = [(rng.choice(questions), text) for text in texts]
+        requests = [[(question, text) for text in rng.sample(texts, min(args.candidates, len(texts)))]
+                    for question in rng.sample(questions, min(args.requests, len(questions)))]
+        runs["reranking"] = sweep("reranking", reranker_model, "predict", pairs, requests, thread_counts,
+                                  replica_counts, batch_sizes, cores, args.warmup)
+        objectives["reranking"] = (args.reranking_objective, RERANKER_MODEL)
+
+    # Keep the tuned settings of models not swept this time
+    profile = load_inference_profile(args.profile_output)
+    if profile.get("device", args.device) != args.device:
+        profile = {}
+    profile.update({"device": args.device, "cpu_count": cores, "created": time.strftime("%Y-%m-%dT%H:%M:%S")})
+    for key, (objective, model_name) in objectives.items():
+        best = best_run(runs[key], objective)
+        profile[key] = {"model": model_name, "objective": objective, **best}
+        print(f"Best {key} ({objective}): {best['threads']} threads, {best['replicas']} replicas, "
+              f"batch size {best['batch_size']}: {best['throughput']:.1f}/s, p50 {best['latency_ms']['p50']:.1f}ms")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.profile_output)), exist_ok=True)
+    with open(args.profile_output, "w", encoding="utf-8") as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+    print(f"Inference profile written to {args.profile_output}")
+
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "cpu_count": cores,
+        "n_chunks": len(texts),
+        "runs": runs,
+        "profile": profile,
+    }
+    print(f"Results written to {write_results(results, args.output, prefix='autotune')}")
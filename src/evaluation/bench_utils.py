@@ -0,0 +1,105 @@
+"""Shared helpers for the offline benchmarks: QA loading, relevance matching, ranking metrics, latency stats."""
+import json
+import math
+import os
+import re
+import time
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def load_qa_pairs(path: str, min_score: int = 0) -> list:
+    """
+    Load generated_qa_pairs.json / evaluated_qa_pairs.json (or their JSONL form).
+    With min_score > 0, pairs whose critique scores are below it are dropped.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            pairs = [json.loads(line) for line in f if line.strip()]
+            pairs = [p for p in pairs if p.get("status", "ok") == "ok"]
+        else:
+            pairs = json.load(f)
+
+    if min_score > 0:
+        criteria = ("groundedness", "relevance", "standalone")
+        pairs = [p for p in pairs if all(p.get(f"{c}_score", 0) >= min_score for c in criteria)]
+    return [p for p in pairs if p.get("question") and p.get("context")]
+
+
+def shingles(text: str, size: int = 5) -> set:
+    words = WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def is_relevant(chunk_text: str, context: str, threshold: float = 0.5, context_shingles: set = None) -> bool:
+    """
+    A retrieved chunk counts as the source context when it covers at least
+    `threshold` of the context's word 5-grams. This tolerates chunk boundaries
+    that differ slightly from the ones used at generation time, while a
+    neighbouring chunk (sharing only the 200-char overlap) does not match.
+    """
+    context_shingles = context_shingles if context_shingles is not None else shingles(context)
+    if not context_shingles:
+        return False
+    return len(shingles(chunk_text) & context_shingles) / len(context_shingles) >= threshold
+
+
+def first_relevant_rank(texts: list, context: str, threshold: float = 0.5):
+    """1-based rank of the first chunk matching the context, or None"""
+    context_shingles = shingles(context)
+    for rank, text in enumerate(texts, start=1):
+        if is_relevant(text, context, threshold, context_shingles):
+            return rank
+    return None
+
+
+def ranking_metrics(ranks: list, ks: list) -> dict:
+    """
+    recall@k, MRR and nDCG@k for queries with a single relevant chunk.
+    `ranks` holds the first relevant rank per query (None when not retrieved).
+    """
+    n = len(ranks) or 1
+    metrics = {"mrr": sum(1.0 / r for r in ranks if r) / n}
+    for k in ks:
+        hits = [r for r in ranks if r and r <= k]
+        metrics[f"recall@{k}"] = len(hits) / n
+        # With one relevant item the ideal DCG is 1
+        metrics[f"ndcg@{k}"] = sum(1.0 / math.log2(r + 1) for r in hits) / n
+    return {name: round(value, 4) for name, value in metrics.items()}
+
+
+def percentile(values: list, q: float) -> float:
+    """Linear-interpolated percentile, q in [0, 100]"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def latency_summary(seconds: list) -> dict:
+    """Mean and tail latencies in milliseconds"""
+    ms = [s * 1000 for s in seconds]
+    return {
+        "count": len(ms),
+        "mean": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50": round(percentile(ms, 50), 3),
+        "p90": round(percentile(ms, 90), 3),
+        "p95": round(percentile(ms, 95), 3),
+        "p99": round(percentile(ms, 99), 3),
+        "max": round(max(ms), 3) if ms else 0.0,
+    }
+
+
+def write_results(results: dict, output: str = None, prefix: str = "benchmark") -> str:
+    """Write machine-readable results; defaults to ./data/benchmarks/<prefix>_<timestamp>.json"""
+    if not output:
+        output = os.path.join("./data/benchmarks", f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return output
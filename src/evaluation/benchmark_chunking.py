@@ -0,0 +1,114 @@
+"""
+Compare the character splitter with the token-aligned chunker.
+
+For each splitter over the same articles, reports chunk counts, token length
+percentiles, the share of chunks the bi-encoder truncates (and of tokens it
+never sees), splitting throughput and, with --encode, end-to-end indexing
+throughput (split + embed).
+
+    python src/evaluation/benchmark_chunking.py --corpus ./data/articles_normalized.jsonl --limit 2000 --encode
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from sentence_transformers import SentenceTransformer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.token_chunker import TokenChunker
+from bench_utils import percentile, write_results
+
+RETRIEVAL_MODEL = 'bkai-foundation-models/vietnamese-bi-encoder'
+
+
+def load_articles(corpus_file: str, limit: int = None) -> list:
+    """Article texts joined the way chunk_n_load.py joins them"""
+    texts = []
+    with open(corpus_file, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            texts.append(" ".join(json.loads(line).get("content", [])))
+            if limit and len(texts) >= limit:
+                break
+    return texts
+
+
+def measure(name: str, splitter, texts: list, model, encode: bool, batch_size: int, device: str) -> dict:
+    start = time.perf_counter()
+    chunks = [chunk for text in texts for chunk in splitter.split_text(text)]
+    split_seconds = time.perf_counter() - start
+
+    # Exact lengths as the model sees them, special tokens included
+    lengths = [len(ids) for ids in model.tokenizer(chunks, add_special_tokens=True)["input_ids"]] if chunks else []
+    limit = model.max_seq_length
+    truncated = [n for n in lengths if n > limit]
+    total_tokens = sum(lengths)
+
+    result = {
+        "articles": len(texts),
+        "chunks": len(chunks),
+        "chunks_per_article": round(len(chunks) / len(texts), 3) if texts else 0.0,
+        "stored_chars": sum(len(c) for c in chunks),
+        "tokens": {
+            "mean": round(total_tokens / len(lengths), 1) if lengths else 0.0,
+            "p50": percentile(lengths, 50),
+            "p95": percentile(lengths, 95),
+            "max": max(lengths, default=0),
+        },
+        "truncation_rate": round(len(truncated) / len(lengths), 4) if lengths else 0.0,
+        "unembedded_token_fraction": round(sum(n - limit for n in truncated) / total_tokens, 4) if total_tokens else 0.0,
+        "split_articles_per_second": round(len(texts) / split_seconds, 1) if split_seconds else 0.0,
+    }
+    if encode and chunks:
+        start = time.perf_counter()
+        model.encode(chunks, device=device, batch_size=batch_size)
+        encode_seconds = time.perf_counter() - start
+        result["index_chunks_per_second"] = round(len(chunks) / (split_seconds + encode_seconds), 1)
+        result["index_articles_per_second"] = round(len(texts) / (split_seconds + encode_seconds), 2)
+
+    print(f"{name:>6}: {result['chunks']} chunks, {result['chunks_per_article']} per article, "
+          f"tokens p50={result['tokens']['p50']:.0f} p95={result['tokens']['p95']:.0f}, "
+          f"truncated {result['truncation_rate']:.1%} of chunks / "
+          f"{result['unembedded_token_fraction']:.1%} of tokens")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark character vs token-aligned chunking")
+    parser.add_argument("--corpus", default="./data/articles_normalized.jsonl")
+    parser.add_argument("--limit", type=int, default=2000, help="Articles to chunk")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--overlap-tokens", type=int, help="Token overlap (default: 20%% of the budget)")
+    parser.add_argument("--encode", action="store_true", help="Also embed the chunks to measure indexing throughput")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--output", help="Results JSON path (default: ./data/benchmarks/chunking_<timestamp>.json)")
+    args = parser.parse_args()
+
+    texts = load_articles(args.corpus, args.limit)
+    print(f"Loaded {len(texts)} articles from {args.corpus}")
+    model = SentenceTransformer(RETRIEVAL_MODEL, device=args.device)
+
+    splitters = {
+        "chars": RecursiveCharacterTextSplitter(
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+            length_function=len,
+            separators=["\n\n", "\n", ". ", "! ", "? "]
+        ),
+        "tokens": TokenChunker.from_model(model, args.overlap_tokens),
+    }
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "max_seq_length": model.max_seq_length,
+        "splitters": {
+            name: measure(name, splitter, texts, model, args.encode, args.batch_size, args.device)
+            for name, splitter in splitters.items()
+        },
+    }
+    output = write_results(results, args.output, prefix="chunking")
+    print(f"Results written to {output}")
@@ -0,0 +1,166 @@
+"""
+Memory and recall report for reduced-dimension first-stage vectors.
+
+Embeds the corpus once (cached), then for each PCA dimension (and with or
+without int8 scalar quantization) runs exact search in the reduced space for
+top_k * oversample candidates, rescores them with the full vectors and
+compares against the full 768-dim float32 search:
+
+    - recall@k / MRR of each question's source context (as in benchmark_retrieval.py)
+    - overlap@k with the full-dimension top-k
+    - RAM per vector and for the whole corpus (full vectors move to disk)
+
+Exact search isolates the effect of the vector representation; HNSW recall
+is the same order of loss on top of it for every variant.
+
+    python src/evaluation/benchmark_dimensions.py --dims 64,128,192,256 --int8 --oversample 4
+"""
+import argparse
+import os
+import sys
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.projection import PCAProjection
+from bench_utils import load_qa_pairs, first_relevant_rank, ranking_metrics, write_results
+from benchmark_retrieval import RETRIEVAL_MODEL, load_corpus_chunks
+
+FULL_BYTES = 768 * 4
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def int8_roundtrip(vectors: np.ndarray, quantile: float = 0.99) -> np.ndarray:
+    """Scalar int8 quantization as Qdrant does it (one range from the value quantiles), then back to float"""
+    low, high = np.quantile(vectors, [1 - quantile, quantile])
+    scale = (high - low) / 255 or 1.0
+    codes = np.clip(np.round((vectors - low) / scale), 0, 255)
+    return codes * scale + low
+
+
+def top_indices(queries: np.ndarray, corpus: np.ndarray, k: int, batch: int = 256) -> np.ndarray:
+    results = []
+    for start in range(0, len(queries), batch):
+        scores = queries[start:start + batch] @ corpus.T
+        top = np.argpartition(-scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+        order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+        results.append(np.take_along_axis(top, order, axis=1))
+    return np.concatenate(results)
+
+
+def rescore(candidates: np.ndarray, queries: np.ndarray, corpus: np.ndarray, k: int) -> np.ndarray:
+    """Reorder each query's candidates by full-precision cosine and keep k"""
+    rescored = []
+    for query, ids in zip(queries, candidates):
+        scores = corpus[ids] @ query
+        rescored.append(ids[np.argsort(-scores)[:k]])
+    return np.array(rescored)
+
+
+def evaluate(ids: np.ndarray, baseline: np.ndarray, chunks: list, qa_pairs: list, ks: list, threshold: float) -> dict:
+    ranks = [first_relevant_rank([chunks[i]["text"] for i in row], qa["context"], threshold)
+             for row, qa in zip(ids, qa_pairs)]
+    metrics = ranking_metrics(ranks, ks)
+    for k in ks:
+        overlap = np.mean([len(set(row[:k]) & set(base[:k])) / k for row, base in zip(ids, baseline)])
+        metrics[f"overlap@{k}"] = round(float(overlap), 4)
+    return metrics
+
+
+def load_embeddings(cache: str, texts: list, model, device: str, batch_size: int) -> np.ndarray:
+    if cache and os.path.exists(cache):
+        vectors = np.load(cache)
+        if len(vectors) == len(texts):
+            return vectors
+    vectors = np.asarray(model.encode(texts, device=device, batch_size=batch_size, show_progress_bar=True),
+                         dtype=np.float32)
+    if cache:
+        np.save(cache, vectors)
+    return vectors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory and recall of PCA/int8 first-stage vectors")
+    parser.add_argument("--qa-file", default="./data/evaluated_qa_pairs.json")
+    parser.add_argument("--min-score", type=int, default=0)
+    parser.add_argument("--corpus", default="./data/articles_normalized.jsonl")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--embeddings-cache", default="./data/bench_embeddings.npy")
+    parser.add_argument("--dims", default="64,128,192,256")
+    parser.add_argument("--int8", action="store_true", help="Also report int8-quantized variants")
+    parser.add_argument("--oversample", type=int, default=4)
+    parser.add_argument("--fit-sample", type=int, default=20000, help="Corpus vectors used to fit PCA")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--ks", default="1,5,10,20")
+    parser.add_argument("--match-threshold", type=float, default=0.5)
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--output", help="Results JSON path (default: ./data/benchmarks/dimensions_<timestamp>.json)")
+    args = parser.parse_args()
+
+    qa_pairs = load_qa_pairs(args.qa_file, args.min_score)[:args.limit]
+    chunks = load_corpus_chunks(args.corpus, args.chunk_size, args.chunk_overlap)
+    print(f"{len(qa_pairs)} questions, {len(chunks)} corpus chunks")
+
+    model = SentenceTransformer(RETRIEVAL_MODEL, device=args.device)
+    corpus = normalize(load_embeddings(args.embeddings_cache, [c["text"] for c in chunks], model,
+                                       args.device, args.batch_size))
+    queries = normalize(np.asarray(model.encode([qa["question"] for qa in qa_pairs], device=args.device,
+                                                batch_size=args.batch_size), dtype=np.float32))
+    ks = [int(k) for k in args.ks.split(",") if int(k) <= args.top_k]
+
+    baseline = top_indices(queries, corpus, args.top_k)
+    variants = {"full_float32": {
+        "ram_bytes_per_vector": FULL_BYTES,
+        "rescored": evaluate(baseline, baseline, chunks, qa_pairs, ks, args.match_threshold),
+    }}
+
+    rng = np.random.default_rng(0)
+    sample = corpus[rng.choice(len(corpus), min(args.fit_sample, len(corpus)), replace=False)]
+    configs = [(int(d), False) for d in args.dims.split(",")]
+    if args.int8:
+        configs += [(int(d), True) for d in args.dims.split(",")] + [(768, True)]
+    for dim, quantized in configs:
+        if dim < 768:
+            projection = PCAProjection.fit(sample, dim)
+            reduced_corpus, reduced_queries = projection.transform(corpus), projection.transform(queries)
+            explained = round(projection.explained_variance, 4)
+        else:
+            reduced_corpus, reduced_queries, explained = corpus, queries, 1.0
+        if quantized:
+            reduced_corpus = int8_roundtrip(reduced_corpus)
+        candidates = top_indices(reduced_queries, reduced_corpus, args.top_k * args.oversample)
+        name = f"pca{dim}" if dim < 768 else "full"
+        name += "_int8" if quantized else "_float32"
+        variants[name] = {
+            "explained_variance": explained,
+            "ram_bytes_per_vector": dim * (1 if quantized else 4),
+            "no_rescore": evaluate(candidates[:, :args.top_k], baseline, chunks, qa_pairs, ks, args.match_threshold),
+            "rescored": evaluate(rescore(candidates, queries, corpus, args.top_k), baseline, chunks, qa_pairs, ks,
+                                 args.match_threshold),
+        }
+
+    for name, variant in variants.items():
+        ram = variant["ram_bytes_per_vector"]
+        variant["ram_mb"] = round(ram * len(corpus) / 2**20, 2)
+        variant["ram_saved"] = round(1 - ram / FULL_BYTES, 4)
+        top_k_label = f"recall@{ks[-1]}"
+        print(f"{name:>14}: {variant['ram_mb']:8.1f} MB RAM ({variant['ram_saved']:.0%} saved), "
+              f"{top_k_label}={variant['rescored'][top_k_label]:.3f}, "
+              f"overlap@{ks[-1]}={variant['rescored'][f'overlap@{ks[-1]}']:.3f}")
+
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "n_questions": len(qa_pairs),
+        "n_vectors": len(corpus),
+        "note": "RAM covers first-stage vectors only; full vectors of reduced variants stay on disk for rescoring",
+        "variants": variants,
+    }
+    output = write_results(results, args.output, prefix="dimensions")
+    print(f"Results written to {output}")
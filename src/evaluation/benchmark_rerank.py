@@ -0,0 +1,124 @@
+"""
+Rerank latency with and without ingestion-time reranker tokens.
+
+Builds (or reuses) a token store of the chunked corpus, then reranks the
+same candidate sets per question twice: with CrossEncoder.predict(), which
+tokenizes every pair, and with PretokenizedReranker, which only tokenizes
+the query. Reports per-query latency percentiles for both, the time spent
+preparing inputs alone, and how closely the scores and top-k orders agree.
+
+Candidate sets are random corpus chunks (fixed seed): rerank cost depends
+on their lengths, not on their relevance, so no index is needed.
+
+    python src/evaluation/benchmark_rerank.py --candidates 20 --device cuda
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import time
+import numpy as np
+from sentence_transformers import CrossEncoder
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.rerank_tokens import PretokenizedReranker, TokenStore, TokenStoreWriter
+from bench_utils import load_qa_pairs, latency_summary, write_results
+from benchmark_retrieval import RERANKER_MODEL, load_corpus_chunks
+
+
+def build_token_store(path: str, texts: list, tokenizer, batch_size: int = 256) -> float:
+    """Write the token store for `texts`; returns the seconds spent"""
+    start = time.perf_counter()
+    writer = TokenStoreWriter(path, tokenizer)
+    for i in tqdm(range(0, len(texts), batch_size), desc="Tokenizing corpus"):
+        writer.add_texts(texts[i:i + batch_size])
+    writer.close()
+    return time.perf_counter() - start
+
+
+def timed(function, *args, **kwargs) -> tuple:
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rerank latency with and without precomputed reranker tokens")
+    parser.add_argument("--qa-file", default="./data/evaluated_qa_pairs.json")
+    parser.add_argument("--min-score", type=int, default=0)
+    parser.add_argument("--corpus", default="./data/articles_normalized.jsonl")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--token-store", default="./data/bench_rerank_tokens")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the token store even if it exists")
+    parser.add_argument("--candidates", type=int, default=20, help="Chunks reranked per question")
+    parser.add_argument("--rerank-top-k", type=int, default=10, help="Cutoff for the top-k agreement check")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--output", help="Results JSON path (default: ./data/benchmarks/rerank_<timestamp>.json)")
+    args = parser.parse_args()
+
+    qa_pairs = load_qa_pairs(args.qa_file, args.min_score)[:args.limit]
+    texts = [chunk["text"] for chunk in load_corpus_chunks(args.corpus, args.chunk_size, args.chunk_overlap)]
+    print(f"{len(qa_pairs)} questions, {len(texts)} corpus chunks")
+
+    cross_encoder = CrossEncoder(RERANKER_MODEL, device=args.device)
+    build_seconds = None
+    if args.rebuild:
+        # TokenStoreWriter extends an existing store
+        shutil.rmtree(args.token_store, ignore_errors=True)
+    if not os.path.exists(os.path.join(args.token_store, "meta.json")):
+        build_seconds = build_token_store(args.token_store, texts, cross_encoder.tokenizer)
+        print(f"Token store built in {build_seconds:.1f}s")
+    pretokenized = PretokenizedReranker(cross_encoder, TokenStore(args.token_store))
+
+    rng = random.Random(args.seed)
+    candidate_sets = [[(qa["question"], text) for text in rng.sample(texts, args.candidates)] for qa in qa_pairs]
+    for pairs in candidate_sets[:args.warmup]:
+        cross_encoder.predict(pairs, batch_size=args.batch_size)
+        pretokenized.predict(pairs, batch_size=args.batch_size)
+
+    timings = {"baseline": [], "pretokenized": [], "baseline_inputs": [], "pretokenized_inputs": []}
+    max_diff, same_top_k = 0.0, 0
+    for pairs in tqdm(candidate_sets, desc="Reranking"):
+        # Input preparation alone: full pair tokenization vs stored passages plus the query
+        _, seconds = timed(cross_encoder.tokenizer, [query for query, _ in pairs], [text for _, text in pairs],
+                           padding=True, truncation="only_second", max_length=pretokenized.max_length)
+        timings["baseline_inputs"].append(seconds)
+        _, seconds = timed(pretokenized.features, pairs)
+        timings["pretokenized_inputs"].append(seconds)
+
+        baseline, seconds = timed(cross_encoder.predict, pairs, batch_size=args.batch_size)
+        timings["baseline"].append(seconds)
+        scores, seconds = timed(pretokenized.predict, pairs, batch_size=args.batch_size)
+        timings["pretokenized"].append(seconds)
+
+        baseline = np.asarray(baseline, dtype=np.float32)
+        max_diff = max(max_diff, float(np.abs(baseline - scores).max()))
+        same_top_k += list(np.argsort(-baseline)[:args.rerank_top_k]) == list(np.argsort(-scores)[:args.rerank_top_k])
+
+    latency = {name: latency_summary(values) for name, values in timings.items()}
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "n_questions": len(qa_pairs),
+        "token_store": {"chunks": len(pretokenized.token_store), "build_seconds": build_seconds,
+                        "hits": pretokenized.hits, "misses": pretokenized.misses},
+        "latency_ms": latency,
+        "speedup_p50": round(latency["baseline"]["p50"] / latency["pretokenized"]["p50"], 3)
+        if latency["pretokenized"]["p50"] else None,
+        # Fixed query/passage truncation budgets are the only intended difference from CrossEncoder.predict()
+        "max_score_diff": round(max_diff, 6),
+        f"same_top{args.rerank_top_k}_order": round(same_top_k / len(candidate_sets), 4) if candidate_sets else 0.0,
+    }
+    output = write_results(results, args.output, prefix="rerank")
+
+    for name, summary in latency.items():
+        print(f"{name:>20}: p50={summary['p50']:.1f}ms p95={summary['p95']:.1f}ms p99={summary['p99']:.1f}ms")
+    print(f"Speedup (p50): {results['speedup_p50']}x, max score diff {results['max_score_diff']}, "
+          f"same top-{args.rerank_top_k} order for {results[f'same_top{args.rerank_top_k}_order']:.1%} of questions")
+    print(f"Results written to {output}")
@@ -0,0 +1,308 @@
+"""
+Offline retrieval benchmark over the generated QA set.
+
+Builds (or reuses) a local Qdrant index of the normalized corpus, runs every
+question through the same retrieve() used in serving and reports recall@k, MRR
+and nDCG@k against each question's source context, plus per-stage latency
+percentiles and throughput.
+
+    python src/evaluation/benchmark_retrieval.py --qa-file ./data/evaluated_qa_pairs.json --min-score 4
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from sentence_transformers import SentenceTransformer, CrossEncoder
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.chunk_store import ChunkStore, ChunkStoreWriter
+from common.locations import article_locations, extract_locations
+from common.qdrant_collections import ensure_payload_indexes
+from common.token_chunker import TokenChunker
+from retrieval_and_generation.retrieval import build_filter, retrieve, retrieve_batch, rerank_batch, expand_documents
+from bench_utils import load_qa_pairs, first_relevant_rank, ranking_metrics, latency_summary, write_results
+
+RETRIEVAL_MODEL = 'bkai-foundation-models/vietnamese-bi-encoder'
+RERANKER_MODEL = 'BAAI/bge-reranker-base'
+
+
+def load_corpus_chunks(corpus_file: str, chunk_size: int, chunk_overlap: int, splitter=None) -> list:
+    """Chunk the normalized corpus the same way chunk_n_load.py does"""
+    text_splitter = splitter or RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", ". ", "! ", "? "]
+    )
+    chunks = []
+    with open(corpus_file, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            article = json.loads(line)
+            metadata = article.get("metadata", {})
+            content = " ".join(article.get("content", []))
+            for i, chunk in enumerate(text_splitter.split_text(content)):
+                chunks.append({
+                    "text": chunk,
+                    "article_id": str(uuid.uuid5(uuid.NAMESPACE_URL, metadata.get("url", ""))),
+                    "chunk_index": i,
+                    "title": metadata.get("title", ""),
+                    "url": metadata.get("url", ""),
+                    "source": metadata.get("source", ""),
+                    "timestamp": metadata.get("timestamp"),
+                    "locations": article_locations(metadata.get("title", ""), metadata.get("url", "")),
+                })
+    return chunks
+
+
+def build_index(client, collection_name: str, chunks: list, retrieval_model, device: str, batch_size: int = 64,
+                chunk_store_path: str = None):
+    """
+    (Re)create a local collection holding every corpus chunk. With chunk_store_path
+    the text goes to a ChunkStore and points keep only slim payloads, as in chunk_n_load.py.
+    """
+    store = ChunkStoreWriter(chunk_store_path) if chunk_store_path else None
+    article_indexes = {}
+    if any(c.name == collection_name for c in client.get_collections().collections):
+        client.delete_collection(collection_name)
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(
+            size=retrieval_model.get_sentence_embedding_dimension(),
+            distance=models.Distance.COSINE
+        )
+    )
+    ensure_payload_indexes(client, collection_name)
+    for start in tqdm(range(0, len(chunks), batch_size), desc="Indexing corpus"):
+        batch = chunks[start:start + batch_size]
+        embeddings = retrieval_model.encode([c["text"] for c in batch], device=device, batch_size=batch_size)
+        points = []
+        for i, (chunk, embedding) in enumerate(zip(batch, embeddings)):
+            point_id, payload = start + i, chunk
+            if store is not None:
+                if chunk["url"] not in article_indexes:
+                    article_indexes[chunk["url"]] = store.add_article({
+                        "article_id": chunk["article_id"], "title": chunk["title"], "url": chunk["url"]})
+                point_id = store.add_chunk(article_indexes[chunk["url"]], chunk["chunk_index"], chunk["text"])
+                payload = {key: chunk[key] for key in ("article_id", "chunk_index", "source", "timestamp", "locations")}
+            points.append(models.PointStruct(id=point_id, vector=embedding.tolist(), payload=payload))
+        client.upsert(collection_name=collection_name, points=points)
+    if store is not None:
+        store.close()
+
+
+def index_is_current(manifest_file: str, manifest: dict) -> bool:
+    if not os.path.exists(manifest_file):
+        return False
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        return json.load(f) == manifest
+
+
+def location_filter(question: str, enabled: bool):
+    locations = extract_locations(question) if enabled else ()
+    return build_filter(locations=locations) if locations else None
+
+
+def run_benchmark(qa_pairs: list, retrieval_model, reranker_model, client, collection_name: str,
+                  top_k: int, rerank_top_k: int, device: str, threshold: float, chunk_store=None,
+                  expand: dict = None, query_locations: bool = False, diversity: dict = None):
+    """
+    Run every question; return first-stage ranks, reranked ranks and per-stage timings.
+    With `expand` (expand_documents() keyword arguments) the reranked hits are
+    expanded before scoring. With query_locations, questions naming a province
+    are searched only within articles about it. `diversity` holds retrieve()'s
+    group_size / mmr_lambda / mmr_top_k; first-stage ranks are then scored on
+    the diversified candidates.
+    """
+    first_stage_ranks, reranked_ranks = [], []
+    stage_timings = {"encode": [], "search": [], "mmr": [], "rerank": [], "expand": [], "total": []}
+
+    for qa in tqdm(qa_pairs, desc="Running queries"):
+        timings = {}
+        start = time.perf_counter()
+        # Rerank separately below so the first-stage ordering can be scored too
+        candidates = retrieve(qa["question"], retrieval_model, None, client, collection_name,
+                              top_k=top_k, rerank_top_k=top_k, device=device, timings=timings,
+                              chunk_store=chunk_store, query_filter=location_filter(qa["question"], query_locations),
+                              **(diversity or {}))
+        first_stage_ranks.append(first_relevant_rank([c["text"] for c in candidates], qa["context"], threshold))
+
+        if reranker_model is not None and candidates:
+            rerank_start = time.perf_counter()
+            pairs = [(qa["question"], c["text"]) for c in candidates]
+            scores = reranker_model.predict(pairs)
+            order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)[:rerank_top_k]
+            timings["rerank"] = time.perf_counter() - rerank_start
+            final = [candidates[i] for i in order]
+        else:
+            final = candidates[:rerank_top_k]
+        if expand:
+            expand_start = time.perf_counter()
+            final = expand_documents(final, chunk_store=chunk_store, qdrant_client=client,
+                                     collection_name=collection_name, **expand)
+            timings["expand"] = time.perf_counter() - expand_start
+        reranked_ranks.append(first_relevant_rank([d["text"] for d in final], qa["context"], threshold))
+        timings["total"] = time.perf_counter() - start
+
+        for stage in stage_timings:
+            if stage in timings:
+                stage_timings[stage].append(timings[stage])
+
+    return first_stage_ranks, reranked_ranks, stage_timings
+
+
+def run_benchmark_batched(qa_pairs: list, retrieval_model, reranker_model, client, collection_name: str,
+                          top_k: int, rerank_top_k: int, device: str, threshold: float, batch_size: int,
+                          chunk_store=None, expand: dict = None, query_locations: bool = False,
+                          diversity: dict = None):
+    """Same as run_benchmark through the batch API; stage timings are per batch"""
+    first_stage_ranks, reranked_ranks = [], []
+    stage_timings = {"encode": [], "search": [], "mmr": [], "rerank": [], "expand": [], "total": []}
+
+    for start_index in tqdm(range(0, len(qa_pairs), batch_size), desc="Running query batches"):
+        batch = qa_pairs[start_index:start_index + batch_size]
+        questions = [qa["question"] for qa in batch]
+        timings = {}
+        start = time.perf_counter()
+        candidates = retrieve_batch(questions, retrieval_model, None, client, collection_name,
+                                    top_k=top_k, rerank_top_k=top_k, device=device,
+                                    batch_size=batch_size, timings=timings, chunk_store=chunk_store,
+                                    query_filters=[location_filter(q, query_locations) for q in questions],
+                                    **(diversity or {}))
+        first_stage_texts = [[c["text"] for c in documents] for documents in candidates]
+        if reranker_model is not None:
+            rerank_start = time.perf_counter()
+            final = rerank_batch(questions, candidates, reranker_model, rerank_top_k, batch_size)
+            timings["rerank"] = time.perf_counter() - rerank_start
+        else:
+            final = [documents[:rerank_top_k] for documents in candidates]
+        if expand:
+            expand_start = time.perf_counter()
+            final = [expand_documents(documents, chunk_store=chunk_store, qdrant_client=client,
+                                      collection_name=collection_name, **expand) for documents in final]
+            timings["expand"] = time.perf_counter() - expand_start
+        timings["total"] = time.perf_counter() - start
+
+        for qa, texts, documents in zip(batch, first_stage_texts, final):
+            first_stage_ranks.append(first_relevant_rank(texts, qa["context"], threshold))
+            reranked_ranks.append(first_relevant_rank([d["text"] for d in documents], qa["context"], threshold))
+        for stage in stage_timings:
+            if stage in timings:
+                stage_timings[stage].append(timings[stage])
+
+    return first_stage_ranks, reranked_ranks, stage_timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline retrieval quality and latency benchmark")
+    parser.add_argument("--qa-file", default="./data/evaluated_qa_pairs.json")
+    parser.add_argument("--min-score", type=int, default=0,
+                        help="Only keep QA pairs whose critique scores are all >= this value")
+    parser.add_argument("--corpus", default="./data/articles_normalized.jsonl")
+    parser.add_argument("--index-path", default="./data/bench_index", help="Local Qdrant storage directory")
+    parser.add_argument("--collection", default="bench_chunks")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the local index even if it is current")
+    parser.add_argument("--slim", action="store_true",
+                        help="Index slim payloads and serve chunk text from a local ChunkStore")
+    parser.add_argument("--chunker", choices=["chars", "tokens"], default="chars")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--rerank-top-k", type=int, default=10)
+    parser.add_argument("--no-rerank", action="store_true")
+    parser.add_argument("--expand", choices=["neighbors", "article"],
+                        help="Expand reranked hits to neighboring chunks or their whole article before scoring")
+    parser.add_argument("--expand-window", type=int, default=1)
+    parser.add_argument("--expand-max-chars", type=int, default=3000)
+    parser.add_argument("--query-locations", action="store_true",
+                        help="Filter the search to provinces named in the question")
+    parser.add_argument("--group-size", type=int,
+                        help="Group the search by article, keeping at most this many chunks per article")
+    parser.add_argument("--mmr-lambda", type=float,
+                        help="MMR relevance/diversity trade-off applied to the candidates before reranking")
+    parser.add_argument("--mmr-top-k", type=int, help="Candidates kept by MMR (default: half of --top-k)")
+    parser.add_argument("--ks", default="1,3,5,10", help="Comma-separated cutoffs for recall@k and nDCG@k")
+    parser.add_argument("--match-threshold", type=float, default=0.5,
+                        help="Fraction of the context's 5-grams a chunk must cover to count as relevant")
+    parser.add_argument("--limit", type=int, help="Only run the first N questions")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Queries per batch; >1 uses the batch API (latencies are then per batch)")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--output", help="Results JSON path (default: ./data/benchmarks/retrieval_<timestamp>.json)")
+    args = parser.parse_args()
+
+    qa_pairs = load_qa_pairs(args.qa_file, args.min_score)[:args.limit]
+    print(f"Loaded {len(qa_pairs)} QA pairs from {args.qa_file}")
+
+    retrieval_model = SentenceTransformer(RETRIEVAL_MODEL, device=args.device)
+    reranker_model = None if args.no_rerank else CrossEncoder(RERANKER_MODEL, device=args.device)
+    client = QdrantClient(path=args.index_path)
+
+    manifest = {
+        "corpus": os.path.abspath(args.corpus),
+        "corpus_mtime": os.path.getmtime(args.corpus),
+        "chunk_size": args.chunk_size,
+        "chunk_overlap": args.chunk_overlap,
+        "chunker": args.chunker,
+        "model": RETRIEVAL_MODEL,
+        "collection": args.collection,
+        "slim": args.slim,
+        # Payload layout; bump when build_index changes what points carry
+        "payload_version": 3,
+    }
+    manifest_file = os.path.join(args.index_path, "bench_manifest.json")
+    chunk_store_path = os.path.join(args.index_path, "chunk_store") if args.slim else None
+    if args.rebuild or not index_is_current(manifest_file, manifest):
+        splitter = TokenChunker.from_model(retrieval_model) if args.chunker == "tokens" else None
+        chunks = load_corpus_chunks(args.corpus, args.chunk_size, args.chunk_overlap, splitter)
+        print(f"Building local index with {len(chunks)} chunks...")
+        build_index(client, args.collection, chunks, retrieval_model, args.device,
+                    chunk_store_path=chunk_store_path)
+        with open(manifest_file, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+    chunk_store = ChunkStore(chunk_store_path) if chunk_store_path else None
+
+    expand = {"mode": args.expand, "window": args.expand_window,
+              "max_chars": args.expand_max_chars} if args.expand else None
+    diversity = {"group_size": args.group_size, "mmr_lambda": args.mmr_lambda, "mmr_top_k": args.mmr_top_k}
+
+    ks = [int(k) for k in args.ks.split(",")]
+    start = time.perf_counter()
+    if args.batch_size > 1:
+        first_stage_ranks, reranked_ranks, stage_timings = run_benchmark_batched(
+            qa_pairs, retrieval_model, reranker_model, client, args.collection,
+            args.top_k, args.rerank_top_k, args.device, args.match_threshold, args.batch_size, chunk_store, expand,
+            args.query_locations, diversity
+        )
+    else:
+        first_stage_ranks, reranked_ranks, stage_timings = run_benchmark(
+            qa_pairs, retrieval_model, reranker_model, client, args.collection,
+            args.top_k, args.rerank_top_k, args.device, args.match_threshold, chunk_store, expand, args.query_locations,
+            diversity
+        )
+    elapsed = time.perf_counter() - start
+
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "n_questions": len(qa_pairs),
+        "first_stage": ranking_metrics(first_stage_ranks, [k for k in ks if k <= args.top_k]),
+        "reranked": ranking_metrics(reranked_ranks, [k for k in ks if k <= args.rerank_top_k]),
+        "latency_unit": "batch" if args.batch_size > 1 else "query",
+        "latency_ms": {stage: latency_summary(values) for stage, values in stage_timings.items() if values},
+        "throughput_qps": round(len(qa_pairs) / elapsed, 3) if elapsed else 0.0,
+    }
+    output = write_results(results, args.output, prefix="retrieval")
+
+    print("\nFirst stage:", json.dumps(results["first_stage"]))
+    print("Reranked:   ", json.dumps(results["reranked"]))
+    for stage, summary in results["latency_ms"].items():
+        print(f"{stage:>7}: p50={summary['p50']:.1f}ms p95={summary['p95']:.1f}ms p99={summary['p99']:.1f}ms")
+    print(f"Throughput: {results['throughput_qps']} queries/s")
+    print(f"Results written to {output}")
@@ -0,0 +1,258 @@
+"""
+Load generator for the question-answering path.
+
+Replays a question corpus against retrieve() + the chat completion call at a
+target rate (--qps, open loop) or with a fixed number of in-flight requests
+(--concurrency, closed loop) and reports throughput, latency percentiles and
+error rates per stage. By default every dependency is a local stand-in
+(common/standins.py and common/openai_stub.py), so it runs with no network:
+
+    python src/evaluation/load_test.py --qa-file ./data/generated_qa_pairs.json --qps 20 --duration 60 \\
+        --search-latency-ms 15 --llm-latency-ms 800 --llm-jitter-ms 300
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.llm_client import cached_chat_completion
+from common.openai_stub import start_stub_server
+from common.standins import StubEncoder, StubReranker, StubVectorStore
+from retrieval_and_generation.retrieval import retrieve
+from bench_utils import load_qa_pairs, latency_summary, write_results
+
+STAGES = ("encode", "search", "rerank", "llm")
+SYSTEM_PROMPT = "Bạn là một trợ lý AI chuyên về du lịch. Hãy trả lời dựa trên ngữ cảnh."
+
+
+def load_questions(path: str) -> list:
+    """Questions from a QA pairs file, or one question per line from a text file"""
+    if path.endswith(".txt"):
+        with open(path, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    return [qa["question"] for qa in load_qa_pairs(path)]
+
+
+def load_chunks(corpus_file: str, qa_file: str, limit: int) -> list:
+    """Chunk payloads for the stand-in vector store: the corpus if present, else the QA contexts"""
+    chunks = []
+    if corpus_file and os.path.exists(corpus_file):
+        with open(corpus_file, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                article = json.loads(line)
+                metadata = article.get("metadata", {})
+                text = " ".join(article.get("content", []))
+                # Fixed 1000-char windows are close enough for load purposes
+                for start in range(0, len(text), 800):
+                    chunks.append({"text": text[start:start + 1000], "title": metadata.get("title", ""),
+                                   "url": metadata.get("url", "")})
+                if len(chunks) >= limit:
+                    break
+    else:
+        chunks = [{"text": qa["context"], "title": "", "url": ""} for qa in load_qa_pairs(qa_file)]
+    return chunks[:limit]
+
+
+class LoadRecorder:
+    """Thread-safe per-stage latencies and error counts"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {stage: [] for stage in STAGES + ("total",)}
+        self.errors = {stage: 0 for stage in STAGES}
+        self.completed = 0
+        self.failed = 0
+
+    def record(self, timings: dict, failed_stage: str = None):
+        with self.lock:
+            for stage, seconds in timings.items():
+                if stage in self.latencies:
+                    self.latencies[stage].append(seconds)
+            if failed_stage:
+                self.errors[failed_stage] = self.errors.get(failed_stage, 0) + 1
+                self.failed += 1
+            else:
+                self.completed += 1
+
+
+def run_request(question: str, pipeline: dict, recorder: LoadRecorder, scheduled_at: float):
+    """One question through retrieval and generation; latency is measured from the scheduled start"""
+    timings = {}
+    stage = "encode"
+    try:
+        chunks = retrieve(question, pipeline["encoder"], pipeline["reranker"], pipeline["store"],
+                          pipeline["collection"], top_k=pipeline["top_k"],
+                          rerank_top_k=pipeline["rerank_top_k"], device=pipeline["device"], timings=timings)
+        stage = "llm"
+        context = "\n\n---\n\n".join(chunk["text"] for chunk in chunks)
+        start = time.perf_counter()
+        cached_chat_completion(
+            pipeline["llm"],
+            model=pipeline["model"],
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f"Ngữ cảnh:{context} Câu hỏi: {question}"},
+            ],
+            temperature=0.7,
+            max_tokens=500
+        )
+        timings["llm"] = time.perf_counter() - start
+    except Exception:
+        if stage == "encode":
+            # retrieve() fills timings stage by stage; the first missing one failed
+            # (all three recorded: a later retrieve() step such as expansion failed)
+            stage = next((s for s in ("encode", "search", "rerank") if s not in timings), "retrieve")
+        timings["total"] = time.perf_counter() - scheduled_at
+        recorder.record(timings, failed_stage=stage)
+        return
+    timings["total"] = time.perf_counter() - scheduled_at
+    recorder.record(timings)
+
+
+def run_load(questions: list, pipeline: dict, qps: float, concurrency: int, duration: float, max_requests: int):
+    """Open loop when qps is set, closed loop otherwise; returns (recorder, elapsed, issued)"""
+    recorder = LoadRecorder()
+    rng = random.Random(0)
+    issued = 0
+    start = time.perf_counter()
+    deadline = start + duration
+
+    def should_continue():
+        return time.perf_counter() < deadline and (not max_requests or issued < max_requests)
+
+    if qps:
+        # Requests start on a fixed schedule regardless of how fast earlier ones finish,
+        # so queueing delay shows up in the latencies instead of being hidden
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            next_at = start
+            while should_continue():
+                now = time.perf_counter()
+                if now < next_at:
+                    time.sleep(next_at - now)
+                pool.submit(run_request, rng.choice(questions), pipeline, recorder, next_at)
+                issued += 1
+                next_at += 1.0 / qps
+    else:
+        lock = threading.Lock()
+
+        def worker():
+            nonlocal issued
+            while True:
+                with lock:
+                    if not should_continue():
+                        return
+                    issued += 1
+                    question = rng.choice(questions)
+                run_request(question, pipeline, recorder, time.perf_counter())
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    return recorder, time.perf_counter() - start, issued
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the RAG question-answering path")
+    parser.add_argument("--qa-file", default="./data/generated_qa_pairs.json",
+                        help="QA pairs JSON/JSONL, or a .txt file with one question per line")
+    parser.add_argument("--corpus", default="./data/articles_normalized.jsonl",
+                        help="Corpus for the stand-in vector store (falls back to the QA contexts)")
+    parser.add_argument("--max-chunks", type=int, default=20000)
+    parser.add_argument("--qps", type=float, help="Target request rate (open loop)")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="In-flight requests (closed loop), or worker threads with --qps")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--rerank-top-k", type=int, default=10)
+    # Stand-in latencies
+    parser.add_argument("--encode-latency-ms", type=float, default=10.0)
+    parser.add_argument("--search-latency-ms", type=float, default=15.0)
+    parser.add_argument("--search-jitter-ms", type=float, default=5.0)
+    parser.add_argument("--rerank-latency-ms", type=float, default=4.0, help="Per (query, chunk) pair")
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=300.0)
+    parser.add_argument("--llm-error-ratio", type=float, default=0.0)
+    # Real dependencies instead of stand-ins
+    parser.add_argument("--real-models", action="store_true", help="Use the real bi-encoder and cross-encoder")
+    parser.add_argument("--index-path", help="Local Qdrant index (e.g. from benchmark_retrieval.py) instead of the stub")
+    parser.add_argument("--collection", default="bench_chunks")
+    parser.add_argument("--llm-url", help="OpenAI-compatible base URL instead of the bundled stub")
+    parser.add_argument("--model", default="stub")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--output", help="Results JSON path (default: ./data/benchmarks/load_<timestamp>.json)")
+    args = parser.parse_args()
+
+    questions = load_questions(args.qa_file)
+    print(f"Loaded {len(questions)} questions")
+
+    if args.real_models:
+        from sentence_transformers import SentenceTransformer, CrossEncoder
+        encoder = SentenceTransformer('bkai-foundation-models/vietnamese-bi-encoder', device=args.device)
+        reranker = CrossEncoder('BAAI/bge-reranker-base', device=args.device)
+    else:
+        encoder = StubEncoder(latency_ms=args.encode_latency_ms)
+        reranker = StubReranker(latency_ms=args.rerank_latency_ms)
+
+    if args.index_path:
+        from qdrant_client import QdrantClient
+        store = QdrantClient(path=args.index_path)
+    else:
+        chunks = load_chunks(args.corpus, args.qa_file, args.max_chunks)
+        # Index with the query encoder's vector space, but without its simulated latency
+        index_encoder = encoder if args.real_models else StubEncoder(dim=encoder.dim)
+        store = StubVectorStore.from_chunks(chunks, index_encoder, latency_ms=args.search_latency_ms,
+                                            jitter_ms=args.search_jitter_ms)
+        print(f"Stand-in vector store holds {len(chunks)} chunks")
+
+    llm_url = args.llm_url
+    if not llm_url:
+        _, llm_url = start_stub_server(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms,
+                                       error_ratio=args.llm_error_ratio)
+    llm = OpenAI(base_url=llm_url, api_key=os.getenv("OPENAI_API_KEY") or "stub", max_retries=0)
+
+    pipeline = {
+        "encoder": encoder, "reranker": reranker, "store": store, "collection": args.collection,
+        "llm": llm, "model": args.model, "top_k": args.top_k, "rerank_top_k": args.rerank_top_k,
+        "device": args.device,
+    }
+    mode = f"open loop at {args.qps} qps" if args.qps else f"closed loop with {args.concurrency} in flight"
+    print(f"Running {mode} for up to {args.duration}s...")
+    recorder, elapsed, issued = run_load(questions, pipeline, args.qps, args.concurrency,
+                                         args.duration, args.requests)
+
+    finished = recorder.completed + recorder.failed
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "issued": issued,
+        "completed": recorder.completed,
+        "failed": recorder.failed,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_qps": round(recorder.completed / elapsed, 3) if elapsed else 0.0,
+        "error_rate": round(recorder.failed / finished, 4) if finished else 0.0,
+        "errors_per_stage": {
+            stage: {"count": count, "rate": round(count / finished, 4) if finished else 0.0}
+            for stage, count in recorder.errors.items()
+        },
+        "latency_ms": {stage: latency_summary(values) for stage, values in recorder.latencies.items() if values},
+    }
+    output = write_results(results, args.output, prefix="load")
+
+    print(f"\nCompleted {recorder.completed}/{issued} requests in {elapsed:.1f}s "
+          f"({results['throughput_qps']} qps, error rate {results['error_rate']:.2%})")
+    for stage, summary in results["latency_ms"].items():
+        errors = recorder.errors.get(stage, 0)
+        print(f"{stage:>7}: p50={summary['p50']:.1f}ms p95={summary['p95']:.1f}ms "
+              f"p99={summary['p99']:.1f}ms errors={errors}")
+    print(f"Results written to {output}")
@@ -1,17 +1,50 @@
+import argparse
 import os
+import sys
 from dotenv import load_dotenv
 from sentence_transformers import SentenceTransformer, CrossEncoder
 from qdrant_client import QdrantClient
 from openai import OpenAI # Using for OpenAI API
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.qdrant_collections import ServingTargets
+from common.query_router import route_query
+from common.llm_cache import AnswerCache, load_cache
+from common.llm_client import cached_chat_completion
+from common.metrics import RequestTrace, start_metrics_server
+from common.deadline import Deadline
+from common.inference_profile import apply_inference_profile, inference_device, load_inference_profile
+from common.locations import extract_locations
+from common.profiling import add_profile_arguments, profiled, start_profiling
+from common.projection import load_serving_projection
+from common.rerank_tokens import PretokenizedReranker, TokenStore
+from retrieval import build_filter, retrieve, retrieve_batch
+
 # Load environment variables
 load_dotenv()
 
+# Inference device: RAG_DEVICE, else the device the INFERENCE_PROFILE was tuned on, else cuda
+inference_profile = load_inference_profile()
+DEVICE = inference_device(inference_profile)
+
 # Initialize Vietnamese bi-encoder model for retrieval
-retrieval_model = SentenceTransformer('bkai-foundation-models/vietnamese-bi-encoder').to('cuda')
+retrieval_model = SentenceTransformer('bkai-foundation-models/vietnamese-bi-encoder', device=DEVICE)
 
 # Initialize cross-encoder model for reranking
-reranker_model = CrossEncoder('BAAI/bge-reranker-base').to('cuda')
+reranker_model = CrossEncoder('BAAI/bge-reranker-base', device=DEVICE)
+
+# Rerank from passage token IDs precomputed at ingestion (chunk_n_load.py --rerank-tokens)
+RERANK_TOKEN_STORE = os.getenv("RERANK_TOKEN_STORE")
+if RERANK_TOKEN_STORE:
+    reranker_model = PretokenizedReranker(reranker_model, TokenStore(RERANK_TOKEN_STORE))
+
+# Threads, replicas and batch sizes tuned by evaluation/autotune.py (INFERENCE_PROFILE), if any;
+# intra-op threads follow the reranker, which dominates CPU time per request
+retrieval_model = apply_inference_profile(retrieval_model, "embedding", inference_profile)
+reranker_model = apply_inference_profile(reranker_model, "reranking", inference_profile, set_threads=True)
+
+# Profile inference and the request path when RAG_PROFILE=1 (see common/profiling.py)
+start_profiling("answer_generator")
 
 # Initialize Qdrant client
 qdrant_client = QdrantClient(
@@ -19,6 +52,30 @@ qdrant_client = QdrantClient(
     api_key=os.getenv("QDRANT_API_KEY")
 )
 
+# Serving collection (QDRANT_COLLECTION, usually an alias managed by manage_collection.py) and the
+# local chunk store for slim payloads (CHUNK_STORE_PATH; "{collection}" selects a store per version),
+# or per-source shards (QDRANT_SHARDS, RAG_SHARD_QUOTAS) searched concurrently
+targets = ServingTargets.from_env(qdrant_client)
+SHARDS = targets.shards
+
+def resolve_collections(user_query: str, top_k: int, filters: dict = None) -> tuple:
+    """(collection name, shards, chunk store) for a query; see ServingTargets.resolve()"""
+    return targets.resolve(user_query, top_k, (filters or {}).get("sources"))
+
+# Collections loaded with --reduce-dim are searched through the same PCA projection (VECTOR_PROJECTION)
+projection = load_serving_projection()
+
+# Widen reranked hits to neighboring chunks or the whole article (RAG_EXPAND=neighbors|article)
+EXPAND_MODE = os.getenv("RAG_EXPAND") or None
+EXPAND_WINDOW = int(os.getenv("RAG_EXPAND_WINDOW", "1"))
+EXPAND_MAX_CHARS = int(os.getenv("RAG_EXPAND_MAX_CHARS", "3000"))
+
+# Diversify candidates before reranking: at most RAG_GROUP_SIZE chunks per article (0 disables), and
+# with RAG_MMR_LAMBDA an MMR pass keeping RAG_MMR_TOP_K of them (default: half of top_k)
+GROUP_SIZE = int(os.getenv("RAG_GROUP_SIZE", "0")) or None
+MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA")) if os.getenv("RAG_MMR_LAMBDA") else None
+MMR_TOP_K = int(os.getenv("RAG_MMR_TOP_K", "0")) or None
+
 
 # Initialize OpenAI client
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -38,7 +95,32 @@ else:
         print(f"Error initializing OpenAI client: {e}")
         openai_client = None
 
-def get_relevant_chunks(user_query: str, top_k: int = 20, rerank_top_k: int = 10) -> list:
+# Shared LLM response cache (LLM_CACHE_MODE=off|readwrite|replay; off by default so answers are not frozen)
+llm_cache = load_cache()
+
+# End-to-end latency budget per answer_question() call (RAG_BUDGET_MS, 0 disables). Stages shrink their
+# work to fit: fewer reranked candidates, less LLM context, and a cached or extractive answer as last resort
+BUDGET_MS = int(os.getenv("RAG_BUDGET_MS", "20000"))
+# Below MIN_LLM_SECONDS the LLM is not called; below REDUCED_LLM_SECONDS it gets half the context
+MIN_LLM_SECONDS = float(os.getenv("RAG_MIN_LLM_SECONDS", "1.5"))
+REDUCED_LLM_SECONDS = float(os.getenv("RAG_REDUCED_LLM_SECONDS", "6"))
+answer_cache = AnswerCache()
+
+# Restrict the search to provinces named in the question (RAG_QUERY_LOCATIONS=1)
+QUERY_LOCATIONS = os.getenv("RAG_QUERY_LOCATIONS", "0") == "1"
+
+def query_filter_for(user_query: str, filters: dict = None):
+    """
+    Qdrant filter from explicit filters (date_from, date_to, sources, locations;
+    see retrieval.build_filter) plus, with RAG_QUERY_LOCATIONS, the query's own locations.
+    """
+    filters = dict(filters or {})
+    if QUERY_LOCATIONS and not filters.get("locations"):
+        filters["locations"] = list(extract_locations(user_query))
+    return build_filter(**filters)
+
+def get_relevant_chunks(user_query: str, top_k: int = 20, rerank_top_k: int = 10, trace: RequestTrace = None,
+                        filters: dict = None, deadline: Deadline = None) -> list:
     """
     Encodes the user query and retrieves the top_k most relevant chunks
     from the Qdrant collection, then reranks them using a cross-encoder model.
@@ -47,81 +129,188 @@ def get_relevant_chunks(user_query: str, top_k: int = 20, rerank_top_k: int = 10
         user_query: The user's query
         top_k: Number of initial documents to retrieve from Qdrant (default: 20)
         rerank_top_k: Number of top documents to keep after reranking (default: 10)
+        trace: Optional RequestTrace receiving per-stage timings and candidate counts
+        filters: Optional dict with date_from, date_to, sources and/or locations,
+            applied inside the vector search
+        deadline: Optional Deadline bounding the search and sizing the rerank
     """
     if not retrieval_model or not reranker_model:
         print("Retrieval or reranking model not loaded. Cannot get relevant chunks.")
         return []
         
-    # First stage: Retrieve documents using bi-encoder
-    query_embedding = retrieval_model.encode(user_query, device='cuda')
-    search_results = qdrant_client.search(
-        collection_name="articles2",
-        query_vector=query_embedding.tolist(),
-        limit=top_k,
-        with_payload=True
+    timings = {}
+    collection_name, shards, chunk_store = resolve_collections(user_query, top_k, filters)
+    if SHARDS and not shards:
+        print(f"No shard serves sources {(filters or {}).get('sources')}; shards are {', '.join(SHARDS)}")
+        return []
+    reranked_documents = retrieve(
+        user_query,
+        retrieval_model,
+        reranker_model,
+        qdrant_client,
+        collection_name=collection_name,
+        top_k=top_k,
+        rerank_top_k=rerank_top_k,
+        device=DEVICE,
+        timings=timings,
+        chunk_store=chunk_store,
+        expand=EXPAND_MODE,
+        expand_window=EXPAND_WINDOW,
+        expand_max_chars=EXPAND_MAX_CHARS,
+        query_filter=query_filter_for(user_query, filters),
+        shards=shards,
+        projection=projection,
+        deadline=deadline,
+        group_size=GROUP_SIZE,
+        mmr_lambda=MMR_LAMBDA,
+        mmr_top_k=MMR_TOP_K
     )
+    if trace is not None:
+        trace.observe_retrieval(timings)
+        trace.observe_count("rerank", len(reranked_documents))
+    return reranked_documents
 
-    # Prepare documents for reranking
-    documents = []
-    for hit in search_results:
-        payload = hit.payload if hit.payload else {}
-        chunk_text = payload.get("text", "")
-        if chunk_text:
-            documents.append({
-                "text": chunk_text,
-                "title": payload.get("title", ""),
-                "url": payload.get("url", ""),
-                "initial_score": hit.score
-            })
-
-    if not documents:
-        return []
+def get_relevant_chunks_batch(user_queries: list, top_k: int = 20, rerank_top_k: int = 10,
+                              batch_size: int = 32, filters: list = None) -> list:
+    """
+    Batch version of get_relevant_chunks for evaluation and offline precomputation:
+    all queries are encoded together, searched in one search_batch request and
+    reranked in length-sorted batches. Returns one list of chunks per query.
+    `filters`, if given, holds one filters dict (or None) per query.
+    """
+    if not retrieval_model or not reranker_model:
+        print("Retrieval or reranking model not loaded. Cannot get relevant chunks.")
+        return [[] for _ in user_queries]
 
-    # Second stage: Rerank documents using cross-encoder
-    pairs = [(user_query, doc["text"]) for doc in documents]
-    rerank_scores = reranker_model.predict(pairs)
-    
-    # Combine rerank scores with documents
-    for doc, score in zip(documents, rerank_scores):
-        doc["rerank_score"] = float(score)
-    
-    # Sort by rerank score and take top_k
-    reranked_documents = sorted(documents, key=lambda x: x["rerank_score"], reverse=True)[:rerank_top_k]
-    
-    return reranked_documents
+    # Each query searches only the shards routed for it; stores are keyed by collection
+    if SHARDS:
+        collection_name, shards, chunk_store = None, [], {}
+        for query, query_filters in zip(user_queries, filters or [None] * len(user_queries)):
+            _, query_shards, query_stores = resolve_collections(query, top_k, query_filters)
+            shards.append(query_shards)
+            chunk_store.update(query_stores)
+        unserved = sum(1 for query_shards in shards if not query_shards)
+        if unserved:
+            print(f"No shard serves the requested sources of {unserved} queries; shards are {', '.join(SHARDS)}")
+        if unserved == len(user_queries):
+            return [[] for _ in user_queries]
+    else:
+        collection_name, shards, chunk_store = resolve_collections("", top_k)
+    return retrieve_batch(
+        user_queries,
+        retrieval_model,
+        reranker_model,
+        qdrant_client,
+        collection_name=collection_name,
+        top_k=top_k,
+        rerank_top_k=rerank_top_k,
+        device=DEVICE,
+        batch_size=batch_size,
+        chunk_store=chunk_store,
+        expand=EXPAND_MODE,
+        expand_window=EXPAND_WINDOW,
+        expand_max_chars=EXPAND_MAX_CHARS,
+        query_filters=[query_filter_for(query, query_filters)
+                       for query, query_filters in zip(user_queries, filters or [None] * len(user_queries))],
+        shards=shards,
+        projection=projection,
+        group_size=GROUP_SIZE,
+        mmr_lambda=MMR_LAMBDA,
+        mmr_top_k=MMR_TOP_K
+    )
 
-def generate_answer_with_openai(user_query: str, retrieved_chunks: list) -> str:
+def fallback_answer(user_query: str, retrieved_chunks: list, deadline: Deadline, reason: str) -> str:
+    """Answer without the LLM: a recent answer to the same question, else the top retrieved passages"""
+    cached = answer_cache.get(user_query)
+    if cached is not None:
+        deadline.degrade("llm", "cached_answer", reason)
+        return cached
+    deadline.degrade("llm", "extractive", reason)
+    passages = "\n\n".join(f"- {chunk['title']}: {chunk['text'][:400].strip()}" for chunk in retrieved_chunks[:3])
+    return f"Dưới đây là các thông tin liên quan nhất tìm được:\n\n{passages}"
+
+def generate_answer_with_openai(user_query: str, retrieved_chunks: list, trace: RequestTrace = None,
+                                deadline: Deadline = None) -> str:
     """
     Generates an answer using the OpenAI API based on the user query and retrieved chunks.
     Uses the model name defined by OPENAI_MODEL_NAME environment variable or defaults.
+    With a deadline, the API call is capped at the LLM's remaining budget; short
+    budgets get half the context and a shorter answer, and when there is no time
+    left (or the call times out) fallback_answer() is returned instead.
     """
-    if not openai_client:
+    replay = llm_cache is not None and llm_cache.mode == "replay"
+    if not openai_client and not replay:
         return "OpenAI client not initialized. Check OPENAI_API_KEY."
 
+    timeout, max_tokens = None, 500
+    if deadline is not None:
+        timeout = deadline.stage_budget("llm")
+        if timeout < MIN_LLM_SECONDS:
+            return fallback_answer(user_query, retrieved_chunks, deadline, f"{timeout:.2f}s left")
+        if timeout < REDUCED_LLM_SECONDS and len(retrieved_chunks) > 1:
+            deadline.degrade("llm", "reduced_context", f"{len(retrieved_chunks)} -> {len(retrieved_chunks) // 2} chunks")
+            retrieved_chunks = retrieved_chunks[:len(retrieved_chunks) // 2]
+            max_tokens = 250
+
     context = "\n\n---\n\n".join([chunk["text"] for chunk in retrieved_chunks])
     
     system_prompt = "Bạn là một trợ lý AI chuyên về du lịch. Hãy trả lời dựa trên ngữ cảnh."
     
     user_message_content = f"""Ngữ cảnh:{context} Câu hỏi: {user_query}"""
 
+    trace = trace if trace is not None else RequestTrace(user_query)
     try:
-        response = openai_client.chat.completions.create(
-            model=OPENAI_MODEL_NAME,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message_content},
-            ],
-            temperature=0.7, 
-            max_tokens=500   
-        )
-        answer = response.choices[0].message.content
-        return answer.strip()
+        with trace.stage("llm"), profiled("llm"):
+            response = cached_chat_completion(
+                openai_client,
+                model=OPENAI_MODEL_NAME,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_message_content},
+                ],
+                temperature=0.7, 
+                max_tokens=max_tokens,
+                cache=llm_cache,
+                timeout=timeout
+            )
+        trace.observe_llm_response(response, llm_cache)
+        answer = response.choices[0].message.content.strip()
+        answer_cache.put(user_query, answer)
+        return answer
     except Exception as e:
         print(f"Error calling OpenAI API with model {OPENAI_MODEL_NAME}: {e}")
+        if deadline is not None:
+            return fallback_answer(user_query, retrieved_chunks, deadline, type(e).__name__)
         return "Xin lỗi, đã có lỗi xảy ra khi cố gắng tạo câu trả lời."
 
+def answer_question(user_query: str, top_k: int = 20, rerank_top_k: int = 10, filters: dict = None) -> str:
+    """
+    Full RAG path for one question, recorded as a single RequestTrace
+    (metrics histograms and, if RAG_TRACE_LOG is set, one JSONL trace line)
+    and kept within RAG_BUDGET_MS.
+    """
+    trace = RequestTrace(user_query)
+    deadline = Deadline(BUDGET_MS / 1000, trace=trace) if BUDGET_MS > 0 else None
+    try:
+        relevant_chunks = get_relevant_chunks(user_query, top_k, rerank_top_k, trace=trace, filters=filters,
+                                              deadline=deadline)
+        if not relevant_chunks:
+            return "Xin lỗi, tôi không tìm thấy thông tin liên quan đến câu hỏi của bạn."
+        return generate_answer_with_openai(user_query, relevant_chunks, trace=trace, deadline=deadline)
+    finally:
+        trace.finish()
+
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Answer a sample question with the RAG pipeline")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    # Starts profiling with --profile, or sets the window of the RAG_PROFILE=1 session started at import
+    start_profiling("answer_generator", enabled=args.profile or None, seconds=args.profile_seconds)
+
+    # Expose /metrics when RAG_METRICS_PORT is set
+    start_metrics_server()
+
     sample_query = "Hà Nội có những địa điểm vui chơi giải trí nào?"
     
     print(f"Retrieving relevant chunks for query: '{sample_query}'")
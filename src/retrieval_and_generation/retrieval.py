@@ -0,0 +1,627 @@
+"""
+Two-stage retrieval (bi-encoder search, cross-encoder rerank) with explicit
+models and client, so the serving path and the benchmarks share one code path.
+"""
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import date, datetime, timedelta, timezone
+import numpy as np
+from qdrant_client.http import models
+from common.deadline import RERANK_COST
+from common.profiling import profiled
+from common.projection import FULL_VECTOR, REDUCED_VECTOR
+
+# Article times are Vietnam local time (see normalize.py)
+DEFAULT_TZ = timezone(timedelta(hours=7))
+
+# Shard fan-out searches are network bound; threads are only started when first used
+SHARD_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="shard-search")
+# Below this many affordable pairs, reranking is skipped rather than shrunk
+MIN_RERANK_CANDIDATES = 4
+# Payload field grouped on by grouped search (chunk_n_load.py writes it on every point)
+GROUP_BY = "article_id"
+
+
+def to_timestamp(value) -> int:
+    """Epoch seconds from an int, a date/datetime or an ISO string ("2025-05-10")"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=DEFAULT_TZ)
+    return int(value.timestamp())
+
+
+def build_filter(date_from=None, date_to=None, sources=None, locations=None):
+    """
+    Qdrant filter over the indexed payload fields, or None when nothing is set.
+    date_from/date_to bound the publication timestamp (inclusive; a bare date
+    for date_to covers that whole day), sources and locations match any of
+    the given values ("laodong", "traveloka"; province slugs from common/locations.py).
+    """
+    conditions = []
+    if date_from is not None or date_to is not None:
+        upper = None
+        if date_to is not None:
+            upper = to_timestamp(date_to)
+            whole_day = isinstance(date_to, str) and len(date_to) == 10 or \
+                isinstance(date_to, date) and not isinstance(date_to, datetime)
+            if whole_day:
+                upper += 24 * 3600 - 1
+        conditions.append(models.FieldCondition(
+            key="timestamp",
+            range=models.Range(gte=to_timestamp(date_from) if date_from is not None else None, lte=upper)
+        ))
+    if sources:
+        conditions.append(models.FieldCondition(key="source", match=models.MatchAny(any=list(sources))))
+    if locations:
+        conditions.append(models.FieldCondition(key="locations", match=models.MatchAny(any=list(locations))))
+    return models.Filter(must=conditions) if conditions else None
+
+
+def hit_embedding(hit):
+    """The full-dimension vector returned with a hit (named "full" on reduced collections), or None"""
+    if isinstance(hit.vector, dict):
+        return hit.vector.get(FULL_VECTOR)
+    return hit.vector
+
+
+def hits_to_documents(search_results, chunk_store=None, with_embeddings: bool = False) -> list:
+    """
+    Prepare search hits for reranking. With a chunk_store (common/chunk_store.py)
+    text and article metadata are looked up by point ID instead of read from the payload.
+    with_embeddings keeps each hit's vector as "embedding" for mmr_select().
+    """
+    documents = []
+    for hit in search_results:
+        if chunk_store is not None:
+            payload = chunk_store.get(hit.id)
+        else:
+            payload = hit.payload if hit.payload else {}
+        chunk_text = payload.get("text", "")
+        if chunk_text:
+            documents.append({
+                "id": hit.id,
+                "text": chunk_text,
+                "title": payload.get("title", ""),
+                "url": payload.get("url", ""),
+                "article_id": payload.get("article_id"),
+                "chunk_index": payload.get("chunk_index"),
+                "initial_score": hit.score
+            })
+            if with_embeddings:
+                documents[-1]["embedding"] = hit_embedding(hit)
+    return documents
+
+
+def rescore_hits(hits, query_embedding, top_k: int) -> list:
+    """
+    Re-rank reduced-vector hits by full-precision cosine similarity with the
+    "full" vectors returned alongside them, keeping the best top_k.
+    """
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / (np.linalg.norm(query) or 1.0)
+    for hit in hits:
+        full = hit_embedding(hit)
+        if full is not None:
+            full = np.asarray(full, dtype=np.float32)
+            hit.score = float(full @ query / (np.linalg.norm(full) or 1.0))
+    return sorted(hits, key=lambda hit: hit.score, reverse=True)[:top_k]
+
+
+def mmr_select(query_embedding, documents: list, k: int, diversity_lambda: float = 0.7) -> list:
+    """
+    Maximal marginal relevance: greedily pick k documents, each maximizing
+    lambda * sim(query, doc) - (1 - lambda) * max sim(doc, already picked),
+    using the "embedding" kept by hits_to_documents(with_embeddings=True).
+    Embeddings are dropped from the returned documents; if any is missing
+    the first k documents are kept as they are.
+    """
+    documents = [dict(doc) for doc in documents]
+    vectors = [doc.pop("embedding", None) for doc in documents]
+    if len(documents) <= k or any(vector is None for vector in vectors):
+        return documents[:k]
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1, norms)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    relevance = matrix @ (query / (np.linalg.norm(query) or 1.0))
+    redundancy = np.full(len(documents), -np.inf, dtype=np.float32)
+    picked = []
+    for _ in range(k):
+        scores = diversity_lambda * relevance - (1 - diversity_lambda) * np.maximum(redundancy, 0)
+        scores[picked] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        redundancy = np.maximum(redundancy, matrix @ matrix[best])
+    return [documents[i] for i in picked]
+
+
+def search_chunks(query_embedding, qdrant_client, collection_name: str, top_k: int, chunk_store=None,
+                  query_filter=None, projection=None, timeout: float = None, group_size: int = None,
+                  with_embeddings: bool = False) -> list:
+    """
+    First stage: nearest chunks for an already encoded query, optionally within
+    a build_filter() filter. With a projection (common/projection.py) the
+    reduced vectors are searched for top_k * projection.oversample candidates,
+    which are then rescored with their full vectors. `timeout` (seconds) is
+    passed to Qdrant, which only accepts whole seconds.
+    With group_size, Qdrant groups hits by article (search_groups on
+    GROUP_BY) and at most group_size chunks per article are returned, so one
+    long article cannot fill the candidate list with its overlapping chunks.
+    with_embeddings returns the full vectors for mmr_select().
+    """
+    kwargs = {"timeout": max(1, math.ceil(timeout))} if timeout is not None else {}
+    query_vector, limit, with_vectors = query_embedding.tolist(), top_k, with_embeddings
+    if projection is not None:
+        query_vector = models.NamedVector(name=REDUCED_VECTOR, vector=projection.transform(query_embedding).tolist())
+        limit, with_vectors = top_k * projection.oversample, [FULL_VECTOR]
+    if group_size:
+        groups = qdrant_client.search_groups(
+            collection_name=collection_name,
+            query_vector=query_vector,
+            group_by=GROUP_BY,
+            query_filter=query_filter,
+            # Up to `limit` articles; their best chunks are merged and cut back to `limit` below
+            limit=limit,
+            group_size=group_size,
+            with_payload=chunk_store is None,
+            with_vectors=with_vectors,
+            **kwargs
+        ).groups
+        hits = [hit for group in groups for hit in group.hits]
+        search_results = sorted(hits, key=lambda hit: hit.score, reverse=True)[:limit]
+    else:
+        search_results = qdrant_client.search(
+            collection_name=collection_name,
+            query_vector=query_vector,
+            query_filter=query_filter,
+            limit=limit,
+            # Slim collections only need IDs back when text comes from the local store
+            with_payload=chunk_store is None,
+            with_vectors=with_vectors,
+            **kwargs
+        )
+    if projection is not None:
+        search_results = rescore_hits(search_results, query_embedding, top_k)
+    return hits_to_documents(search_results, chunk_store, with_embeddings)
+
+
+def search_chunks_batch(query_embeddings, qdrant_client, collection_name: str, top_k: int, chunk_store=None,
+                        query_filters=None, projection=None, group_size: int = None,
+                        with_embeddings: bool = False) -> list:
+    """
+    First stage for many queries in a single search_batch round trip; query_filters is one filter per query.
+    Qdrant has no batched group search, so with group_size each query runs search_chunks() in turn.
+    """
+    query_filters = query_filters or [None] * len(query_embeddings)
+    if group_size:
+        return [search_chunks(embedding, qdrant_client, collection_name, top_k, chunk_store, query_filter,
+                              projection, group_size=group_size, with_embeddings=with_embeddings)
+                for embedding, query_filter in zip(query_embeddings, query_filters)]
+    if projection is not None:
+        vectors = [models.NamedVector(name=REDUCED_VECTOR, vector=reduced.tolist())
+                   for reduced in projection.transform(query_embeddings)]
+        limit, with_vector = top_k * projection.oversample, [FULL_VECTOR]
+    else:
+        vectors = [embedding.tolist() for embedding in query_embeddings]
+        limit, with_vector = top_k, with_embeddings
+    search_results = qdrant_client.search_batch(
+        collection_name=collection_name,
+        requests=[
+            models.SearchRequest(vector=vector, filter=query_filter, limit=limit,
+                                 with_payload=chunk_store is None, with_vector=with_vector)
+            for vector, query_filter in zip(vectors, query_filters)
+        ]
+    )
+    if projection is not None:
+        search_results = [rescore_hits(hits, embedding, top_k)
+                          for hits, embedding in zip(search_results, query_embeddings)]
+    return [hits_to_documents(hits, chunk_store, with_embeddings) for hits in search_results]
+
+
+def store_for(chunk_store, collection_name: str):
+    """The ChunkStore for a collection, when chunk_store maps shard collections to their stores"""
+    if isinstance(chunk_store, dict):
+        return chunk_store.get(collection_name)
+    return chunk_store
+
+
+def merge_shard_results(documents_per_shard: list, top_k: int) -> list:
+    """
+    Merge per-shard candidates by first-stage score. All shards are embedded
+    with the same bi-encoder, so cosine scores are directly comparable.
+    """
+    merged = [doc for documents in documents_per_shard for doc in documents]
+    return sorted(merged, key=lambda doc: doc["initial_score"], reverse=True)[:top_k]
+
+
+def _fan_out(search_one, shards: dict, timings: dict = None, deadline=None) -> list:
+    """
+    Run search_one(collection, quota) for every shard concurrently; a failing
+    shard is logged and skipped unless every shard fails. With a deadline,
+    shards still running when the search budget is spent are skipped too.
+    """
+    def timed(collection, quota):
+        start = time.perf_counter()
+        result = search_one(collection, quota)
+        return result, time.perf_counter() - start
+
+    futures = {collection: SHARD_POOL.submit(timed, collection, quota) for collection, quota in shards.items()}
+    wait_until = time.monotonic() + deadline.stage_budget("search") if deadline is not None else None
+    results, errors = [], []
+    for collection, future in futures.items():
+        try:
+            timeout = max(0.0, wait_until - time.monotonic()) if wait_until is not None else None
+            result, elapsed = future.result(timeout=timeout)
+        except FutureTimeout:
+            deadline.degrade("search", "shard_skipped", collection)
+            continue
+        except Exception as e:
+            print(f"Error searching shard {collection}: {e}")
+            errors.append(e)
+            continue
+        results.append(result)
+        if timings is not None:
+            timings[f"search_{collection}"] = elapsed
+    if errors and not results:
+        raise errors[0]
+    return results
+
+
+def search_shards(query_embedding, qdrant_client, shards: dict, top_k: int, chunk_store=None,
+                  query_filter=None, timings: dict = None, projection=None, deadline=None,
+                  group_size: int = None, with_embeddings: bool = False) -> list:
+    """
+    Fan one query out to several shard collections at once. `shards` maps
+    each collection to its quota (the most candidates it may contribute);
+    results are merged by score and cut to top_k. chunk_store may map
+    collections to their ChunkStores. Each document records its "shard".
+    """
+    def search_one(collection, quota):
+        documents = search_chunks(query_embedding, qdrant_client, collection, quota,
+                                  store_for(chunk_store, collection), query_filter, projection,
+                                  group_size=group_size, with_embeddings=with_embeddings)
+        for doc in documents:
+            doc["shard"] = collection
+        return documents
+
+    return merge_shard_results(_fan_out(search_one, shards, timings, deadline), top_k)
+
+
+def search_shards_batch(query_embeddings, qdrant_client, shards, top_k: int, chunk_store=None,
+                        query_filters=None, timings: dict = None, projection=None, group_size: int = None,
+                        with_embeddings: bool = False) -> list:
+    """
+    search_shards() for many queries: one search_batch request per shard, all shards concurrently.
+    `shards` is one {collection: quota} for every query, or a list with one per query (as routed
+    by the query router); each shard's request then covers only the queries routed to it, so
+    every query gets the same results as search_shards() with its own shards.
+    """
+    if isinstance(shards, dict):
+        shards = [shards] * len(query_embeddings)
+    query_filters = query_filters or [None] * len(query_embeddings)
+    # (query index, quota) of the queries routed to each shard
+    routed = {}
+    for i, query_shards in enumerate(shards):
+        for collection, quota in query_shards.items():
+            routed.setdefault(collection, []).append((i, quota))
+
+    def search_one(collection, queries):
+        # Quotas only differ when queries were routed with different top_k; fetch the largest and cut
+        documents_per_query = search_chunks_batch([query_embeddings[i] for i, _ in queries], qdrant_client,
+                                                  collection, max(quota for _, quota in queries),
+                                                  store_for(chunk_store, collection),
+                                                  [query_filters[i] for i, _ in queries], projection,
+                                                  group_size, with_embeddings)
+        results = {}
+        for (i, quota), documents in zip(queries, documents_per_query):
+            for doc in documents:
+                doc["shard"] = collection
+            results[i] = documents[:quota]
+        return results
+
+    per_shard = _fan_out(search_one, routed, timings)
+    return [
+        merge_shard_results([results[i] for results in per_shard if i in results], top_k)
+        for i in range(len(query_embeddings))
+    ]
+
+
+def rerank(user_query: str, documents: list, reranker_model, rerank_top_k: int) -> list:
+    """Second stage: score (query, chunk) pairs with the cross-encoder and keep the best"""
+    if not documents:
+        return []
+    pairs = [(user_query, doc["text"]) for doc in documents]
+    with profiled("rerank"):
+        rerank_scores = reranker_model.predict(pairs)
+
+    # Combine rerank scores with documents
+    for doc, score in zip(documents, rerank_scores):
+        doc["rerank_score"] = float(score)
+
+    # Sort by rerank score and take top_k
+    return sorted(documents, key=lambda x: x["rerank_score"], reverse=True)[:rerank_top_k]
+
+
+def rerank_within_budget(user_query: str, documents: list, reranker_model, rerank_top_k: int, deadline) -> tuple:
+    """
+    rerank() sized to the deadline's rerank budget using the learned per-pair
+    cost: the best-scoring first-stage candidates that fit are reranked, and
+    with too few affordable pairs the first-stage order is kept.
+    Returns (documents, number of pairs scored).
+    """
+    affordable = RERANK_COST.affordable(deadline.stage_budget("rerank"))
+    if affordable < min(MIN_RERANK_CANDIDATES, len(documents)):
+        deadline.degrade("rerank", "skipped", f"{len(documents)} candidates")
+        return documents[:rerank_top_k], 0
+    if affordable < len(documents):
+        deadline.degrade("rerank", "shrunk", f"{len(documents)} -> {affordable} candidates")
+        documents = documents[:affordable]
+    return rerank(user_query, documents, reranker_model, rerank_top_k), len(documents)
+
+
+def rerank_batch(user_queries: list, documents_per_query: list, reranker_model, rerank_top_k: int,
+                 batch_size: int = 32) -> list:
+    """
+    Rerank the candidates of many queries with one predict() call.
+    Pairs are sorted by length so each cross-encoder batch pads to a similar
+    length, then scores are mapped back; per-query ordering matches rerank().
+    """
+    pairs, owners = [], []
+    for query_index, (user_query, documents) in enumerate(zip(user_queries, documents_per_query)):
+        for doc in documents:
+            pairs.append((user_query, doc["text"]))
+            owners.append((query_index, doc))
+    if not pairs:
+        return [[] for _ in user_queries]
+
+    order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+    with profiled("rerank"):
+        sorted_scores = reranker_model.predict([pairs[i] for i in order], batch_size=batch_size)
+    for position, pair_index in enumerate(order):
+        owners[pair_index][1]["rerank_score"] = float(sorted_scores[position])
+
+    return [
+        sorted(documents, key=lambda x: x["rerank_score"], reverse=True)[:rerank_top_k]
+        for documents in documents_per_query
+    ]
+
+
+EXPAND_MODES = ("neighbors", "article")
+
+
+def merge_chunk_texts(chunks: list, max_overlap: int = 400) -> str:
+    """
+    Join (chunk_index, text) pairs in order. Adjacent chunks share the
+    splitter's overlap, which is dropped instead of repeated.
+    """
+    merged, previous_index = "", None
+    for chunk_index, text in chunks:
+        if previous_index is not None and chunk_index == previous_index + 1:
+            overlap = next((k for k in range(min(max_overlap, len(merged), len(text)), 0, -1)
+                            if merged.endswith(text[:k])), 0)
+            merged += text[overlap:] if overlap else " " + text
+        else:
+            merged += (" ... " if merged else "") + text
+        previous_index = chunk_index
+    return merged
+
+
+def pick_span(center: int, texts: dict, max_chars: int = None) -> list:
+    """
+    Chunk indexes to keep around `center`, growing outwards one chunk at a
+    time while the total stays under max_chars (the center is always kept).
+    """
+    span, total = [center], len(texts[center])
+    below = sorted((i for i in texts if i < center), reverse=True)
+    above = sorted(i for i in texts if i > center)
+    while below or above:
+        grown = False
+        for side in (above, below):
+            if side and (max_chars is None or total + len(texts[side[0]]) <= max_chars):
+                total += len(texts[side[0]])
+                span.append(side.pop(0))
+                grown = True
+        if not grown:
+            break
+    return sorted(span)
+
+
+def fetch_neighbor_chunks(doc: dict, window: int, chunk_store=None, qdrant_client=None, collection_name: str = None):
+    """
+    (article key, center chunk index, {chunk_index: text}) for the chunks
+    within `window` of a hit, from the local store or by scrolling Qdrant.
+    window=None means the whole article.
+    """
+    if chunk_store is not None:
+        first, end = chunk_store.article_range(doc["id"])
+        lo = first if window is None else max(first, doc["id"] - window)
+        hi = end if window is None else min(end, doc["id"] + window + 1)
+        return first, doc["id"] - first, {pid - first: chunk_store.text(pid) for pid in range(lo, hi)}
+
+    if doc.get("article_id") is None or doc.get("chunk_index") is None:
+        return None, None, {}
+    center = doc["chunk_index"]
+    conditions = [models.FieldCondition(key="article_id", match=models.MatchValue(value=doc["article_id"]))]
+    if window is not None:
+        conditions.append(models.FieldCondition(
+            key="chunk_index", range=models.Range(gte=center - window, lte=center + window)))
+    points, _ = qdrant_client.scroll(
+        collection_name=collection_name,
+        scroll_filter=models.Filter(must=conditions),
+        limit=2 * window + 1 if window is not None else 1000,
+        with_payload=["chunk_index", "text"],
+        with_vectors=False
+    )
+    texts = {point.payload["chunk_index"]: point.payload.get("text", "") for point in points}
+    texts.setdefault(center, doc["text"])
+    return doc["article_id"], center, texts
+
+
+def expand_documents(documents: list, mode: str = "neighbors", window: int = 1, max_chars: int = None,
+                     chunk_store=None, qdrant_client=None, collection_name: str = None) -> list:
+    """
+    Widen reranked hits to their neighboring chunks ("neighbors", +-window)
+    or their whole article ("article"), capped at max_chars per hit.
+    Hits whose chunk is already covered by a higher-ranked hit's span are
+    dropped, so the LLM never sees the same passage twice. The original chunk
+    stays in "chunk_text"; "text" becomes the merged passage.
+    """
+    if mode not in EXPAND_MODES:
+        raise ValueError(f"Unknown expansion mode: {mode}")
+    covered = {}
+    expanded = []
+    for doc in documents:
+        shard = doc.get("shard", collection_name)
+        key, center, texts = fetch_neighbor_chunks(doc, None if mode == "article" else window,
+                                                   store_for(chunk_store, shard), qdrant_client, shard)
+        key = (shard, key) if key is not None else None
+        if key is None:
+            expanded.append(doc)
+            continue
+        seen = covered.setdefault(key, set())
+        if center in seen:
+            continue
+        span = [i for i in pick_span(center, texts, max_chars) if i not in seen]
+        seen.update(span)
+        doc = dict(doc, chunk_text=doc["text"], expanded_chunks=span)
+        doc["text"] = merge_chunk_texts([(i, texts[i]) for i in span])
+        expanded.append(doc)
+    return expanded
+
+
+def retrieve(user_query: str, retrieval_model, reranker_model, qdrant_client, collection_name: str,
+             top_k: int = 20, rerank_top_k: int = 10, device: str = None, timings: dict = None,
+             chunk_store=None, expand: str = None, expand_window: int = 1, expand_max_chars: int = None,
+             query_filter=None, shards: dict = None, projection=None, deadline=None,
+             group_size: int = None, mmr_lambda: float = None, mmr_top_k: int = None, query_embedding=None,
+             with_embeddings: bool = False) -> list:
+    """
+    Encode, search and rerank one query. query_filter (see build_filter())
+    restricts the vector search itself, so only matching chunks are reranked.
+    With `shards` ({collection: quota}) the search fans out to those
+    collections instead of collection_name; see search_shards(). With a
+    projection the first stage searches reduced vectors and rescores them.
+    If `timings` is given it receives per-stage durations in seconds
+    (encode, search, rerank, expand; search_<collection> per shard) and the candidate count.
+    With `expand` ("neighbors" or "article") the final hits are widened by
+    expand_documents(). With a deadline (common/deadline.py) the search is
+    bounded and reranking shrinks or is skipped to stay within budget.
+    Candidates can be diversified before reranking: group_size caps chunks
+    per article in the search itself, and mmr_lambda keeps the mmr_top_k
+    (default: half of top_k, at least rerank_top_k) most relevant yet
+    mutually different candidates; see mmr_select().
+    A query_embedding already computed by the caller skips the encode stage,
+    and with_embeddings keeps each result's full vector as "embedding".
+    """
+    timings = timings if timings is not None else {}
+
+    if query_embedding is None:
+        start = time.perf_counter()
+        with profiled("encode"):
+            query_embedding = retrieval_model.encode(user_query, device=device)
+        timings["encode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with_embeddings = with_embeddings or mmr_lambda is not None
+    if shards:
+        documents = search_shards(query_embedding, qdrant_client, shards, top_k, chunk_store, query_filter, timings,
+                                  projection, deadline, group_size, with_embeddings)
+    else:
+        documents = search_chunks(query_embedding, qdrant_client, collection_name, top_k, chunk_store, query_filter,
+                                  projection, deadline.stage_budget("search") if deadline is not None else None,
+                                  group_size, with_embeddings)
+    timings["search"] = time.perf_counter() - start
+
+    if mmr_lambda is not None:
+        start = time.perf_counter()
+        documents = mmr_select(query_embedding, documents, mmr_top_k or max(rerank_top_k, top_k // 2), mmr_lambda)
+        timings["mmr"] = time.perf_counter() - start
+    timings["candidates"] = len(documents)
+
+    if reranker_model is None:
+        reranked_documents = documents[:rerank_top_k]
+    else:
+        start = time.perf_counter()
+        if deadline is not None:
+            reranked_documents, scored = rerank_within_budget(user_query, documents, reranker_model, rerank_top_k,
+                                                              deadline)
+        else:
+            reranked_documents, scored = rerank(user_query, documents, reranker_model, rerank_top_k), len(documents)
+        timings["rerank"] = time.perf_counter() - start
+        # Per-pair cost over the pairs actually scored (fewer than the candidates when the budget shrank them)
+        RERANK_COST.observe(timings["rerank"], scored)
+
+    if expand and deadline is not None and deadline.expired():
+        deadline.degrade("expand", "skipped")
+    elif expand:
+        start = time.perf_counter()
+        reranked_documents = expand_documents(reranked_documents, expand, expand_window, expand_max_chars,
+                                              chunk_store, qdrant_client, collection_name)
+        timings["expand"] = time.perf_counter() - start
+    return reranked_documents
+
+
+def retrieve_batch(user_queries: list, retrieval_model, reranker_model, qdrant_client, collection_name: str,
+                   top_k: int = 20, rerank_top_k: int = 10, device: str = None, batch_size: int = 32,
+                   timings: dict = None, chunk_store=None, expand: str = None, expand_window: int = 1,
+                   expand_max_chars: int = None, query_filters=None, shards=None,
+                   projection=None, group_size: int = None, mmr_lambda: float = None,
+                   mmr_top_k: int = None) -> list:
+    """
+    Batched retrieve(): one encode pass, one search_batch request and one
+    length-sorted rerank for all queries. Returns one result list per query.
+    `shards` is one {collection: quota} for all queries or a list with one per
+    query; see search_shards_batch().
+    `timings`, when given, receives per-stage durations for the whole batch.
+    """
+    timings = timings if timings is not None else {}
+    if not user_queries:
+        return []
+
+    start = time.perf_counter()
+    with profiled("encode"):
+        query_embeddings = retrieval_model.encode(user_queries, device=device, batch_size=batch_size)
+    timings["encode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with_embeddings = mmr_lambda is not None
+    if shards:
+        documents_per_query = search_shards_batch(query_embeddings, qdrant_client, shards, top_k, chunk_store,
+                                                  query_filters, timings, projection, group_size, with_embeddings)
+    else:
+        documents_per_query = search_chunks_batch(query_embeddings, qdrant_client, collection_name, top_k,
+                                                  chunk_store, query_filters, projection, group_size,
+                                                  with_embeddings)
+    timings["search"] = time.perf_counter() - start
+
+    if with_embeddings:
+        start = time.perf_counter()
+        documents_per_query = [
+            mmr_select(embedding, documents, mmr_top_k or max(rerank_top_k, top_k // 2), mmr_lambda)
+            for embedding, documents in zip(query_embeddings, documents_per_query)
+        ]
+        timings["mmr"] = time.perf_counter() - start
+    timings["candidates"] = sum(len(documents) for documents in documents_per_query)
+
+    if reranker_model is None:
+        results = [documents[:rerank_top_k] for documents in documents_per_query]
+    else:
+        start = time.perf_counter()
+        results = rerank_batch(user_queries, documents_per_query, reranker_model, rerank_top_k, batch_size)
+        timings["rerank"] = time.perf_counter() - start
+
+    if expand:
+        start = time.perf_counter()
+        results = [
+            expand_documents(documents, expand, expand_window, expand_max_chars,
+                             chunk_store, qdrant_client, collection_name)
+            for documents in results
+        ]
+        timings["expand"] = time.perf_counter() - start
+    return results